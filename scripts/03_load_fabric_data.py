@@ -14,6 +14,13 @@ What this script does:
     1. Reads fabric_ids.json from data folder
     2. Uploads CSV files to Lakehouse Files folder
     3. Loads CSV files as Delta tables using Fabric API
+
+If ontology_config.json has a "metrics" section, the metric aggregate tables
+(agg_<table>, see semantic_metrics.py) are computed from the CSVs and loaded
+next to the base tables.
+
+The categorical value index (value_index.py) is rebuilt for the new data, so
+the lookup_values tool and the schema prompt see the loaded values.
 """
 
 import argparse
@@ -96,6 +103,29 @@ print(f"Workspace: {WORKSPACE_ID}")
 print(f"Lakehouse: {LAKEHOUSE_NAME}")
 print(f"Tables: {', '.join(ontology_config['tables'].keys())}")
 
+# ============================================================================
+# Metric Aggregates (ontology_config.json "metrics")
+# ============================================================================
+
+from semantic_metrics import MetricLayer, MetricError
+
+# (table name, CSV path) of everything loaded below
+load_files = [(table_name, os.path.join(tables_dir, f"{table_name}.csv"))
+              for table_name in ontology_config["tables"].keys()]
+
+metric_layer = None
+metric_manifest = None
+try:
+    metric_layer = MetricLayer(ontology_config, tables_dir)
+except MetricError as e:
+    print(f"WARNING: Skipping metric aggregates - invalid metrics section: {e}")
+if metric_layer and metric_layer.enabled:
+    metric_manifest = metric_layer.build_aggregates()
+    load_files += metric_layer.aggregate_files(metric_manifest)
+    for name, entry in metric_manifest["tables"].items():
+        print(f"Aggregate: {name} ({entry['rows']} rows from {entry['source_rows']}, "
+              f"by {', '.join(entry['dimensions']) or 'nothing'})")
+
 # ============================================================================
 # Authentication
 # ============================================================================
@@ -166,9 +196,8 @@ data_path = f"{LAKEHOUSE_NAME}.Lakehouse/Files"
 directory_client = file_system_client.get_directory_client(data_path)
 
 uploaded_files = []
-for table_name in ontology_config["tables"].keys():
+for table_name, csv_path in load_files:
     csv_file = f"{table_name}.csv"
-    csv_path = os.path.join(tables_dir, csv_file)
     
     if not os.path.exists(csv_path):
         print(f"  [FAIL] CSV not found: {csv_file}")
@@ -202,8 +231,11 @@ else:
     
     tables_url = f"{FABRIC_API}/workspaces/{WORKSPACE_ID}/lakehouses/{LAKEHOUSE_ID}/tables"
     
-    for table_name in ontology_config["tables"].keys():
+    loaded_tables = []
+    for table_name, _ in load_files:
         csv_file = f"{table_name}.csv"
+        if csv_file not in uploaded_files:
+            continue
         print(f"  Loading {csv_file} as table '{table_name}'...")
         
         load_table_url = f"{tables_url}/{table_name}/load"
@@ -222,9 +254,11 @@ else:
         
         if resp.status_code == 200:
             print(f"  [OK] Table '{table_name}' loaded successfully")
+            loaded_tables.append(table_name)
         elif resp.status_code == 202:
             operation_url = resp.headers.get("Location")
-            wait_for_lro(operation_url, f"Table '{table_name}' loading")
+            if wait_for_lro(operation_url, f"Table '{table_name}' loading"):
+                loaded_tables.append(table_name)
         else:
             print(f"  ⚠ Table loading returned status: {resp.status_code}")
             print(f"    Response: {resp.text}")
@@ -232,6 +266,24 @@ else:
     # Wait for tables to be indexed
     print("  Waiting for tables to be indexed...")
     time.sleep(30)
+    
+    # 08's get_metric only uses the aggregates that made it into the lakehouse
+    if metric_manifest:
+        metric_layer.mark_loaded(metric_manifest, [name for name in loaded_tables
+                                                   if name in metric_manifest["tables"]])
+
+# Cached agent answers were computed from the old data
+from answer_cache import invalidate
+invalidate(data_dir, "tables")
+
+# Categorical values for entity linking, keyed to the new data version
+from value_index import load_value_index
+value_columns = load_value_index(data_dir, {
+    table_name: {"columns": [{"name": col, "type": table_def.get("types", {}).get(col, "String")}
+                             for col in table_def["columns"]]}
+    for table_name, table_def in ontology_config["tables"].items()})
+print(f"Value index: {sum(len(values) for values in value_columns.values())} values "
+      f"in {len(value_columns)} columns")
 
 # ============================================================================
 # Summary
@@ -242,7 +294,7 @@ print("Data Load Complete!")
 print(f"{'='*60}")
 print(f"""
 Uploaded {len(uploaded_files)} files: {', '.join(uploaded_files)}
-Tables loaded: {', '.join(ontology_config['tables'].keys())}
+Tables loaded: {', '.join(name for name, _ in load_files)}
 
 Next step - Generate schema prompt:
   python scripts/04_generate_agent_prompt.py
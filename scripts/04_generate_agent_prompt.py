@@ -22,6 +22,9 @@ import json
 from load_env import load_all_env
 load_all_env()
 
+from join_graph import JoinGraph, column_stats
+from value_index import ValueIndex, load_value_index
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -222,7 +225,7 @@ elif args.from_fabric:
 # Generate Optimized Prompt
 # ============================================================================
 
-def build_optimized_prompt(schema):
+def build_optimized_prompt(schema, join_graph=None, value_index=None):
     """Build token-efficient schema prompt"""
     lines = []
     lines.append("=== DATABASE SCHEMA ===")
@@ -245,12 +248,15 @@ def build_optimized_prompt(schema):
         
         lines.append(f"{table_name}({', '.join(cols)})")
     
-    # Relationships
-    if schema.get("relationships"):
+    # Relationships, with shortest paths for tables not joined directly
+    if join_graph and join_graph.edges:
+        lines.append("")
+        lines.extend(join_graph.prompt_lines())
+    
+    # Every value of the small categorical columns, so filters need no lookup
+    if value_index and value_index.prompt_lines():
         lines.append("")
-        lines.append("JOINS:")
-        for rel in schema["relationships"]:
-            lines.append(f"  {rel['from']}.{rel['fromKey']} -> {rel['to']}.{rel['toKey']}")
+        lines.extend(value_index.prompt_lines())
     
     # SQL hints
     lines.append("")
@@ -261,7 +267,12 @@ def build_optimized_prompt(schema):
     
     return "\n".join(lines)
 
-prompt_text = build_optimized_prompt(schema_data)
+# Cardinality hints and categorical values come from the table CSVs when they are local
+tables_dir = os.path.join(data_dir, "tables")
+join_stats = column_stats(data_dir, schema_data["tables"]) if os.path.isdir(tables_dir) else None
+join_graph = JoinGraph(schema_data["tables"], schema_data["relationships"], join_stats)
+value_index = ValueIndex(load_value_index(data_dir, schema_data["tables"])) if os.path.isdir(tables_dir) else None
+prompt_text = build_optimized_prompt(schema_data, join_graph, value_index)
 
 # Save prompt
 prompt_path = os.path.join(config_dir, "schema_prompt.txt")
@@ -288,6 +299,7 @@ Files saved:
   - {schema_path} (full schema JSON)
 
 Token estimate: ~{len(prompt_text.split())} tokens
+Join graph: {join_graph.summary()}
 
 Next steps:
   - Run 05_create_fabric_agent.py to create Foundry agent with Fabric Data Agent tool
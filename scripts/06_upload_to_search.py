@@ -373,6 +373,10 @@ def main():
         json.dump(search_info, f, indent=2)
     print(f"[OK] Search info saved to: {search_ids_path}")
     
+    # Cached agent answers were computed from the old index contents
+    from answer_cache import invalidate
+    invalidate(data_dir, "search")
+    
     print(f"\n{'='*60}")
     print("Upload Complete!")
     print(f"{'='*60}")
@@ -5,6 +5,10 @@ Creates an AI Foundry agent that can query both structured data (SQL) and unstru
 Usage:
     python 07_create_foundry_agent.py              # Full mode (SQL + Search)
     python 07_create_foundry_agent.py --foundry-only  # Search only (no Fabric)
+    python 07_create_foundry_agent.py --result-workspace  # + query_previous_result tool
+    python 07_create_foundry_agent.py --describe-tables   # + describe_tables tool
+    python 07_create_foundry_agent.py --metric-tool       # + get_metric tool (ontology metrics)
+    python 07_create_foundry_agent.py --value-lookup      # + lookup_values tool (categorical values)
 
 Prerequisites:
     - Run 01_generate_sample_data.py (creates data and ontology_config.json)
@@ -15,6 +19,9 @@ Prerequisites:
 
 The agent has function tools:
     Full mode: execute_sql + search_documents
+               (+ query_previous_result / describe_tables / get_metric / lookup_values
+                with --result-workspace / --describe-tables / --metric-tool /
+                --value-lookup)
     Foundry-only: search_documents only
 """
 
@@ -27,9 +34,21 @@ import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument("--foundry-only", action="store_true",
                     help="Create agent with AI Search only (no Fabric/SQL)")
+parser.add_argument("--result-workspace", action="store_true",
+                    help="Add the query_previous_result tool for follow-ups on earlier SQL results")
+parser.add_argument("--describe-tables", action="store_true",
+                    help="Add the describe_tables tool (schema and column statistics served locally by 08)")
+parser.add_argument("--metric-tool", action="store_true",
+                    help="Add the get_metric tool for the metrics defined in ontology_config.json")
+parser.add_argument("--value-lookup", action="store_true",
+                    help="Add the lookup_values tool (categorical column values served locally by 08)")
 args = parser.parse_args()
 
 FOUNDRY_ONLY = args.foundry_only
+RESULT_WORKSPACE = args.result_workspace and not FOUNDRY_ONLY
+DESCRIBE_TABLES = args.describe_tables and not FOUNDRY_ONLY
+METRIC_TOOL = args.metric_tool and not FOUNDRY_ONLY
+VALUE_LOOKUP = args.value_lookup and not FOUNDRY_ONLY
 
 # Get script directory for relative paths
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -42,6 +61,8 @@ from azure.identity import DefaultAzureCredential
 from azure.ai.projects import AIProjectClient
 from azure.ai.projects.models import PromptAgentDefinition, FunctionTool
 
+from join_graph import JoinGraph
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -95,6 +116,19 @@ scenario_name = ontology_config.get("name", "Business Data")
 scenario_desc = ontology_config.get("description", "")
 tables = list(ontology_config.get("tables", {}).keys())
 
+# Named metrics for the get_metric tool (--metric-tool)
+metric_layer = None
+if METRIC_TOOL:
+    from semantic_metrics import MetricLayer, MetricError
+    try:
+        metric_layer = MetricLayer(ontology_config)
+    except MetricError as e:
+        print(f"ERROR: Invalid metrics section in ontology_config.json: {e}")
+        sys.exit(1)
+    if not metric_layer.enabled:
+        print("WARNING: No metrics in ontology_config.json - get_metric tool not added")
+        metric_layer = None
+
 # Load schema prompt (generated by 04_generate_agent_prompt.py)
 prompt_path = os.path.join(config_dir, "schema_prompt.txt")
 if os.path.exists(prompt_path):
@@ -150,7 +184,35 @@ print(f"Search Index: {INDEX_NAME}")
 # Build Agent Instructions
 # ============================================================================
 
-def build_agent_instructions(config, schema_text, foundry_only=False):
+# Optional tools answered locally by 08: name -> (instructions, summary line)
+EXTRA_TOOL_GUIDES = {
+    "describe_tables": ("""Returns tables, columns, types, keys, joins and column statistics (value ranges,
+distinct counts, the values of categorical columns) from local metadata - instantly.
+- Use it when unsure about a table, column or value instead of INFORMATION_SCHEMA or
+  SELECT TOP 1 * probe queries""",
+                        "Schema, joins and column statistics (local metadata)"),
+    "query_previous_result": ("""Every execute_sql result is saved for this conversation with an id (r1, r2, ...) shown under it.
+- For follow-ups that filter, group, count, sum or re-sort rows you ALREADY fetched, use
+  query_previous_result instead of a new SQL query - it is much faster
+- Pass result_id (or null for the latest result), then filters / group_by / aggregates / order_by
+- If the follow-up needs columns or rows the saved result does not have, use execute_sql""",
+                              "Refine earlier SQL results locally (08 result workspace)"),
+    "lookup_values": ("""Finds the column and exact spelling of values the user names (codes, categories, names)
+from a local index of the categorical columns - instantly.
+- Use it before filtering on a value that is not listed under VALUES in the schema, instead of
+  SELECT DISTINCT or LIKE '%...%' queries
+- Pass the values as written; case, punctuation and small typos are tolerated""",
+                      "Resolve named values to columns (local value index)"),
+    "get_metric": ("""Computes a named metric from small pre-aggregated tables - much faster than SQL.
+- For counts, totals, averages, minima or maxima that match a metric below, use get_metric
+  instead of writing SQL; group_by and filters take the metric's dimensions
+- Use execute_sql for anything the metrics do not cover (other columns, row lists, ratios)
+Metrics:
+{catalog}""",
+                   "Named metrics on pre-aggregated tables"),
+}
+
+def build_agent_instructions(config, schema_text, foundry_only=False, extra_tools=()):
     """Build agent instructions based on mode"""
     scenario_name = config.get("name", "Business Data")
     scenario_desc = config.get("description", "")
@@ -185,20 +247,21 @@ Use this to search PDF documents indexed in Azure AI Search.
     # Full multi-tool instructions
     table_names = list(tables_config.keys())
     
-    # Build relationship descriptions for JOINs
-    join_hints = []
-    for rel in relationships:
-        from_table = rel.get("from")
-        to_table = rel.get("to")
-        from_key = rel.get("fromKey")
-        to_key = rel.get("toKey")
-        join_hints.append(f"{from_table}.{from_key} = {to_table}.{to_key}")
+    # JOIN conditions with cardinality; multi-hop paths are listed in the schema prompt
+    join_hint = JoinGraph(tables_config, relationships).join_hint()
+    
+    catalog = metric_layer.catalog() if metric_layer else ""
+    extra_sections = "".join(f"\n\n## Tool {number}: {name}\n{EXTRA_TOOL_GUIDES[name][0].format(catalog=catalog)}"
+                             for number, name in enumerate(extra_tools, 3))
+    tool_count = ["TWO", "THREE", "FOUR", "FIVE", "SIX"][len(extra_tools)]
+    value_step = ("\n- A code, category or name in the question → lookup_values first (unless listed under VALUES)"
+                  if "lookup_values" in extra_tools else "")
     
     return f"""You are a helpful data analyst assistant that answers questions about {scenario_name}.
 
 {scenario_desc}
 
-You have access to TWO tools:
+You have access to {tool_count} tools:
 
 ## Tool 1: execute_sql
 Use this for STRUCTURED DATA queries - numbers, counts, aggregations, specific records.
@@ -211,11 +274,11 @@ Use this for STRUCTURED DATA queries - numbers, counts, aggregations, specific r
 Use this for UNSTRUCTURED DATA queries - policies, guidelines, procedures, descriptions.
 - Search PDF documents indexed in AI Search
 - Good for: "What is the return policy?", "How does shipping work?", "What are the loyalty benefits?"
-- Returns relevant text passages from documents
+- Returns relevant text passages from documents{extra_sections}
 
 ## Decision Guide:
-- Numbers/counts/aggregations → execute_sql
-- "How many...", "Total...", "Average...", "List all..." → execute_sql  
+- Numbers/counts/aggregations → {'get_metric if a metric matches, else ' if metric_layer else ''}execute_sql
+- "How many...", "Total...", "Average...", "List all..." → execute_sql  {value_step}
 - Policies/procedures/guidelines → search_documents
 - "What is the policy for...", "How do I...", "Explain..." → search_documents
 - Complex questions may need BOTH tools - use them sequentially
@@ -225,7 +288,7 @@ Use this for UNSTRUCTURED DATA queries - policies, guidelines, procedures, descr
 - Do NOT use schema prefixes (no dbo.) - just use table names directly
 - Use proper aggregation functions: COUNT, SUM, AVG, MIN, MAX
 - Always use GROUP BY when using aggregation with non-aggregated columns
-- For JOINs use: {'; '.join(join_hints) if join_hints else 'check schema for foreign keys'}
+- For JOINs use: {join_hint or 'check schema for foreign keys'}
 - Use TOP N instead of LIMIT for row limiting
 
 ## Response Format:
@@ -235,7 +298,11 @@ Use this for UNSTRUCTURED DATA queries - policies, guidelines, procedures, descr
 
 Be concise and accurate. If a query fails, explain the issue and try a different approach."""
 
-instructions = build_agent_instructions(ontology_config, schema_prompt, FOUNDRY_ONLY)
+extra_tools = [name for name, enabled in (("get_metric", metric_layer is not None),
+                                           ("describe_tables", DESCRIBE_TABLES),
+                                           ("lookup_values", VALUE_LOOKUP),
+                                           ("query_previous_result", RESULT_WORKSPACE)) if enabled]
+instructions = build_agent_instructions(ontology_config, schema_prompt, FOUNDRY_ONLY, extra_tools)
 print(f"\nBuilt instructions ({len(instructions)} chars)")
 
 # ============================================================================
@@ -284,6 +351,49 @@ if not FOUNDRY_ONLY:
     )
     agent_tools.insert(0, execute_sql_tool)  # SQL first in full mode
 
+# Schema and column statistics, answered locally by 08 (--describe-tables)
+if DESCRIBE_TABLES:
+    from schema_metadata import DESCRIBE_TABLES_PARAMETERS, DESCRIBE_TABLES_DESCRIPTION
+    describe_tables_tool = FunctionTool(
+        name="describe_tables",
+        description=DESCRIBE_TABLES_DESCRIPTION,
+        parameters=DESCRIBE_TABLES_PARAMETERS,
+        strict=True
+    )
+    agent_tools.append(describe_tables_tool)
+
+# Categorical values, looked up locally by 08 (--value-lookup)
+if VALUE_LOOKUP:
+    from value_index import LOOKUP_VALUES_PARAMETERS, LOOKUP_VALUES_DESCRIPTION
+    lookup_values_tool = FunctionTool(
+        name="lookup_values",
+        description=LOOKUP_VALUES_DESCRIPTION,
+        parameters=LOOKUP_VALUES_PARAMETERS,
+        strict=True
+    )
+    agent_tools.append(lookup_values_tool)
+
+# Named metrics, compiled to SQL on the aggregate tables by 08 (--metric-tool)
+if metric_layer:
+    get_metric_tool = FunctionTool(
+        name="get_metric",
+        description=metric_layer.tool_description(),
+        parameters=metric_layer.tool_parameters(),
+        strict=True
+    )
+    agent_tools.append(get_metric_tool)
+
+# Follow-ups on earlier SQL results, answered locally by 08 (--result-workspace)
+if RESULT_WORKSPACE:
+    from result_workspace import QUERY_PREVIOUS_RESULT_PARAMETERS, QUERY_PREVIOUS_RESULT_DESCRIPTION
+    query_previous_result_tool = FunctionTool(
+        name="query_previous_result",
+        description=QUERY_PREVIOUS_RESULT_DESCRIPTION,
+        parameters=QUERY_PREVIOUS_RESULT_PARAMETERS,
+        strict=True
+    )
+    agent_tools.append(query_previous_result_tool)
+
 # ============================================================================
 # Create the Agent
 # ============================================================================
@@ -316,6 +426,8 @@ try:
 
         # Create agent definition
         tool_desc = "Search only" if FOUNDRY_ONLY else "SQL + AI Search"
+        if extra_tools:
+            tool_desc += " + " + " + ".join(extra_tools)
         print(f"\nCreating agent with {tool_desc} tools...")
         agent_definition = PromptAgentDefinition(
             model=MODEL,
@@ -357,6 +469,10 @@ else:
 
 agent_ids["endpoint"] = ENDPOINT
 agent_ids["search_index"] = INDEX_NAME
+# 08 --warm-start reuses its cached agent definition only for this definition
+from warm_start import agent_version, definition_hash
+agent_ids["agent_version"] = agent_version(agent)
+agent_ids["agent_definition"] = definition_hash(agent)
 
 with open(agent_ids_path, "w") as f:
     json.dump(agent_ids, f, indent=2)
@@ -392,6 +508,8 @@ Next step:
   python scripts/08_test_foundry_agent.py --foundry-only
 """)
 else:
+    extra_tool_lines = "".join(f"\n  {number}. {name} - {EXTRA_TOOL_GUIDES[name][1]}"
+                               for number, name in enumerate(extra_tools, 3))
     print(f"""
 {'='*60}
 Multi-Tool AI Foundry Agent Created Successfully!
@@ -404,7 +522,7 @@ Scenario: {scenario_name}
 
 Tools:
   1. execute_sql - Query structured data (Fabric Lakehouse)
-  2. search_documents - Search unstructured data (AI Search)
+  2. search_documents - Search unstructured data (AI Search){extra_tool_lines}
 
 Sample questions that use BOTH tools:
   - "What's the total value of orders that qualify for free shipping based on our policy?"
@@ -5,38 +5,238 @@ Interactive chat with the Foundry Agent.
 Usage:
     python 08_test_foundry_agent.py               # Full mode (SQL + Search)
     python 08_test_foundry_agent.py --foundry-only  # Search only (no Fabric)
+    python 08_test_foundry_agent.py --tool-workers 8  # More parallel tool calls per turn
+    python 08_test_foundry_agent.py --stream        # Stream answers token by token
+    python 08_test_foundry_agent.py --offline-sql   # SQL against local CSVs (no Fabric)
+    python 08_test_foundry_agent.py --eval --eval-concurrency 4  # Batch latency evaluation
+    python 08_test_foundry_agent.py --trace traces.jsonl  # Per-turn spans (OTLP JSON)
+    python 08_test_foundry_agent.py --record cassettes/run.json  # Record LLM + tool calls
+    python 08_test_foundry_agent.py --replay cassettes/run.json  # Replay them offline
+    python 08_test_foundry_agent.py --emulator --load-test 20  # Load test on a local emulator
+    python 08_test_foundry_agent.py --prefetch-search  # Search the question while the LLM plans
+    python 08_test_foundry_agent.py --answer-cache-ttl 3600  # Reuse answers to repeated questions
+    python 08_test_foundry_agent.py --sql-format csv --search-format compact  # Fewer prompt tokens
+    python 08_test_foundry_agent.py --compact-threshold 12000  # Compact long sessions' context
+    python 08_test_foundry_agent.py --sql-summarize-over 200  # Profile + sample for large results
+    python 08_test_foundry_agent.py --no-sql-validation  # Skip the local schema check of agent SQL
+    python 08_test_foundry_agent.py --no-metadata-fast-path  # Send schema probes to the endpoint
+    python 08_test_foundry_agent.py --turn-deadline 30 --max-tool-rounds 6  # Latency SLO per turn
+    python 08_test_foundry_agent.py --hedge-search  # Second search request when the first is slow
+    python 08_test_foundry_agent.py --no-circuit-breaker  # Always call SQL/search, even when failing
+    python 08_test_foundry_agent.py --planner-model gpt-4o-mini  # Small model picks tools, agent model answers
+    python 08_test_foundry_agent.py --eval --planner-model gpt-4o-mini --eval-baseline eval/single.jsonl
+    python 08_test_foundry_agent.py --warm-start  # Cached agent/endpoint, background init
+    python 08_test_foundry_agent.py --inline-agent  # Send instructions + tools instead of an agent reference
+    python 08_test_foundry_agent.py --emulator --emulator-metric-tool --eval  # get_metric on aggregates
+    python 08_test_foundry_agent.py --emulator --emulator-value-lookup --eval  # lookup_values for named values
+    python 08_test_foundry_agent.py --workspace-max-mb 128  # Cap on kept results (query_previous_result)
 
 Type 'quit' or 'exit' to end the conversation.
 
 This script handles function tools:
     Full mode: execute_sql + search_documents
+               (+ query_previous_result / describe_tables / get_metric / lookup_values
+                if the agent was created with --result-workspace / --describe-tables /
+                --metric-tool / --value-lookup)
     Foundry-only: search_documents only
 """
 
 import os
 import sys
 import json
+import time
+import math
 import struct
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+PROCESS_START = time.perf_counter()  # Time-to-first-answer is measured from here
+
+from sql_utils import run_bounded_query, is_endpoint_failure, ConnectionPool
+from tool_formats import SQL_FORMATS, SEARCH_FORMATS, format_search_results
+from agent_eval import (new_turn_metrics, record_llm_call, record_tool_call, record_route,
+                        load_sample_questions)
+from tracing import enable_tracing, span, run_in_context, print_trace_summary
+from turn_budget import TurnBudget, current_turn, time_left, PARTIAL_NOTE
+from circuit_breaker import get_breaker, breaker_summary, CircuitOpen, Hedger
+from agent_request import AgentRequest, reference_version
+from warm_start import agent_definition, UNREADABLE_DEFINITION
+from agent_loop import (ToolRounds, ToolHandlers, has_tool, parse_arguments, function_call_output,
+                        metadata_answer, keep_result, workspace_scope, load_metric_layer, run_metric)
 
 # Parse arguments first
 parser = argparse.ArgumentParser()
 parser.add_argument("--agent-id", default=os.getenv("FOUNDRY_AGENT_ID"))
 parser.add_argument("--foundry-only", action="store_true",
                     help="Search-only mode (no Fabric/SQL)")
+parser.add_argument("--tool-workers", type=int, default=4,
+                    help="Max function calls executed concurrently per turn (default: 4)")
+parser.add_argument("--turn-deadline", type=float, default=None,
+                    help="Seconds per turn; LLM, SQL and search calls get the time left as their "
+                         "timeout (default: $TURN_DEADLINE_SECONDS or 120; 0 = none)")
+parser.add_argument("--max-tool-rounds", type=int, default=8,
+                    help="Tool rounds per turn before the agent must answer (default: 8; 0 = no limit)")
+parser.add_argument("--no-circuit-breaker", action="store_true",
+                    help="Keep calling SQL/search even when most recent calls failed")
+parser.add_argument("--breaker-failure-rate", type=float, default=0.5,
+                    help="Share of the last 20 calls failed or slow that opens a breaker (default: 0.5)")
+parser.add_argument("--breaker-cooldown", type=float, default=30.0,
+                    help="Seconds an open breaker fails fast before probing again (default: 30)")
+parser.add_argument("--hedge-search", action="store_true",
+                    help="Send a second search request when the first exceeds the observed p95")
+parser.add_argument("--hedge-after-ms", type=float, default=0,
+                    help="Fixed hedge delay instead of the observed p95 (default: 0 = p95)")
+parser.add_argument("--warm-start", action="store_true",
+                    help="Use the cached agent definition / SQL endpoint and initialize in the background")
+parser.add_argument("--inline-agent", action="store_true",
+                    help="Send the agent's instructions and tools with every request instead of a "
+                         "reference to the stored agent (always on with --record/--replay)")
+parser.add_argument("--stream", action="store_true",
+                    help="Stream the answer as it is generated and start tools early")
+parser.add_argument("--sql-max-rows", type=int, default=50,
+                    help="Max rows returned to the agent per query (default: 50)")
+parser.add_argument("--sql-max-bytes", type=int, default=16000,
+                    help="Max characters of result table per query (default: 16000)")
+parser.add_argument("--no-sql-validation", action="store_true",
+                    help="Send agent SQL to the endpoint without the local schema check and auto-fixes")
+parser.add_argument("--no-metadata-fast-path", action="store_true",
+                    help="Send INFORMATION_SCHEMA and SELECT TOP n * probes to the endpoint instead "
+                         "of answering them from local schema metadata")
+parser.add_argument("--sql-summarize-over", type=int, default=0, metavar="ROWS",
+                    help="Send results with more than ROWS rows as a statistical profile "
+                         "plus a sample (requires pandas; default: off)")
+parser.add_argument("--sql-profile-rows", type=int, default=100000,
+                    help="Max rows fetched to build a result profile (default: 100000)")
+parser.add_argument("--sql-sample-rows", type=int, default=10,
+                    help="Rows shown with a result profile (default: 10)")
+parser.add_argument("--workspace-max-mb", type=float, default=256,
+                    help="Memory cap for SQL results kept for query_previous_result (default: 256)")
+parser.add_argument("--workspace-max-rows", type=int, default=2000,
+                    help="Rows fetched and kept per SQL result for query_previous_result; every "
+                         "execute_sql fetches up to this many, so higher values answer more follow-ups "
+                         "locally at the cost of fetch time and memory on every query (default: 2000)")
+parser.add_argument("--sql-format", choices=SQL_FORMATS, default="markdown",
+                    help="Encoding of SQL results sent to the agent (default: markdown)")
+parser.add_argument("--search-format", choices=SEARCH_FORMATS, default="full",
+                    help="Encoding of search results sent to the agent (default: full)")
+parser.add_argument("--tool-token-budget", type=int, default=0,
+                    help="Max tokens per tool output; rows/results are trimmed to fit (default: off)")
+parser.add_argument("--offline-sql", action="store_true",
+                    help="Run execute_sql against the local tables/ CSVs instead of Fabric")
+parser.add_argument("--eval", action="store_true",
+                    help="Run all sample questions non-interactively and record latency")
+parser.add_argument("--eval-concurrency", type=int, default=1,
+                    help="Questions evaluated in parallel in --eval mode (default: 1)")
+parser.add_argument("--eval-output", default=None,
+                    help="Output path prefix for --eval results (default: data/<folder>/eval/eval_<timestamp>)")
+parser.add_argument("--eval-baseline", default=None, metavar="JSONL",
+                    help="Earlier --eval results to compare latency and answers with (e.g. single model vs routing)")
+parser.add_argument("--planner-model", default=None, metavar="DEPLOYMENT",
+                    help="Deployment for the first call of a turn, which picks the tools (default: agent model)")
+parser.add_argument("--answer-model", default=None, metavar="DEPLOYMENT",
+                    help="Deployment for calls that submit tool results and write the answer (default: agent model)")
+parser.add_argument("--trace", nargs="?", const="", default=None, metavar="FILE",
+                    help="Trace each turn and print a timing tree; optionally append "
+                         "OpenTelemetry JSON spans to FILE")
+parser.add_argument("--record", default=None, metavar="CASSETTE",
+                    help="Record LLM and tool calls to a cassette file (against Foundry or --emulator)")
+parser.add_argument("--replay", default=None, metavar="CASSETTE",
+                    help="Replay LLM and tool calls from a cassette file (offline)")
+parser.add_argument("--replay-latency", default="none",
+                    help="Replay latency: none, recorded, or a fixed number of ms (default: none)")
+parser.add_argument("--emulator", nargs="?", const="local", default=None, metavar="URL",
+                    help="Use a local Responses API emulator instead of Foundry "
+                         "(starts one in-process unless a base URL is given)")
+parser.add_argument("--emulator-latency-ms", type=float, default=800.0,
+                    help="Median emulated LLM/search latency in ms (default: 800)")
+parser.add_argument("--emulator-rate-limit", type=float, default=0.0,
+                    help="Share of emulated LLM requests rejected with 429 (default: 0)")
+parser.add_argument("--emulator-metric-tool", action="store_true",
+                    help="Give the emulated agent the get_metric tool (like 07 --metric-tool)")
+parser.add_argument("--emulator-value-lookup", action="store_true",
+                    help="Give the emulated agent the lookup_values tool (like 07 --value-lookup)")
+parser.add_argument("--load-test", type=int, default=0, metavar="SESSIONS",
+                    help="Run N concurrent simulated sessions and report throughput/tail latency")
+parser.add_argument("--load-turns", type=int, default=3,
+                    help="Questions asked per simulated session in --load-test (default: 3)")
+parser.add_argument("--prefetch-search", action="store_true",
+                    help="Speculatively search for the question in parallel with the first LLM call")
+parser.add_argument("--prefetch-threshold", type=float, default=0.6,
+                    help="Min query similarity (0-1) to serve a search from the prefetch (default: 0.6)")
+parser.add_argument("--answer-cache-ttl", type=float, default=None, metavar="SECONDS",
+                    help="Cache final answers for repeated questions (default: ANSWER_CACHE_TTL "
+                         "from .env; 0 disables; off in --eval/--load-test unless given)")
+parser.add_argument("--compact-threshold", type=int, default=0, metavar="TOKENS",
+                    help="Compact the conversation once its context passes TOKENS input tokens "
+                         "(old tool outputs become one-line references; default: off)")
+parser.add_argument("--compact-keep-turns", type=int, default=2,
+                    help="Most recent turns kept verbatim when compacting (default: 2)")
 args = parser.parse_args()
 
 FOUNDRY_ONLY = args.foundry_only
+TOOL_WORKERS = max(1, args.tool_workers)
+STREAM = args.stream
+SQL_MAX_ROWS = max(1, args.sql_max_rows)
+SQL_MAX_BYTES = max(1, args.sql_max_bytes)
+SQL_FORMAT = args.sql_format
+SEARCH_FORMAT = args.search_format
+TOOL_TOKEN_BUDGET = max(0, args.tool_token_budget) or None
+REPLAY = bool(args.replay)
+EMULATOR = args.emulator
+OFFLINE_LLM = REPLAY or bool(EMULATOR)  # No Foundry access needed
+# The emulator pairs with the offline SQL backend so no Azure service is touched
+OFFLINE_SQL = (args.offline_sql or bool(EMULATOR)) and not FOUNDRY_ONLY and not REPLAY
+USE_FABRIC_SQL = not FOUNDRY_ONLY and not OFFLINE_SQL and not REPLAY
+EVAL_MODE = args.eval
+LOAD_TEST = max(0, args.load_test)
+QUIET = EVAL_MODE or bool(LOAD_TEST)  # Tool chatter from concurrent questions would interleave
+TRACE = args.trace is not None
+# Cassettes key tool calls by content; a speculative search would not replay
+PREFETCH_SEARCH = args.prefetch_search and not (args.record or args.replay)
+
+# Shared by every session and worker thread in this process (see circuit_breaker.py)
+SQL_BREAKER = SEARCH_BREAKER = None
+if not args.no_circuit_breaker:
+    SQL_BREAKER = get_breaker("SQL endpoint", failure_rate=args.breaker_failure_rate,
+                              cooldown=args.breaker_cooldown, slow_seconds=30.0)
+    SEARCH_BREAKER = get_breaker("Document search", failure_rate=args.breaker_failure_rate,
+                                 cooldown=args.breaker_cooldown, slow_seconds=10.0)
+SEARCH_HEDGER = None
+if args.hedge_search:
+    SEARCH_HEDGER = Hedger(SEARCH_BREAKER or get_breaker("Document search"),
+                           delay=args.hedge_after_ms / 1000 or None, max_workers=TOOL_WORKERS)
+CASSETTE = None
+
+if TRACE:
+    enable_tracing(args.trace or None)
+
+if STREAM and (args.record or args.replay):
+    print("ERROR: --stream cannot be combined with --record/--replay")
+    sys.exit(1)
+
+if args.replay and (args.record or args.emulator):
+    # Replay serves the model itself; a second source would be silently ignored
+    print("ERROR: --replay cannot be combined with --record or --emulator")
+    sys.exit(1)
+
+if args.prefetch_search and not PREFETCH_SEARCH:
+    print("WARNING: --prefetch-search is ignored with --record/--replay")
 
 # Load environment from azd + project .env
 from load_env import load_all_env
 load_all_env()
 
+# TURN_DEADLINE_SECONDS may come from .env, so it is read only after loading it
+if args.turn_deadline is None:
+    args.turn_deadline = float(os.getenv("TURN_DEADLINE_SECONDS") or 120)
+BUDGET = TurnBudget(args.turn_deadline, args.max_tool_rounds)
+
 from azure.identity import DefaultAzureCredential
 from azure.ai.projects import AIProjectClient
 from azure.search.documents import SearchClient
 
-if not FOUNDRY_ONLY:
+if USE_FABRIC_SQL:
     import pyodbc
 
 # ============================================================================
@@ -51,14 +251,14 @@ SEARCH_ENDPOINT = os.getenv("AZURE_AI_SEARCH_ENDPOINT")
 WORKSPACE_ID = os.getenv("FABRIC_WORKSPACE_ID")
 DATA_FOLDER = os.getenv("DATA_FOLDER")
 
-if not ENDPOINT:
+if not ENDPOINT and not OFFLINE_LLM:
     print("ERROR: AZURE_AI_PROJECT_ENDPOINT not set")
     print("       Run 'azd up' to deploy Azure resources")
     sys.exit(1)
 
-if not FOUNDRY_ONLY and not WORKSPACE_ID:
+if USE_FABRIC_SQL and not WORKSPACE_ID:
     print("ERROR: FABRIC_WORKSPACE_ID not set in .env")
-    print("       Use --foundry-only to skip Fabric, or set FABRIC_WORKSPACE_ID")
+    print("       Use --foundry-only or --offline-sql to skip Fabric, or set FABRIC_WORKSPACE_ID")
     sys.exit(1)
 
 if not DATA_FOLDER:
@@ -66,7 +266,7 @@ if not DATA_FOLDER:
     print("       Run 01_generate_sample_data.py first")
     sys.exit(1)
 
-if not SEARCH_ENDPOINT:
+if not SEARCH_ENDPOINT and not OFFLINE_LLM:
     print("ERROR: AZURE_AI_SEARCH_ENDPOINT not set in .env")
     sys.exit(1)
 
@@ -79,6 +279,10 @@ if not os.path.exists(config_dir):
 
 # Get agent ID
 AGENT_ID = args.agent_id
+AGENT_NAME = None  # What agent references name (the agent ID when 07 did not record it)
+AGENT_VERSION = None
+AGENT_DEFINITION = None
+REFERENCE_VERSION = None
 
 if not AGENT_ID:
     # Try to load from agent_ids.json
@@ -87,8 +291,18 @@ if not AGENT_ID:
         with open(agent_ids_path) as f:
             agent_ids = json.load(f)
         AGENT_ID = agent_ids.get("agent_id")
+        AGENT_NAME = agent_ids.get("agent_name")
+        # Written by 07; the definition hash keys the cached agent for --warm-start
+        AGENT_VERSION = agent_ids.get("agent_version")
+        AGENT_DEFINITION = agent_ids.get("agent_definition")
+        if AGENT_DEFINITION == UNREADABLE_DEFINITION:
+            # Written before 07 could read the SDK's definition: no cached agent until 07 re-runs
+            AGENT_DEFINITION = None
+            if args.warm_start:
+                print("WARNING: agent_ids.json has no usable definition hash - "
+                      "re-run 07 to cache the agent definition for --warm-start")
 
-if not AGENT_ID:
+if not AGENT_ID and not OFFLINE_LLM:
     print("ERROR: No agent ID found.")
     print("       Run 07_create_foundry_agent.py first or provide --agent-id")
     sys.exit(1)
@@ -102,11 +316,12 @@ if os.path.exists(fabric_ids_path):
         fabric_ids = json.load(f)
     LAKEHOUSE_NAME = fabric_ids.get("lakehouse_name")
     LAKEHOUSE_ID = fabric_ids.get("lakehouse_id")
-elif not FOUNDRY_ONLY:
+elif USE_FABRIC_SQL:
     print("ERROR: fabric_ids.json not found. Run 02_create_fabric_items.py first or use --foundry-only")
     sys.exit(1)
 
 # Load Search IDs
+search_ids = {}
 search_ids_path = os.path.join(config_dir, "search_ids.json")
 if os.path.exists(search_ids_path):
     with open(search_ids_path) as f:
@@ -125,20 +340,43 @@ if FOUNDRY_ONLY:
     print("AI Agent Chat (Search Only)")
 else:
     print("Multi-Tool AI Agent Chat")
+if OFFLINE_SQL:
+    print("SQL backend: offline (local tables/ CSVs)")
 print(f"{'='*60}")
 print("Type 'quit' to exit, 'help' for sample questions\n")
 
 # ============================================================================
-# Get SQL Endpoint (skip in foundry-only mode)
+# Warm Start (--warm-start)
+# ============================================================================
+
+# One credential for every Azure call, so tokens are cached between them
+CREDENTIAL = DefaultAzureCredential()
+
+STARTUP_CACHE = None
+WARMUP = None
+if args.warm_start:
+    from warm_start import StartupCache, Warmup, definition_hash
+    STARTUP_CACHE = StartupCache(data_dir)
+    WARMUP = Warmup()
+STARTUP = {"warm_start": bool(WARMUP)}
+
+# ============================================================================
+# Get SQL Endpoint (skip in foundry-only and offline mode)
 # ============================================================================
 
 SQL_ENDPOINT = None
+OFFLINE_DB = None
+
+if OFFLINE_SQL:
+    from offline_sql import OfflineDatabase
+    OFFLINE_DB = OfflineDatabase(data_dir)
+    print(f"Loaded {len(OFFLINE_DB.row_counts)} offline tables "
+          f"({sum(OFFLINE_DB.row_counts.values())} rows) in {OFFLINE_DB.load_seconds * 1000:.0f} ms")
 
-if not FOUNDRY_ONLY:
+if USE_FABRIC_SQL:
     def get_sql_endpoint():
         """Get the SQL analytics endpoint for the Lakehouse"""
-        credential = DefaultAzureCredential()
-        token = credential.get_token("https://api.fabric.microsoft.com/.default")
+        token = CREDENTIAL.get_token("https://api.fabric.microsoft.com/.default")
         
         import requests
         headers = {"Authorization": f"Bearer {token.token}"}
@@ -152,106 +390,377 @@ if not FOUNDRY_ONLY:
             return sql_props.get("connectionString")
         return None
 
-    SQL_ENDPOINT = get_sql_endpoint()
-    if not SQL_ENDPOINT:
-        print("WARNING: Could not get SQL endpoint. SQL queries may fail.")
+    SQL_ENDPOINT_KEY = f"{WORKSPACE_ID}/{LAKEHOUSE_ID}"
+
+    def lookup_sql_endpoint():
+        """Fetch the endpoint (and remember it for --warm-start); sets SQL_ENDPOINT"""
+        global SQL_ENDPOINT
+        SQL_ENDPOINT = get_sql_endpoint()
+        if not SQL_ENDPOINT:
+            print("WARNING: Could not get SQL endpoint. SQL queries may fail.")
+        elif STARTUP_CACHE:
+            STARTUP_CACHE.put("sql_endpoint", SQL_ENDPOINT_KEY, SQL_ENDPOINT)
+        return SQL_ENDPOINT
+
+    if STARTUP_CACHE:
+        SQL_ENDPOINT = STARTUP_CACHE.get("sql_endpoint", SQL_ENDPOINT_KEY)
+    SQL_ENDPOINT_CACHED = bool(SQL_ENDPOINT)
+    if SQL_ENDPOINT:
+        print("SQL endpoint: cached")
+    elif WARMUP:
+        WARMUP.start("sql_endpoint", lookup_sql_endpoint)
+    else:
+        lookup_sql_endpoint()
+
+# ============================================================================
+# Local SQL Validation (skip with --no-sql-validation)
+# ============================================================================
+
+SQL_VALIDATOR = None
+if not FOUNDRY_ONLY and not args.no_sql_validation:
+    from sql_validation import SqlValidator, load_schema
+    from join_graph import JoinGraph
+    schema_tables = load_schema(config_dir)
+    SQL_VALIDATOR = SqlValidator(schema_tables, JoinGraph.load(data_dir) if schema_tables else None)
+    if not SQL_VALIDATOR.available:
+        print("WARNING: Local SQL validation off (needs sqlglot and schema.json)")
+        SQL_VALIDATOR = None
+
+# ============================================================================
+# Local Schema Metadata (skip with --no-metadata-fast-path)
+# ============================================================================
+
+METADATA = None
+if not FOUNDRY_ONLY and not args.no_metadata_fast_path:
+    if os.path.exists(os.path.join(config_dir, "schema.json")):
+        from schema_metadata import SchemaMetadata
+        METADATA = SchemaMetadata(data_dir)
+    else:
+        print("WARNING: schema.json not found - schema probes go to the SQL endpoint")
+
+def answer_from_metadata(sql_query):
+    """Result text for a schema probe answerable from local metadata, else None"""
+    return metadata_answer(METADATA, sql_query, SQL_FORMAT, TOOL_TOKEN_BUDGET)
 
 # ============================================================================
 # SQL Execution Function
 # ============================================================================
 
+def connect_sql():
+    """Open a connection to the Fabric SQL endpoint (or the offline database)"""
+    if OFFLINE_DB:
+        return OFFLINE_DB.connect()
+    
+    # Get AAD token for SQL
+    token = CREDENTIAL.get_token('https://database.windows.net//.default')
+    
+    # Build token struct with UTF-16-LE encoding (required for ODBC)
+    token_bytes = token.token.encode('UTF-16-LE')
+    token_struct = struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
+    
+    # Connection string
+    conn_str = f'Driver={{ODBC Driver 18 for SQL Server}};Server={SQL_ENDPOINT};Database={LAKEHOUSE_NAME};Encrypt=yes;TrustServerCertificate=no'
+    
+    # Connect with token
+    SQL_COPT_SS_ACCESS_TOKEN = 1256
+    login_timeout = time_left()
+    options = {"timeout": math.ceil(login_timeout)} if login_timeout is not None else {}
+    return pyodbc.connect(conn_str, attrs_before={SQL_COPT_SS_ACCESS_TOKEN: token_struct}, **options)
+
 def execute_sql(sql_query):
     """Execute SQL query against Fabric Lakehouse and return results"""
-    if not SQL_ENDPOINT:
+    if METADATA:
+        local = answer_from_metadata(sql_query)
+        if local is not None:
+            return local
+    
+    if not SQL_ENDPOINT and not OFFLINE_DB:
         return "Error: SQL endpoint not available"
     
+    # Reject or fix what would fail on the endpoint without a round trip
+    note = ""
+    if SQL_VALIDATOR:
+        with span("sql.validate") as validate_span:
+            check = SQL_VALIDATOR.check(sql_query)
+            validate_span.set_attributes(parsed=check.parsed, fixes=len(check.fixes), errors=len(check.errors))
+        if check.errors:
+            return check.message()
+        sql_query = check.sql
+        note = check.note()
+    
     try:
-        # Get AAD token for SQL
-        credential = DefaultAzureCredential()
-        token = credential.get_token('https://database.windows.net//.default')
-        
-        # Build token struct with UTF-16-LE encoding (required for ODBC)
-        token_bytes = token.token.encode('UTF-16-LE')
-        token_struct = struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
-        
-        # Connection string
-        conn_str = f'Driver={{ODBC Driver 18 for SQL Server}};Server={SQL_ENDPOINT};Database={LAKEHOUSE_NAME};Encrypt=yes;TrustServerCertificate=no'
-        
-        # Connect with token
-        SQL_COPT_SS_ACCESS_TOKEN = 1256
-        conn = pyodbc.connect(conn_str, attrs_before={SQL_COPT_SS_ACCESS_TOKEN: token_struct})
-        cursor = conn.cursor()
-        
-        cursor.execute(sql_query)
-        
-        columns = [col[0] for col in cursor.description]
-        rows = cursor.fetchall()
-        
-        # Format results
-        result_lines = []
-        result_lines.append("| " + " | ".join(columns) + " |")
-        result_lines.append("|" + "|".join(["---"] * len(columns)) + "|")
-        
-        for row in rows[:50]:  # Limit to 50 rows
-            values = [str(v) if v is not None else "NULL" for v in row]
-            result_lines.append("| " + " | ".join(values) + " |")
-        
-        if len(rows) > 50:
-            result_lines.append(f"\n... and {len(rows) - 50} more rows")
-        
-        result_lines.append(f"\n({len(rows)} rows returned)")
-        
-        conn.close()
-        return "\n".join(result_lines)
-        
+        if SQL_BREAKER:
+            return SQL_BREAKER.call(query_endpoint, sql_query, is_failure=is_endpoint_failure) + note
+        return query_endpoint(sql_query) + note
+    except CircuitOpen as e:
+        return f"Error: {e}"
     except Exception as e:
         return f"SQL Error: {str(e)}"
 
+# Open connections are reused between queries - the ODBC login is paid once
+# per connection, not per query (at most one per tool worker)
+SQL_POOL = ConnectionPool(connect_sql, max_size=TOOL_WORKERS)
+
+def query_endpoint(sql_query):
+    """Run a checked query on a pooled connection and format the result"""
+    on_result = None
+    if WORKSPACE:
+        on_result = lambda columns, rows, complete: keep_result(WORKSPACE, sql_query, columns, rows, complete)
+    with SQL_POOL.connection() as conn:
+        query_timeout = time_left()
+        if query_timeout is not None:
+            conn.timeout = math.ceil(query_timeout)  # pyodbc query timeout (seconds)
+        return run_bounded_query(conn, sql_query, SQL_MAX_ROWS, SQL_MAX_BYTES,
+                                 SQL_FORMAT, TOOL_TOKEN_BUDGET,
+                                 summarize_over=args.sql_summarize_over or None,
+                                 profile_max_rows=max(1, args.sql_profile_rows),
+                                 sample_rows=max(1, args.sql_sample_rows),
+                                 on_result=on_result,
+                                 keep_rows=max(1, args.workspace_max_rows))
+
+def warm_sql_connection():
+    """Open one pooled connection ahead of the first query"""
+    if not SQL_ENDPOINT and not OFFLINE_DB:
+        return
+    try:
+        SQL_POOL.warm(1)
+    except Exception:
+        if OFFLINE_DB or not SQL_ENDPOINT_CACHED:
+            raise
+        # The cached endpoint may be stale - look it up again once
+        STARTUP_CACHE.drop("sql_endpoint")
+        if lookup_sql_endpoint():
+            SQL_POOL.warm(1)
+
+if WARMUP and not FOUNDRY_ONLY and not REPLAY:
+    WARMUP.start("sql_connection", warm_sql_connection, after=("sql_endpoint",))
+
 # ============================================================================
 # AI Search Function
 # ============================================================================
 
-def search_documents(query, top=3):
-    """Search documents in Azure AI Search"""
-    try:
-        credential = DefaultAzureCredential()
-        search_client = SearchClient(
-            endpoint=SEARCH_ENDPOINT,
-            index_name=INDEX_NAME,
-            credential=credential
-        )
-        
-        # Perform hybrid search (text + vector if available)
-        results = search_client.search(
+_search_client = None
+_search_client_lock = threading.Lock()
+
+def get_search_client():
+    """Shared SearchClient - its HTTP connections stay open between searches"""
+    global _search_client
+    with _search_client_lock:
+        if _search_client is None:
+            _search_client = SearchClient(endpoint=SEARCH_ENDPOINT, index_name=INDEX_NAME, credential=CREDENTIAL)
+        return _search_client
+
+def search_request(query, top=3):
+    """One AI Search request; returns the result documents"""
+    search_client = get_search_client()
+    
+    # Perform hybrid search (text + vector if available); results are
+    # paged lazily, so the request happens while they are read
+    timeout = time_left()
+    options = {"timeout": timeout} if timeout is not None else {}
+    with span("search.request", top=min(top, 10)) as request_span:
+        results = list(search_client.search(
             search_text=query,
             top=min(top, 10),
             query_type="semantic",
             semantic_configuration_name="default-semantic",
-            select=["content", "title", "source", "page_number"]
-        )
+            select=["content", "title", "source", "page_number"],
+            **options
+        ))
+        request_span.set_attribute("results", len(results))
+    return results
+
+def guarded_search(request, query, top=3):
+    """Run a search request through the breaker, hedged when enabled (search is idempotent)"""
+    def attempt():
+        if SEARCH_HEDGER:
+            return SEARCH_HEDGER.call(request, query, top)
+        return request(query, top)
+    if SEARCH_BREAKER:
+        return SEARCH_BREAKER.call(attempt)
+    return attempt()
+
+def search_documents(query, top=3):
+    """Search documents in Azure AI Search"""
+    try:
+        results = guarded_search(search_request, query, top)
         
         # Format results
-        result_lines = []
-        for i, result in enumerate(results, 1):
-            result_lines.append(f"\n--- Result {i} ---")
-            result_lines.append(f"Source: {result.get('source', 'Unknown')} (Page {result.get('page_number', '?')})")
-            result_lines.append(f"Title: {result.get('title', 'Unknown')}")
-            result_lines.append(f"Content: {result.get('content', '')[:500]}...")
-        
-        if not result_lines:
-            return "No documents found matching the query."
-        
-        return "\n".join(result_lines)
+        with span("search.format", format=SEARCH_FORMAT) as format_span:
+            output = format_search_results(results, SEARCH_FORMAT, TOOL_TOKEN_BUDGET)
+            format_span.set_attribute("bytes", len(output))
+            return output
         
+    except CircuitOpen as e:
+        return f"Error: {e}"
     except Exception as e:
         return f"Search Error: {str(e)}"
 
+def warm_search_connection():
+    """One cheap request: token, TLS handshake and connection before the first search"""
+    get_search_client().get_document_count()
+
+if WARMUP and not OFFLINE_LLM:
+    WARMUP.start("search_connection", warm_search_connection)
+
+# ============================================================================
+# Tool Dispatch
+# ============================================================================
+
+# Canned search backend used with --emulator
+SEARCH_STUB = None
+
+# Shared bounded pool - the function calls of one turn run side by side
+tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+def announce_tool_call(name, args):
+    """Print what the agent asked for before the call runs"""
+    if QUIET:
+        return
+    if name == "execute_sql":
+        print(f"\n  [SQL Tool] Executing query:")
+        # Print full query with indentation
+        for line in args.get("sql_query", "").strip().split('\n'):
+            print(f"    {line}")
+    elif name == "search_documents":
+        print(f"\n  [Search Tool] Searching for: {args.get('query', '')}...")
+    elif name == "query_previous_result":
+        print(f"\n  [Workspace Tool] Querying {args.get('result_id') or 'latest result'} locally")
+    elif name == "describe_tables":
+        print(f"\n  [Metadata Tool] Describing {', '.join(args.get('tables') or []) or 'all tables'}")
+    elif name == "get_metric":
+        by = f" by {', '.join(args['group_by'])}" if args.get("group_by") else ""
+        print(f"\n  [Metric Tool] {args.get('metric')}{by}")
+    elif name == "lookup_values":
+        print(f"\n  [Value Tool] Looking up {', '.join(repr(t) for t in args.get('terms') or [])}")
+
+def dispatch_tool_call(name, args):
+    """Run a single function tool (recorded/replayed when a cassette is active)"""
+    if CASSETTE:
+        return CASSETTE.tool(name, args, lambda: call_tool_backend(name, args))
+    return call_tool_backend(name, args)
+
+def call_tool_backend(name, args):
+    """Run a single function tool and return its output text (see agent_loop.ToolHandlers)"""
+    return TOOL_HANDLERS(name, args)
+
+def search_backend(query, top=3):
+    """search_documents against AI Search, or the canned backend with --emulator"""
+    if not SEARCH_STUB:
+        return search_documents(query, top)
+    try:
+        return guarded_search(SEARCH_STUB, query, top)
+    except CircuitOpen as e:
+        return f"Error: {e}"
+
+def timed_tool_call(name, args):
+    """Run a function tool, returning (output, elapsed_seconds)"""
+    start = time.perf_counter()
+    with span(f"tool.{name}") as tool_span:
+        result = dispatch_tool_call(name, args)
+        tool_span.set_attributes(output_bytes=len(result), error=result.startswith(("SQL Error", "Search Error", "Error:")))
+    return result, time.perf_counter() - start
+
+def show_tool_result(name, result):
+    """Print the tool output that goes back to the agent"""
+    if QUIET or name != "search_documents":
+        return
+    print(f"  [Search Result]:")
+    # Truncate if too long, but show meaningful content
+    display = result[:500] if len(result) > 500 else result
+    for line in display.strip().split('\n'):
+        print(f"    {line}")
+    if len(result) > 500:
+        print(f"    ... ({len(result)} chars total)")
+
+def submit_tool_call(fc, prefetch=None):
+    """Announce a function call and start it on the tool pool.
+    
+    A search_documents call similar enough to the turn's speculative
+    prefetch is served from it instead of running again.
+    """
+    args = parse_arguments(fc)
+    announce_tool_call(fc.name, args)
+    if fc.name == "search_documents" and PREFETCHER:
+        served = PREFETCHER.claim(prefetch, args)
+        if served is not None:
+            if not QUIET:
+                print(f"  [Prefetch] Served from speculative search for: {prefetch.query[:80]}")
+            return served
+    return tool_pool.submit(run_in_context(timed_tool_call, fc.name, args))
+
+def wait_for_tool(fc, future):
+    """Result of a submitted call, or an error output once the turn deadline passes"""
+    start = time.perf_counter()
+    try:
+        return future.result(timeout=time_left(floor=0.1))
+    except FutureTimeout:
+        # The call keeps running on the pool, but the turn no longer waits for it
+        return f"Error: {fc.name} did not finish before the turn deadline", time.perf_counter() - start
+
+def collect_tool_outputs(pending, wall_start, metrics=None):
+    """Wait for submitted calls and build their function_call_output items.
+    
+    `pending` is a list of (function_call, future) pairs. Outputs keep the
+    order the model emitted the calls, each matched to its call_id. Per-call
+    and wall-clock timings are printed so the saving over sequential
+    execution is visible, and added to `metrics` when given.
+    """
+    results = {fc.call_id: wait_for_tool(fc, future) for fc, future in pending}
+    wall_elapsed = time.perf_counter() - wall_start
+    
+    tool_outputs = []
+    for fc, _ in pending:
+        result, elapsed = results[fc.call_id]
+        record_tool_call(metrics, fc.name, elapsed)
+        show_tool_result(fc.name, result)
+        if not QUIET:
+            print(f"  [Timing] {fc.name} ({fc.call_id}): {elapsed * 1000:.0f} ms")
+        tool_outputs.append(function_call_output(fc, result))
+    
+    if len(pending) > 1 and not QUIET:
+        total = sum(elapsed for _, elapsed in results.values())
+        print(f"  [Timing] {len(pending)} tool calls: {wall_elapsed * 1000:.0f} ms wall-clock "
+              f"({total * 1000:.0f} ms if run sequentially)")
+    
+    return tool_outputs
+
+def run_tool_calls(function_calls, metrics=None, prefetch=None):
+    """Execute a turn's function calls concurrently on the tool pool"""
+    wall_start = time.perf_counter()
+    pending = [(fc, submit_tool_call(fc, prefetch)) for fc in function_calls]
+    return collect_tool_outputs(pending, wall_start, metrics)
+
+# ============================================================================
+# Speculative Search Prefetch (--prefetch-search)
+# ============================================================================
+
+def prefetch_search(query, top):
+    """Speculative search_documents call, returning (output, elapsed_seconds)"""
+    start = time.perf_counter()
+    with span("prefetch.search_documents") as prefetch_span:
+        result = call_tool_backend("search_documents", {"query": query, "top": top})
+        prefetch_span.set_attribute("output_bytes", len(result))
+    return result, time.perf_counter() - start
+
+PREFETCHER = None
+if PREFETCH_SEARCH:
+    from search_prefetch import SearchPrefetcher
+    PREFETCHER = SearchPrefetcher(
+        lambda query, top: tool_pool.submit(run_in_context(prefetch_search, query, top)),
+        threshold=args.prefetch_threshold,
+    )
+
 # ============================================================================
 # Load Sample Questions
 # ============================================================================
 
 questions_path = os.path.join(config_dir, "sample_questions.txt")
-sample_questions = [
+sample_question_items = []
+if os.path.exists(questions_path):
+    sample_question_items = load_sample_questions(questions_path)
+
+sample_questions = [q["question"] for q in sample_question_items] or [
     # Questions that REQUIRE both tools to make sense:
     "What is the total value of orders that would qualify for free shipping based on our shipping policy?",
     "How many of our orders meet the minimum purchase requirement for loyalty rewards?",
@@ -263,127 +772,726 @@ sample_questions = [
 # Initialize Client
 # ============================================================================
 
-credential = DefaultAzureCredential()
-project_client = AIProjectClient(
-    endpoint=ENDPOINT,
-    credential=credential
+if EMULATOR:
+    # Scripted model behind a local HTTP emulator of the Responses API
+    from openai import OpenAI
+    from responses_emulator import ResponsesEmulator, EmulatedSearch, LatencyModel, emulator_tools
+    
+    table_names = list(OFFLINE_DB.ontology.get("tables", {}).keys()) if OFFLINE_DB else []
+    emulated_metrics = None
+    if args.emulator_metric_tool and OFFLINE_DB:
+        from semantic_metrics import MetricLayer
+        emulated_metrics = MetricLayer(OFFLINE_DB.ontology) if OFFLINE_DB.ontology.get("metrics") else None
+    emulator_url = EMULATOR
+    if EMULATOR == "local":
+        emulator = ResponsesEmulator(
+            latency_ms=args.emulator_latency_ms,
+            rate_limit=args.emulator_rate_limit,
+            table=table_names[0] if table_names else "data",
+            sql_tool=not FOUNDRY_ONLY,
+            metric=next(iter(emulated_metrics.measures)) if emulated_metrics else None,
+            value_lookup=args.emulator_value_lookup,
+        ).start()
+        emulator_url = emulator.base_url
+    
+    SEARCH_STUB = EmulatedSearch(LatencyModel(args.emulator_latency_ms / 4))
+    AGENT_ID = AGENT_ID or "emulator"
+    MODEL = "emulator"
+    INSTRUCTIONS = "You are an emulated agent used for load testing."
+    TOOLS = emulator_tools(table_names, sql_tool=not FOUNDRY_ONLY, metric_layer=emulated_metrics,
+                           value_lookup=args.emulator_value_lookup and not FOUNDRY_ONLY)
+    openai_client = OpenAI(base_url=emulator_url, api_key="emulator")
+    print(f"Using Responses API emulator at {emulator_url}")
+elif REPLAY:
+    # Everything - agent definition, LLM and tool results - comes from the cassette
+    from cassette import Cassette
+    CASSETTE = Cassette(args.replay, "replay", args.replay_latency)
+    AGENT_ID = CASSETTE.agent.get("agent_id", AGENT_ID)
+    MODEL = CASSETTE.agent.get("model")
+    INSTRUCTIONS = CASSETTE.agent.get("instructions")
+    TOOLS = CASSETTE.agent.get("tools")
+    openai_client = CASSETTE.wrap_client()
+    print(f"Replaying {len(CASSETTE.interactions)} recorded calls from {args.replay} "
+          f"(latency: {args.replay_latency})")
+else:
+    project_client = AIProjectClient(
+        endpoint=ENDPOINT,
+        credential=CREDENTIAL
+    )
+    
+    # Get agent details (the cached definition is valid for the definition 07 recorded;
+    # the version alone repeats when 07 recreates the agent)
+    agent_key = f"{AGENT_ID}#{AGENT_DEFINITION}" if AGENT_DEFINITION else None
+    cached_agent = STARTUP_CACHE.get("agent", agent_key) if STARTUP_CACHE else None
+    if cached_agent:
+        MODEL = cached_agent['model']
+        INSTRUCTIONS = cached_agent['instructions']
+        TOOLS = cached_agent['tools']
+        AGENT_NAME = cached_agent.get('name', AGENT_NAME)
+        REFERENCE_VERSION = cached_agent.get('version')
+        print(f"Agent definition: cached (version {AGENT_VERSION}, definition {AGENT_DEFINITION})")
+        
+        def check_cached_agent():
+            """Catch agents changed outside 07 (e.g. in the portal) for the next start"""
+            current = definition_hash(project_client.agents.get(AGENT_ID))
+            if current and current != AGENT_DEFINITION:
+                STARTUP_CACHE.drop("agent")
+                print(f"\nWARNING: Agent definition changed since 07 ran ({current}, not {AGENT_DEFINITION}) - "
+                      f"restart (or re-run 07) to use the new definition")
+        
+        WARMUP.start("agent_check", check_cached_agent, required=False)
+    else:
+        agent = project_client.agents.get(AGENT_ID)
+        agent_def = agent_definition(agent)  # Plain dicts, also for the tools
+        MODEL = agent_def['model']
+        INSTRUCTIONS = agent_def['instructions']
+        TOOLS = agent_def['tools']
+        AGENT_NAME = getattr(agent, "name", None) or AGENT_NAME
+        REFERENCE_VERSION = reference_version(agent)
+        # Only a definition that still matches what 07 recorded is cached
+        if STARTUP_CACHE and definition_hash(agent) == AGENT_DEFINITION:
+            STARTUP_CACHE.put("agent", agent_key, {"model": MODEL, "instructions": INSTRUCTIONS, "tools": TOOLS,
+                                                   "name": AGENT_NAME, "version": REFERENCE_VERSION})
+    
+    # Get OpenAI client
+    openai_client = project_client.get_openai_client()
+
+if args.record:
+    # Foundry or emulator runs alike - an emulator cassette replays without the emulator
+    from cassette import Cassette
+    CASSETTE = Cassette(args.record, "record")
+    CASSETTE.set_agent(AGENT_ID, MODEL, INSTRUCTIONS, TOOLS)
+    openai_client = CASSETTE.wrap_client(openai_client)
+    print(f"Recording LLM and tool calls to {args.record}")
+
+# Name the stored agent in each request instead of resending its definition;
+# cassettes key LLM calls by model and input, so they always send it inline
+AGENT_REQUEST = AgentRequest(AGENT_NAME or AGENT_ID, MODEL, INSTRUCTIONS, TOOLS, version=REFERENCE_VERSION,
+                             reference=not (args.inline_agent or CASSETTE or (EMULATOR and EMULATOR != "local")))
+if EMULATOR == "local":
+    emulator.register_agent(AGENT_REQUEST.name, MODEL, AGENT_REQUEST.instructions, AGENT_REQUEST.tools)
+print(f"Agent requests: {AGENT_REQUEST.describe()}")
+
+# ============================================================================
+# Model Routing (--planner-model / --answer-model)
+# ============================================================================
+
+from model_routing import ModelRouter
+ROUTER = ModelRouter(MODEL, args.planner_model, args.answer_model)
+if ROUTER.enabled:
+    print(f"Model routing: plan -> {ROUTER.models['plan']}, answer -> {ROUTER.models['answer']}")
+
+# Create a conversation (in the background with --warm-start)
+if WARMUP:
+    WARMUP.start("conversation", openai_client.conversations.create)
+    conversation = None  # Set by finish_warm_start() before the first turn
+else:
+    conversation = openai_client.conversations.create()
+
+_warm_lock = threading.Lock()
+
+def finish_warm_start():
+    """Wait for background initialization that is still running (first turn only)"""
+    global WARMUP, conversation
+    with _warm_lock:
+        if WARMUP is None:
+            return
+        pending = WARMUP.pending()
+        with span("startup.wait", pending=",".join(pending)):
+            STARTUP["init_s"] = round(WARMUP.wait(), 3)
+        conversation = WARMUP.result("conversation") or openai_client.conversations.create()
+        STARTUP["warmup"] = WARMUP.summary()
+        if not QUIET:
+            waited = f", waited for {', '.join(pending)}" if pending else ""
+            print(f"  [Warm start] background init {STARTUP['init_s'] * 1000:.0f} ms{waited}: "
+                  f"{STARTUP['warmup']['steps_ms']}")
+            for name, error in STARTUP["warmup"]["errors"].items():
+                print(f"  [Warm start] {name} failed: {error}")
+        WARMUP = None
+
+def note_first_answer(turn_seconds):
+    """Record time-to-first-answer (process start to the first answer)"""
+    with _warm_lock:
+        if "first_answer_s" in STARTUP:
+            return
+        STARTUP["first_answer_s"] = round(time.perf_counter() - PROCESS_START, 3)
+        STARTUP["first_turn_s"] = round(turn_seconds, 3)
+    if not QUIET:
+        print(f"\n  [Startup] first answer {STARTUP['first_answer_s']:.2f} s after start "
+              f"(prompt ready after {STARTUP.get('prompt_ready_s', 0):.2f} s, turn {turn_seconds:.2f} s)")
+
+# ============================================================================
+# Result Workspace (agent created with --result-workspace)
+# ============================================================================
+
+WORKSPACE = None
+if not FOUNDRY_ONLY and has_tool(TOOLS, "query_previous_result"):
+    from result_workspace import ResultWorkspace
+    WORKSPACE = ResultWorkspace(
+        max_bytes=int(args.workspace_max_mb * 1024 * 1024),
+        max_rows=max(1, args.workspace_max_rows),
+        max_output_rows=SQL_MAX_ROWS,
+        fmt=SQL_FORMAT,
+        token_budget=TOOL_TOKEN_BUDGET,
+    )
+    print(f"Result workspace: on (cap {args.workspace_max_mb:g} MB, "
+          f"{WORKSPACE.max_rows} rows per result)")
+
+
+# ============================================================================
+# Metric Layer (agent created with --metric-tool)
+# ============================================================================
+
+METRICS = None
+if not FOUNDRY_ONLY and not REPLAY and has_tool(TOOLS, "get_metric"):
+    try:
+        METRICS, metric_layer_info = load_metric_layer(data_dir, OFFLINE_DB)
+    except (OSError, ValueError) as e:
+        print(f"WARNING: get_metric unavailable - {e}")
+    else:
+        print(f"Metric layer: {metric_layer_info}")
+
+def get_metric(tool_args):
+    """Run a metric request, on its aggregate table when one covers it (see agent_loop.run_metric)"""
+    if not SQL_ENDPOINT and not OFFLINE_DB:
+        return "Error: SQL endpoint not available"
+    return run_metric(METRICS, tool_args, run_metric_query, log=None if QUIET else print)
+
+def run_metric_query(sql_query):
+    if SQL_BREAKER:
+        return SQL_BREAKER.call(query_endpoint, sql_query, is_failure=is_endpoint_failure)
+    return query_endpoint(sql_query)
+
+# ============================================================================
+# Value Index (agent created with --value-lookup)
+# ============================================================================
+
+VALUES = None
+if not FOUNDRY_ONLY and not REPLAY and has_tool(TOOLS, "lookup_values"):
+    from value_index import ValueIndex
+    try:
+        VALUES = ValueIndex.load(data_dir)
+    except (OSError, ValueError) as e:
+        print(f"WARNING: lookup_values unavailable - {e}")
+    else:
+        print(f"Value index: {len(VALUES):,} values in {len(VALUES.columns)} columns")
+
+# ============================================================================
+# Tool Handlers
+# ============================================================================
+
+TOOL_HANDLERS = ToolHandlers(
+    execute_sql=execute_sql,
+    search=search_backend,
+    get_metric=get_metric if METRICS else None,
+    metadata=METADATA,
+    values=VALUES,
+    workspace=WORKSPACE,
 )
 
-# Get agent details
-agent = project_client.agents.get(AGENT_ID)
-agent_def = agent.versions['latest']['definition']
-MODEL = agent_def['model']
-INSTRUCTIONS = agent_def['instructions']
-TOOLS = agent_def['tools']
+# ============================================================================
+# Answer Cache (opt-in: ANSWER_CACHE_TTL in .env or --answer-cache-ttl)
+# ============================================================================
+
+ANSWER_CACHE = None
+if args.answer_cache_ttl is not None:
+    answer_cache_ttl = args.answer_cache_ttl
+else:
+    # Batch runs measure the agent, not the cache, unless asked explicitly
+    answer_cache_ttl = 0 if QUIET else float(os.getenv("ANSWER_CACHE_TTL") or 0)
+
+if answer_cache_ttl > 0:
+    from answer_cache import AnswerCache, answer_fingerprint
+    ANSWER_CACHE = AnswerCache(
+        data_dir,
+        answer_fingerprint(AGENT_ID, ROUTER.describe(), INSTRUCTIONS, TOOLS, data_dir, INDEX_NAME, search_ids),
+        ttl_seconds=answer_cache_ttl,
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES") or 500),
+    )
+    print(f"Answer cache: on (TTL {answer_cache_ttl:.0f} s, {ANSWER_CACHE.summary()['entries']} entries)")
+
+# Conversations that already had a turn - only a conversation's first
+# question is context-free, so only those are served from or added to the cache
+started_conversations = set()
+
+def cached_answer(user_message, conversation_id):
+    """Answer from the cache for a conversation's first question, else None"""
+    first_turn = conversation_id not in started_conversations
+    started_conversations.add(conversation_id)
+    if not ANSWER_CACHE or not first_turn:
+        return None
+    answer = ANSWER_CACHE.get(user_message)
+    if answer is not None and not OFFLINE_LLM:
+        # Keep the exchange in the conversation so follow-ups have context
+        try:
+            openai_client.conversations.items.create(conversation_id, items=[
+                {"type": "message", "role": "user", "content": user_message},
+                {"type": "message", "role": "assistant", "content": answer},
+            ])
+        except Exception as e:
+            if not QUIET:
+                print(f"  [Cache] Could not add cached turn to conversation: {e}")
+    return answer
+
+def store_answer(user_message, answer, first_turn):
+    if ANSWER_CACHE and first_turn and answer:
+        ANSWER_CACHE.put(user_message, answer)
+
+# ============================================================================
+# Context Compaction (--compact-threshold)
+# ============================================================================
 
-# Get OpenAI client
-openai_client = project_client.get_openai_client()
+COMPACTOR = None
+if args.compact_threshold > 0:
+    if CASSETTE:
+        print("WARNING: --compact-threshold is ignored with --record/--replay")
+    else:
+        from context_compaction import ContextCompactor
+        COMPACTOR = ContextCompactor(openai_client, args.compact_threshold, args.compact_keep_turns)
+        print(f"Context compaction: over {args.compact_threshold} input tokens "
+              f"(keeping {COMPACTOR.keep_recent_turns} recent turns verbatim)")
+
+def finish_compaction_turn(session_id, turn, answer, context_tokens):
+    """Record the turn, report context growth and compact if over the threshold"""
+    turn.answer = answer
+    COMPACTOR.record_turn(session_id, context_tokens)
+    new_id = COMPACTOR.maybe_compact(session_id)
+    if QUIET:
+        return
+    tokens, delta = COMPACTOR.growth(session_id)
+    change = f" ({delta:+d} since last turn)" if delta is not None else ""
+    print(f"\n  [Context] {tokens} input tokens at turn start{change}")
+    if new_id:
+        print(f"  [Context] Compacted into a new conversation ({new_id})")
 
-# Create a conversation
-conversation = openai_client.conversations.create()
 print("-" * 60)
 
 # ============================================================================
 # Chat Function
 # ============================================================================
 
-def chat(user_message):
-    """Send a message and handle function calls"""
-    
-    # Build input with conversation context
-    response = openai_client.responses.create(
-        model=MODEL,
-        input=user_message,
-        instructions=INSTRUCTIONS,
-        tools=TOOLS,
-        conversation={'id': conversation.id}
+def trace_usage(llm_span, response):
+    """Copy token usage from a response onto its span"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None)
+    llm_span.set_attributes(
+        input_tokens=getattr(usage, "input_tokens", 0) or 0,
+        output_tokens=getattr(usage, "output_tokens", 0) or 0,
+        cached_tokens=getattr(details, "cached_tokens", 0) or 0,
     )
+
+def request_options(final=False):
+    """Per-request responses.create options: timeout from the turn deadline, no tools on the final call"""
+    options = {}
+    timeout = time_left()
+    if timeout is not None:
+        options["timeout"] = timeout
+    if final:
+        options["tool_choice"] = "none"
+    return options
+
+def log_route(route, model, elapsed, response, metrics=None):
+    """Record which deployment served a call (when routing is on)"""
+    if not ROUTER.enabled:
+        return
+    entry = ROUTER.record(route, model, elapsed, response)
+    record_route(metrics, entry)
+    if not QUIET:
+        print(f"  [Route] {route} -> {model} ({entry['ms']:.0f} ms, {entry['tool_calls']} tool calls)")
+
+def agent_request(request_input, conversation_id, model, final=False, **options):
+    """responses.create arguments: the agent (reference or frozen definition), input, conversation"""
+    return dict(AGENT_REQUEST.kwargs(model), input=request_input, conversation={'id': conversation_id},
+                **request_options(final), **options)
+
+def request_stats_line(calls, request_bytes, input_tokens, cached):
+    """One-line per-turn report of what was sent and how much of it hit the prompt cache"""
+    return (f"  [Requests] {calls} LLM call(s), {request_bytes / 1024:.1f} KB sent, "
+            f"{cached:,} of {input_tokens:,} input tokens cached")
+
+def create_response(request_input, conversation_id, metrics=None, final=False):
+    """Call responses.create for the agent, recording round-trip time, tokens and request size"""
+    route, model = ROUTER.route(request_input, final)
+    request = agent_request(request_input, conversation_id, model, final)
+    start = time.perf_counter()
+    with span("llm.responses.create", model=model, route=route, final=final) as llm_span:
+        response = openai_client.responses.create(**request)
+        trace_usage(llm_span, response)
+        request_bytes, _ = AGENT_REQUEST.record(request, response)
+        llm_span.set_attributes(request_bytes=request_bytes, agent_reference="extra_body" in request)
+    elapsed = time.perf_counter() - start
+    record_llm_call(metrics, response, elapsed, request_bytes)
+    log_route(route, model, elapsed, response, metrics)
+    if COMPACTOR:
+        COMPACTOR.observe(conversation_id, response)
+    return response
+
+def chat(user_message, conversation_id=None, metrics=None):
+    """Send a message and handle function calls.
+    
+    Uses the session conversation unless `conversation_id` is given; LLM and
+    tool timings plus token usage are added to `metrics` when provided.
+    """
+    finish_warm_start()
+    turn_start = time.perf_counter()
+    session_id = conversation_id or conversation.id
+    first_turn = session_id not in started_conversations
+    # A compacted session continues in a newer conversation
+    conversation_id = COMPACTOR.resolve(session_id) if COMPACTOR else session_id
+    if COMPACTOR and metrics is None:
+        metrics = new_turn_metrics()
     
-    # Process the response
-    final_text = ""
+    with span("chat.turn", conversation_id=conversation_id, question_chars=len(user_message)) as turn_span:
+        final_text = cached_answer(user_message, session_id)
+        turn_span.set_attribute("cache_hit", final_text is not None)
+        if final_text is not None:
+            if not QUIET:
+                print("[Cached answer] ", end="")
+        else:
+            turn = COMPACTOR.start_turn(conversation_id, user_message) if COMPACTOR else None
+            with workspace_scope(WORKSPACE, session_id), BUDGET.turn() as state:
+                final_text = run_agent_loop(user_message, conversation_id, metrics, turn)
+            # An answer cut short by the turn budget is not worth replaying
+            if not (state.stopped or state.partial):
+                store_answer(user_message, final_text, first_turn)
+            turn_span.set_attribute("tool_rounds", state.rounds)
+            if state.stopped or state.partial:
+                turn_span.set_attribute("budget_stop", "partial" if state.partial else state.stopped)
+            if COMPACTOR:
+                finish_compaction_turn(session_id, turn, final_text, metrics["context_tokens"])
+        turn_span.set_attribute("answer_chars", len(final_text))
+    
+    if TRACE and not QUIET:
+        print_trace_summary(turn_span)
+    note_first_answer(time.perf_counter() - turn_start)
+    return final_text
+
+def run_agent_loop(user_message, conversation_id, metrics=None, turn=None):
+    """Run responses.create / tool rounds until the model stops calling tools"""
+    # Search for the question while the model decides what to do
+    prefetch = PREFETCHER.start(user_message) if PREFETCHER else None
+    try:
+        return agent_rounds(user_message, conversation_id, metrics, prefetch, turn)
+    finally:
+        if PREFETCHER:
+            PREFETCHER.finish(prefetch)
+
+def agent_rounds(user_message, conversation_id, metrics=None, prefetch=None, turn=None):
+    """The responses.create / tool call rounds of one turn.
+    
+    Function calls and outputs are added to `turn` (a compaction transcript)
+    when given. Once the turn's deadline or tool-round budget is used up the
+    model gets one last request without tools; if that fails too, the text
+    so far is returned as a partial answer.
+    """
+    rounds = ToolRounds(BUDGET, current_turn())
+    request_input = user_message  # Conversation context comes from conversation_id
     
     while True:
-        # Check for function calls in output
-        function_calls = []
-        for item in response.output:
-            if hasattr(item, 'type'):
-                if item.type == 'function_call':
-                    function_calls.append(item)
-                elif item.type == 'message':
-                    # Extract text from message
-                    for content in item.content:
-                        if hasattr(content, 'text'):
-                            final_text += content.text + "\n"
+        try:
+            response = create_response(request_input, conversation_id, metrics, rounds.final)
+        except Exception:
+            if not rounds.recoverable():
+                raise
+            return rounds.partial()
         
+        function_calls = rounds.read(response)
         if not function_calls:
             break
         
-        # Handle function calls
-        tool_outputs = []
-        for fc in function_calls:
-            args = json.loads(fc.arguments)
-            
-            if fc.name == "execute_sql":
-                sql_query = args.get("sql_query", "")
-                
-                print(f"\n  [SQL Tool] Executing query:")
-                # Print full query with indentation
-                for line in sql_query.strip().split('\n'):
-                    print(f"    {line}")
-                
-                result = execute_sql(sql_query)
-                
-                tool_outputs.append({
-                    "type": "function_call_output",
-                    "call_id": fc.call_id,
-                    "output": result
-                })
-                
-            elif fc.name == "search_documents":
-                query = args.get("query", "")
-                top = args.get("top", 3)
-                
-                print(f"\n  [Search Tool] Searching for: {query}...")
+        # Handle function calls (concurrently, outputs kept in call order)
+        tool_outputs = run_tool_calls(function_calls, metrics, prefetch)
+        if turn:
+            turn.add_calls(function_calls, tool_outputs)
+        
+        # Submit function results and continue conversation
+        request_input = rounds.next_input(tool_outputs)
+        if rounds.final and not QUIET:
+            print(f"\n  [Budget] Tool {rounds.state.stopped} budget used up - asking for the final answer")
+    
+    return rounds.answer()
+
+def chat_stream(user_message):
+    """Streaming variant of chat().
+    
+    Prints text deltas as they arrive and starts each tool as soon as its
+    function-call arguments are complete, while the rest of the response is
+    still streaming. Reports time-to-first-token and time-to-first-tool-call.
+    """
+    finish_warm_start()
+    turn_start = time.perf_counter()
+    first_turn = conversation.id not in started_conversations
+    conversation_id = COMPACTOR.resolve(conversation.id) if COMPACTOR else conversation.id
+    cached = cached_answer(user_message, conversation.id)
+    if cached is not None:
+        print(f"[Cached answer] {cached}")
+        print(f"\n  [Timing] turn: {(time.perf_counter() - turn_start) * 1000:.0f} ms (answer cache)")
+        return cached
+    
+    # Only turns the agent actually answers go into the compaction transcript
+    turn = COMPACTOR.start_turn(conversation_id, user_message) if COMPACTOR else None
+    context_tokens = None
+    first_token = None
+    first_tool_call = None
+    sent = {"calls": 0, "bytes": 0, "input_tokens": 0, "cached": 0}
+    request_input = user_message
+    resume_prefix = False
+    
+    with span("chat.turn", conversation_id=conversation_id, question_chars=len(user_message),
+              stream=True) as turn_span, workspace_scope(WORKSPACE, conversation.id), BUDGET.turn() as state:
+        rounds = ToolRounds(BUDGET, state)
+        prefetch = PREFETCHER.start(user_message) if PREFETCHER else None
+        try:
+            while True:
+                pending = []
+                wall_start = None
                 
-                result = search_documents(query, top)
+                route, model = ROUTER.route(request_input, rounds.final)
+                call_start = time.perf_counter()
+                with span("llm.responses.create", model=model, route=route, stream=True,
+                          final=rounds.final) as llm_span:
+                    try:
+                        request = agent_request(request_input, conversation_id, model, rounds.final, stream=True)
+                        stream = openai_client.responses.create(**request)
+                        
+                        for event in stream:
+                            if event.type == "response.output_text.delta":
+                                if first_token is None:
+                                    first_token = time.perf_counter() - turn_start
+                                if resume_prefix:
+                                    # Answer continues after tool output was printed
+                                    print("\nAgent: ", end="")
+                                    resume_prefix = False
+                                print(event.delta, end="", flush=True)
+                                rounds.text += event.delta
+                            elif event.type == "response.output_item.done":
+                                if event.item.type == "function_call":
+                                    if first_tool_call is None:
+                                        first_tool_call = time.perf_counter() - turn_start
+                                    if wall_start is None:
+                                        wall_start = time.perf_counter()
+                                    pending.append((event.item, submit_tool_call(event.item, prefetch)))
+                                elif event.item.type == "message":
+                                    rounds.text += "\n"
+                            elif event.type == "response.completed":
+                                trace_usage(llm_span, event.response)
+                                request_bytes, cached = AGENT_REQUEST.record(request, event.response)
+                                llm_span.set_attributes(request_bytes=request_bytes,
+                                                        agent_reference="extra_body" in request)
+                                usage = getattr(event.response, "usage", None)
+                                sent["calls"] += 1
+                                sent["bytes"] += request_bytes
+                                sent["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+                                sent["cached"] += cached
+                                log_route(route, model, time.perf_counter() - call_start, event.response)
+                                if COMPACTOR:
+                                    COMPACTOR.observe(conversation_id, event.response)
+                                    if context_tokens is None:
+                                        usage = getattr(event.response, "usage", None)
+                                        context_tokens = getattr(usage, "input_tokens", 0) or 0
+                    except Exception:
+                        if not rounds.recoverable():
+                            raise
+                        rounds.text = rounds.partial()
+                        print(f"\n{PARTIAL_NOTE}")
+                        break
                 
-                # Show the result that goes to the agent
-                print(f"  [Search Result]:")
-                # Truncate if too long, but show meaningful content
-                display = result[:500] if len(result) > 500 else result
-                for line in display.strip().split('\n'):
-                    print(f"    {line}")
-                if len(result) > 500:
-                    print(f"    ... ({len(result)} chars total)")
+                if not pending or rounds.final:
+                    break
                 
-                tool_outputs.append({
-                    "type": "function_call_output",
-                    "call_id": fc.call_id,
-                    "output": result
-                })
-            else:
-                tool_outputs.append({
-                    "type": "function_call_output",
-                    "call_id": fc.call_id,
-                    "output": f"Unknown function: {fc.name}"
-                })
+                tool_outputs = collect_tool_outputs(pending, wall_start)
+                if turn:
+                    turn.add_calls([fc for fc, _ in pending], tool_outputs)
+                resume_prefix = True
+                request_input = rounds.next_input(tool_outputs)
+
+        finally:
+            # Also when the stream raises mid-turn (breaker open, budget timeout)
+            if PREFETCHER:
+                PREFETCHER.finish(prefetch)
         
-        # Submit function results and continue conversation
-        response = openai_client.responses.create(
-            model=MODEL,
-            input=tool_outputs,
-            instructions=INSTRUCTIONS,
-            tools=TOOLS,
-            conversation={'id': conversation.id}
-        )
+        if first_token is not None:
+            turn_span.set_attribute("first_token_ms", round(first_token * 1000, 1))
+        if first_tool_call is not None:
+            turn_span.set_attribute("first_tool_call_ms", round(first_tool_call * 1000, 1))
+    
+    total = time.perf_counter() - turn_start
+    ttft = f"{first_token * 1000:.0f} ms" if first_token is not None else "n/a"
+    ttfc = f"{first_tool_call * 1000:.0f} ms" if first_tool_call is not None else "n/a"
+    print(f"\n\n  [Timing] first token: {ttft} | first tool call: {ttfc} | turn: {total * 1000:.0f} ms")
+    print(request_stats_line(sent["calls"], sent["bytes"], sent["input_tokens"], sent["cached"]))
+    if TRACE:
+        print_trace_summary(turn_span)
+    
+    if not (state.stopped or state.partial):
+        store_answer(user_message, rounds.answer(), first_turn)
+    if COMPACTOR:
+        finish_compaction_turn(conversation.id, turn, rounds.answer(), context_tokens or 0)
+    note_first_answer(total)
+    return rounds.answer()
+
+# ============================================================================
+# Load Test (--load-test)
+# ============================================================================
+
+if LOAD_TEST:
+    from agent_eval import run_load_test, summarize_load, print_load_summary
+    
+    if not sample_question_items:
+        print(f"ERROR: No questions found in {questions_path}")
+        sys.exit(1)
+    
+    print(f"Load testing: {LOAD_TEST} sessions x {args.load_turns} turns "
+          f"(tool workers: {TOOL_WORKERS})...")
+    records, wall_seconds = run_load_test(
+        sample_question_items,
+        start_session=lambda: openai_client.conversations.create().id,
+        run_turn=lambda conversation_id, question, metrics: chat(question, conversation_id, metrics),
+        sessions=LOAD_TEST,
+        turns=max(1, args.load_turns),
+    )
+    load_summary = summarize_load(records, wall_seconds, LOAD_TEST)
+    print_load_summary(load_summary)
+    if EMULATOR == "local":
+        print(f"  Emulator requests: {emulator.stats.counts}")
+    if PREFETCHER:
+        print(f"  Search prefetch: {PREFETCHER.summary()}")
+    if ANSWER_CACHE:
+        print(f"  Answer cache: {ANSWER_CACHE.summary()}")
+    if COMPACTOR:
+        print(f"  Context compaction: {COMPACTOR.summary()}")
+    if WORKSPACE:
+        print(f"  Result workspace: {WORKSPACE.summary()}")
+    if SQL_VALIDATOR:
+        print(f"  SQL validation: {SQL_VALIDATOR.summary()}")
+    if METADATA:
+        print(f"  Schema metadata: {METADATA.summary()}")
+    if BUDGET.enabled:
+        print(f"  Turn budget: {BUDGET.summary()}")
+    if ROUTER.enabled:
+        for key, stats in ROUTER.summary().items():
+            print(f"  Route {key}: {stats}")
+    print(f"  Agent requests: {AGENT_REQUEST.summary()}")
+    if METRICS:
+        print(f"  Metric layer: {METRICS.summary()}")
+    if VALUES:
+        print(f"  Value index: {VALUES.summary()}")
+    for name, stats in breaker_summary().items():
+        print(f"  Breaker ({name}): {stats}")
+    if SEARCH_HEDGER:
+        print(f"  Search hedging: {SEARCH_HEDGER.summary()}")
     
-    return final_text.strip()
+    errors = [r["error"] for r in records if r["error"]]
+    if errors:
+        print(f"  First error: {errors[0]}")
+    tool_pool.shutdown(wait=False)
+    sys.exit(1 if errors else 0)
+
+# ============================================================================
+# Batch Evaluation (--eval)
+# ============================================================================
+
+if EVAL_MODE:
+    from agent_eval import (run_evaluation, summarize, write_results,
+                            print_summary, default_output_prefix,
+                            load_records, compare_runs, print_comparison)
+    
+    if not sample_question_items:
+        print(f"ERROR: No questions found in {questions_path}")
+        sys.exit(1)
+    if args.eval_baseline and not os.path.exists(args.eval_baseline):
+        print(f"ERROR: Baseline results not found: {args.eval_baseline}")
+        sys.exit(1)
+    
+    def eval_question(question, metrics):
+        """Answer one question in its own conversation"""
+        eval_conversation = openai_client.conversations.create()
+        return eval_conversation.id, chat(question, eval_conversation.id, metrics)
+    
+    def eval_progress(record):
+        status = f"ERROR: {record['error']}" if record["error"] else f"{record['latency_ms']:.0f} ms"
+        print(f"  [{record['section']}] {record['question'][:60]} -> {status} "
+              f"({record['llm_calls']} LLM, {record['tool_calls']} tools)")
+    
+    print(f"Evaluating {len(sample_question_items)} questions "
+          f"(concurrency {max(1, args.eval_concurrency)})...\n")
+    eval_start = time.perf_counter()
+    records = run_evaluation(sample_question_items, eval_question,
+                             args.eval_concurrency, on_result=eval_progress)
+    summary = summarize(records)
+    summary["wall_clock_ms"] = round((time.perf_counter() - eval_start) * 1000, 1)
+    summary["concurrency"] = max(1, args.eval_concurrency)
+    summary["model"] = MODEL
+    summary["startup"] = STARTUP
+    summary["agent_requests"] = AGENT_REQUEST.summary()
+    if ROUTER.enabled:
+        summary["model_routing"] = ROUTER.summary()
+    summary["agent_id"] = AGENT_ID
+    summary["sql_format"] = SQL_FORMAT
+    summary["search_format"] = SEARCH_FORMAT
+    summary["tool_token_budget"] = TOOL_TOKEN_BUDGET
+    if PREFETCHER:
+        summary["prefetch"] = PREFETCHER.summary()
+    if ANSWER_CACHE:
+        summary["answer_cache"] = ANSWER_CACHE.summary()
+    if WORKSPACE:
+        summary["result_workspace"] = WORKSPACE.summary()
+    if SQL_VALIDATOR:
+        summary["sql_validation"] = SQL_VALIDATOR.summary()
+    if METADATA:
+        summary["schema_metadata"] = METADATA.summary()
+    if METRICS:
+        summary["metric_layer"] = METRICS.summary()
+    if VALUES:
+        summary["value_index"] = VALUES.summary()
+    if BUDGET.enabled:
+        summary["turn_budget"] = BUDGET.summary()
+    if SQL_BREAKER or SEARCH_BREAKER:
+        summary["circuit_breakers"] = breaker_summary()
+    if SEARCH_HEDGER:
+        summary["search_hedging"] = SEARCH_HEDGER.summary()
+    
+    print_summary(summary)
+    if PREFETCHER:
+        print(f"  Search prefetch: {summary['prefetch']}")
+    if ANSWER_CACHE:
+        print(f"  Answer cache: {summary['answer_cache']}")
+    if WORKSPACE:
+        print(f"  Result workspace: {summary['result_workspace']}")
+    if SQL_VALIDATOR:
+        print(f"  SQL validation: {summary['sql_validation']}")
+    if METADATA:
+        print(f"  Schema metadata: {summary['schema_metadata']}")
+    if METRICS:
+        print(f"  Metric layer: {summary['metric_layer']}")
+    if VALUES:
+        print(f"  Value index: {summary['value_index']}")
+    if ROUTER.enabled:
+        for key, stats in summary["model_routing"].items():
+            print(f"  Route {key}: {stats}")
+    print(f"  Agent requests: {summary['agent_requests']}")
+    if args.eval_baseline:
+        summary["baseline"] = args.eval_baseline
+        summary["comparison"] = compare_runs(load_records(args.eval_baseline), records)
+        print_comparison(summary["comparison"])
+    if CASSETTE:
+        CASSETTE.save()
+        print(f"  Cassette: {CASSETTE.stats()}")
+    output_prefix = args.eval_output or default_output_prefix(data_dir)
+    for path in write_results(records, summary, output_prefix):
+        print(f"[OK] Saved {path}")
+    
+    tool_pool.shutdown(wait=False)
+    sys.exit(1 if summary["errors"] else 0)
 
 # ============================================================================
 # Chat Loop
 # ============================================================================
 
 print("-" * 60)
+STARTUP["prompt_ready_s"] = round(time.perf_counter() - PROCESS_START, 3)
 
 while True:
     try:
@@ -400,21 +1508,63 @@ while True:
         break
     
     if user_input.lower() == "help":
-        print("\nSample questions (that may use BOTH tools):")
+        print("\nSample questions:")
         for q in sample_questions:
             print(f"  - {q}")
         continue
     
+    finish_warm_start()
     print("\nAgent: ", end="", flush=True)
     
     try:
-        response = chat(user_input)
+        if STREAM:
+            if not chat_stream(user_input):
+                print("(No response)")
+            continue
+        
+        metrics = new_turn_metrics()
+        response = chat(user_input, metrics=metrics)
         if response:
             print(response)
         else:
             print("(No response)")
+        if metrics["llm_calls"]:
+            print(request_stats_line(metrics["llm_calls"], metrics["request_bytes"],
+                                     metrics["input_tokens"], metrics["cached_tokens"]))
     except Exception as e:
         print(f"Error: {e}")
+    
+    if CASSETTE:
+        CASSETTE.save()
 
 # Cleanup
+if CASSETTE:
+    CASSETTE.save()
+    print(f"\nCassette {CASSETTE.mode}: {CASSETTE.stats()}")
+if PREFETCHER:
+    print(f"\nSearch prefetch: {PREFETCHER.summary()}")
+if ANSWER_CACHE:
+    print(f"\nAnswer cache: {ANSWER_CACHE.summary()}")
+if COMPACTOR:
+    print(f"\nContext compaction: {COMPACTOR.summary()}")
+if WORKSPACE:
+    print(f"\nResult workspace: {WORKSPACE.summary()}")
+if SQL_VALIDATOR:
+    print(f"\nSQL validation: {SQL_VALIDATOR.summary()}")
+if METADATA:
+    print(f"\nSchema metadata: {METADATA.summary()}")
+if METRICS:
+    print(f"\nMetric layer: {METRICS.summary()}")
+if VALUES:
+    print(f"\nValue index: {VALUES.summary()}")
+if BUDGET.enabled:
+    print(f"\nTurn budget: {BUDGET.summary()}")
+if ROUTER.enabled:
+    print(f"\nModel routing: {ROUTER.summary()}")
+print(f"\nAgent requests: {AGENT_REQUEST.summary()}")
+for name, stats in breaker_summary().items():
+    print(f"\nBreaker ({name}): {stats}")
+if SEARCH_HEDGER:
+    print(f"\nSearch hedging: {SEARCH_HEDGER.summary()}")
+tool_pool.shutdown(wait=False)
 print("\nGoodbye!")
@@ -0,0 +1,463 @@
+"""
+Batch evaluation and latency harness for the Foundry agent.
+
+Runs every question from config/sample_questions.txt through the agent loop,
+each in its own conversation, and records per-question latency, LLM round
+trips, tool calls and token usage. Results are written as JSONL + CSV with a
+p50/p95/p99 summary so agent performance can be compared between releases.
+
+Also drives load tests: N concurrent simulated sessions, several turns each,
+reporting throughput and tail latency (typically against the local
+Responses emulator in responses_emulator.py).
+
+A run can be compared with an earlier one (e.g. single model vs. model
+routing): per-question latency deltas and how well the answers agree with
+the baseline's (shared content words and numbers - there is no ground truth
+to score against).
+
+Used by 08_test_foundry_agent.py:
+    python 08_test_foundry_agent.py --eval
+    python 08_test_foundry_agent.py --eval --eval-concurrency 4 --eval-output eval/run1
+    python 08_test_foundry_agent.py --eval --planner-model gpt-4o-mini --eval-baseline eval/run1.jsonl
+    python 08_test_foundry_agent.py --emulator --load-test 20 --load-turns 3
+"""
+
+import os
+import re
+import csv
+import json
+import math
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Numeric record fields summarized with percentiles
+SUMMARY_FIELDS = [
+    "latency_ms",
+    "llm_calls",
+    "llm_ms",
+    "context_tokens",
+    "tool_calls",
+    "tool_ms",
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+    "cached_tokens",
+    "request_bytes",
+]
+
+# CSV column order (tool details are flattened into one column)
+CSV_FIELDS = ["section", "question", "conversation_id", "error"] + SUMMARY_FIELDS + ["tools", "routes", "answer"]
+
+
+# ============================================================================
+# Questions
+# ============================================================================
+
+def load_sample_questions(path):
+    """Parse sample_questions.txt into [{"section", "question"}, ...].
+
+    Section headers look like "=== SQL QUESTIONS (Fabric Data) ===" and are
+    reduced to their first word (SQL, DOCUMENT, COMBINED). Questions are the
+    "- " lines below each header.
+    """
+    questions = []
+    section = "GENERAL"
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            header = re.match(r"^=+\s*(.*?)\s*=+$", line)
+            if header:
+                words = header.group(1).split()
+                section = words[0].upper() if words else "GENERAL"
+            elif line.startswith("- "):
+                questions.append({"section": section, "question": line[2:].strip()})
+    return questions
+
+
+# ============================================================================
+# Metrics
+# ============================================================================
+
+def new_turn_metrics():
+    """Empty metrics dict filled in by the agent loop during one user turn."""
+    return {
+        "llm_calls": 0,
+        "llm_ms": 0.0,
+        "context_tokens": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "cached_tokens": 0,
+        "request_bytes": 0,
+        "tools": [],
+        "llm_routes": [],
+    }
+
+
+def record_llm_call(metrics, response, elapsed, request_bytes=0):
+    """Add one responses.create round trip (and its token usage) to metrics.
+
+    The input tokens of a turn's first call are kept as `context_tokens` -
+    the size of the conversation context the turn started with.
+    `request_bytes` is the size of the request body, when the caller knows it.
+    """
+    if metrics is None:
+        return
+    usage = getattr(response, "usage", None)
+    if usage is not None and metrics["llm_calls"] == 0:
+        metrics["context_tokens"] = getattr(usage, "input_tokens", 0) or 0
+    metrics["llm_calls"] += 1
+    metrics["llm_ms"] += elapsed * 1000
+    if usage is not None:
+        metrics["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+        metrics["output_tokens"] += getattr(usage, "output_tokens", 0) or 0
+        metrics["total_tokens"] += getattr(usage, "total_tokens", 0) or 0
+        details = getattr(usage, "input_tokens_details", None)
+        metrics["cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
+    metrics["request_bytes"] += request_bytes
+
+
+def record_tool_call(metrics, name, elapsed):
+    """Add one tool execution to metrics."""
+    if metrics is None:
+        return
+    metrics["tools"].append({"name": name, "ms": round(elapsed * 1000, 1)})
+
+
+def record_route(metrics, entry):
+    """Add one model routing decision (see model_routing.ModelRouter.record) to metrics."""
+    if metrics is None:
+        return
+    metrics["llm_routes"].append(entry)
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def describe(values):
+    """count/mean/p50/p95/p99/max for a list of numbers."""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1),
+        "p50": round(percentile(values, 50), 1),
+        "p95": round(percentile(values, 95), 1),
+        "p99": round(percentile(values, 99), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def summarize(records):
+    """Percentile summary over all records, overall and per section."""
+    ok = [r for r in records if not r.get("error")]
+    summary = {
+        "questions": len(records),
+        "errors": len(records) - len(ok),
+        "overall": {field: describe([r[field] for r in ok]) for field in SUMMARY_FIELDS},
+        "sections": {},
+    }
+    for section in sorted({r["section"] for r in records}):
+        rows = [r for r in ok if r["section"] == section]
+        summary["sections"][section] = {
+            "questions": sum(1 for r in records if r["section"] == section),
+            "latency_ms": describe([r["latency_ms"] for r in rows]),
+        }
+    return summary
+
+
+# ============================================================================
+# Running
+# ============================================================================
+
+def run_evaluation(questions, run_question, concurrency=1, on_result=None):
+    """Run every question through `run_question` with bounded concurrency.
+
+    `run_question(question, metrics)` must answer the question in a fresh
+    conversation, fill `metrics` (see new_turn_metrics) and return
+    (conversation_id, answer). Records are returned in question order.
+    """
+    def run_one(item):
+        metrics = new_turn_metrics()
+        record = {"section": item["section"], "question": item["question"],
+                  "conversation_id": None, "answer": "", "error": ""}
+        start = time.perf_counter()
+        try:
+            record["conversation_id"], record["answer"] = run_question(item["question"], metrics)
+        except Exception as e:
+            record["error"] = str(e)
+        record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        record["llm_calls"] = metrics["llm_calls"]
+        record["llm_ms"] = round(metrics["llm_ms"], 1)
+        record["context_tokens"] = metrics["context_tokens"]
+        record["input_tokens"] = metrics["input_tokens"]
+        record["output_tokens"] = metrics["output_tokens"]
+        record["total_tokens"] = metrics["total_tokens"]
+        record["cached_tokens"] = metrics["cached_tokens"]
+        record["request_bytes"] = metrics["request_bytes"]
+        record["tools"] = metrics["tools"]
+        record["tool_calls"] = len(metrics["tools"])
+        record["tool_ms"] = round(sum(t["ms"] for t in metrics["tools"]), 1)
+        if metrics["llm_routes"]:
+            record["llm_routes"] = metrics["llm_routes"]
+        if on_result:
+            on_result(record)
+        return record
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="eval") as pool:
+        return list(pool.map(run_one, questions))
+
+
+def default_output_prefix(data_dir):
+    """data/<folder>/eval/eval_<timestamp>"""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(data_dir, "eval", f"eval_{stamp}")
+
+
+def write_results(records, summary, output_prefix):
+    """Write <prefix>.jsonl, <prefix>.csv and <prefix>_summary.json."""
+    out_dir = os.path.dirname(os.path.abspath(output_prefix))
+    os.makedirs(out_dir, exist_ok=True)
+
+    jsonl_path = f"{output_prefix}.jsonl"
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+    csv_path = f"{output_prefix}.csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for record in records:
+            row = dict(record)
+            row["tools"] = ";".join(f"{t['name']}:{t['ms']}" for t in record["tools"])
+            row["routes"] = ";".join(f"{r['route']}:{r['model']}:{r['ms']}" for r in record.get("llm_routes", []))
+            writer.writerow(row)
+
+    summary_path = f"{output_prefix}_summary.json"
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    return jsonl_path, csv_path, summary_path
+
+
+def print_summary(summary):
+    """Print the percentile table for an evaluation run."""
+    print(f"\n{'='*60}")
+    print(f"Evaluation Summary ({summary['questions']} questions, {summary['errors']} errors)")
+    print(f"{'='*60}")
+    print(f"  {'metric':<16}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for field, stats in summary["overall"].items():
+        if not stats.get("count"):
+            continue
+        print(f"  {field:<16}" + "".join(f"{stats[k]:>10}" for k in ("mean", "p50", "p95", "p99", "max")))
+
+    print("\n  Latency by section (ms):")
+    for section, info in summary["sections"].items():
+        stats = info["latency_ms"]
+        if stats.get("count"):
+            print(f"    {section:<12} n={info['questions']:<4} p50={stats['p50']:<10} "
+                  f"p95={stats['p95']:<10} p99={stats['p99']}")
+        else:
+            print(f"    {section:<12} n={info['questions']:<4} (all failed)")
+
+
+# ============================================================================
+# Comparing Runs
+# ============================================================================
+
+def load_records(path):
+    """Records of an earlier run from its <prefix>.jsonl."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def answer_terms(text):
+    """Lowercased words and numbers of an answer (thousands separators dropped)."""
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", (text or "").lower())
+    return set(re.findall(r"[a-z][a-z0-9_]+|\d+(?:\.\d+)?", text))
+
+
+def answer_agreement(answer, baseline):
+    """(term overlap, share of the baseline's numbers also in the answer); None when not comparable."""
+    terms, base_terms = answer_terms(answer), answer_terms(baseline)
+    if not terms or not base_terms:
+        return None, None
+    overlap = len(terms & base_terms) / len(terms | base_terms)
+    numbers = {t for t in base_terms if t[0].isdigit()}
+    number_recall = len(numbers & terms) / len(numbers) if numbers else None
+    return round(overlap, 3), None if number_recall is None else round(number_recall, 3)
+
+
+def field_delta(record, base, field):
+    """record[field] - base[field], or None when a run predates the field."""
+    if record.get(field) is None or base.get(field) is None:
+        return None
+    return record[field] - base[field]
+
+
+def compare_runs(baseline, records):
+    """Latency and answer agreement of `records` against a baseline run, matched by question."""
+    by_question = {r["question"]: r for r in baseline if not r.get("error")}
+    rows = []
+    for record in records:
+        base = by_question.get(record["question"])
+        if base is None or record.get("error"):
+            continue
+        overlap, number_recall = answer_agreement(record.get("answer"), base.get("answer"))
+        rows.append({
+            "section": record["section"],
+            "question": record["question"],
+            "latency_ms": record["latency_ms"],
+            "baseline_latency_ms": base["latency_ms"],
+            "latency_delta_ms": round(record["latency_ms"] - base["latency_ms"], 1),
+            "llm_ms_delta": round(record["llm_ms"] - base["llm_ms"], 1),
+            "total_tokens_delta": record["total_tokens"] - base["total_tokens"],
+            "cached_tokens_delta": field_delta(record, base, "cached_tokens"),
+            "request_bytes_delta": field_delta(record, base, "request_bytes"),
+            "answer_overlap": overlap,
+            "number_recall": number_recall,
+        })
+
+    def mean(field):
+        values = [r[field] for r in rows if r[field] is not None]
+        return round(sum(values) / len(values), 3) if values else None
+
+    return {
+        "matched": len(rows),
+        "latency_ms": describe([r["latency_ms"] for r in rows]),
+        "baseline_latency_ms": describe([r["baseline_latency_ms"] for r in rows]),
+        "mean_latency_delta_ms": mean("latency_delta_ms"),
+        "mean_llm_ms_delta": mean("llm_ms_delta"),
+        "mean_total_tokens_delta": mean("total_tokens_delta"),
+        "mean_cached_tokens_delta": mean("cached_tokens_delta"),
+        "mean_request_bytes_delta": mean("request_bytes_delta"),
+        "mean_answer_overlap": mean("answer_overlap"),
+        "mean_number_recall": mean("number_recall"),
+        "low_agreement": [r["question"] for r in rows
+                          if r["answer_overlap"] is not None and r["answer_overlap"] < 0.3],
+        "questions": rows,
+    }
+
+
+def print_comparison(comparison):
+    """Print the baseline comparison of an evaluation run."""
+    print(f"\n  Compared with baseline ({comparison['matched']} matching questions):")
+    if not comparison["matched"]:
+        return
+    for field in ("latency_ms", "baseline_latency_ms"):
+        stats = comparison[field]
+        print(f"    {field:<20} p50={stats['p50']:<10} p95={stats['p95']:<10} mean={stats['mean']}")
+    print(f"    mean deltas          latency {comparison['mean_latency_delta_ms']} ms, "
+          f"LLM {comparison['mean_llm_ms_delta']} ms, tokens {comparison['mean_total_tokens_delta']}")
+    if comparison["mean_request_bytes_delta"] is not None:
+        print(f"    request deltas       {comparison['mean_request_bytes_delta']} bytes sent, "
+              f"{comparison['mean_cached_tokens_delta']} cached tokens")
+    print(f"    answer agreement     overlap {comparison['mean_answer_overlap']}, "
+          f"numbers {comparison['mean_number_recall']}")
+    for question in comparison["low_agreement"]:
+        print(f"    low agreement: {question[:80]}")
+
+
+# ============================================================================
+# Load Testing
+# ============================================================================
+
+def run_load_test(questions, start_session, run_turn, sessions=10, turns=3):
+    """Drive `sessions` concurrent simulated users through the agent loop.
+
+    Each session opens its own conversation via `start_session()` and asks
+    `turns` questions (round-robin over `questions`) one after another with
+    `run_turn(conversation_id, question, metrics)`. Returns (records,
+    wall_seconds) with one record per turn.
+    """
+    def session(index):
+        records = []
+        try:
+            conversation_id = start_session()
+        except Exception as e:
+            return [{"session": index, "turn": 0, "section": "", "question": "", "error": str(e),
+                     "latency_ms": 0.0, "llm_calls": 0, "llm_ms": 0.0, "context_tokens": 0,
+                     "tool_calls": 0, "tool_ms": 0.0}]
+        for turn in range(turns):
+            item = questions[(index * turns + turn) % len(questions)]
+            metrics = new_turn_metrics()
+            record = {"session": index, "turn": turn, "section": item["section"],
+                      "question": item["question"], "error": ""}
+            start = time.perf_counter()
+            try:
+                run_turn(conversation_id, item["question"], metrics)
+            except Exception as e:
+                record["error"] = str(e)
+            record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            record["llm_calls"] = metrics["llm_calls"]
+            record["llm_ms"] = round(metrics["llm_ms"], 1)
+            record["context_tokens"] = metrics["context_tokens"]
+            record["tool_calls"] = len(metrics["tools"])
+            record["tool_ms"] = round(sum(t["ms"] for t in metrics["tools"]), 1)
+            records.append(record)
+        return records
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, sessions), thread_name_prefix="session") as pool:
+        results = list(pool.map(session, range(max(1, sessions))))
+    wall_seconds = time.perf_counter() - start
+    return [record for records in results for record in records], wall_seconds
+
+
+def summarize_load(records, wall_seconds, sessions):
+    """Throughput and tail latency for a load test run."""
+    ok = [r for r in records if not r["error"]]
+    llm_calls = sum(r["llm_calls"] for r in ok)
+    return {
+        "sessions": sessions,
+        "turns": len(records),
+        "errors": len(records) - len(ok),
+        "wall_clock_s": round(wall_seconds, 2),
+        "turns_per_s": round(len(ok) / wall_seconds, 2) if wall_seconds else None,
+        "llm_calls_per_s": round(llm_calls / wall_seconds, 2) if wall_seconds else None,
+        "turn_latency_ms": describe([r["latency_ms"] for r in ok]),
+        "llm_ms_per_call": describe([r["llm_ms"] / r["llm_calls"] for r in ok if r["llm_calls"]]),
+        "tool_ms": describe([r["tool_ms"] for r in ok if r["tool_calls"]]),
+        "context_tokens": describe([r["context_tokens"] for r in ok if r["llm_calls"]]),
+        "context_tokens_by_turn": {
+            turn: round(sum(values) / len(values))
+            for turn, values in _group([(r["turn"], r["context_tokens"]) for r in ok if r["llm_calls"]]).items()
+        },
+    }
+
+
+def _group(pairs):
+    groups = {}
+    for key, value in pairs:
+        groups.setdefault(key, []).append(value)
+    return dict(sorted(groups.items()))
+
+
+def print_load_summary(summary):
+    """Print throughput and latency percentiles for a load test."""
+    print(f"\n{'='*60}")
+    print(f"Load Test Summary ({summary['sessions']} sessions, {summary['turns']} turns, "
+          f"{summary['errors']} errors)")
+    print(f"{'='*60}")
+    print(f"  Wall clock:  {summary['wall_clock_s']} s")
+    print(f"  Throughput:  {summary['turns_per_s']} turns/s, {summary['llm_calls_per_s']} LLM calls/s")
+    print(f"  {'metric':<18}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for field in ("turn_latency_ms", "llm_ms_per_call", "tool_ms", "context_tokens"):
+        stats = summary[field]
+        if stats.get("count"):
+            print(f"  {field:<18}" + "".join(f"{stats[k]:>10}" for k in ("mean", "p50", "p95", "p99", "max")))
+    if summary["context_tokens_by_turn"]:
+        growth = ", ".join(f"turn {t + 1}: {n}" for t, n in summary["context_tokens_by_turn"].items())
+        print(f"  Context tokens by turn (mean): {growth}")
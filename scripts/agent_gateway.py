@@ -0,0 +1,869 @@
+"""
+Agent Gateway - serve the Foundry agent to many concurrent sessions over HTTP.
+
+An asyncio HTTP server around the same agent loop as 08_test_foundry_agent.py
+(responses.create -> function calls -> function_call_output -> ..., shared
+through agent_loop.py: the same turn budget, agent reference and tools),
+using the async OpenAI / AI Search clients so one process can hold many
+turns in flight:
+
+    - Each session is one conversation with one turn at a time; a turn sent
+      while the session's previous one is still running gets HTTP 429
+    - One shared SQL connection pool and one shared async SearchClient
+    - Bounded concurrency per backend (LLM, SQL, search); excess work queues
+    - Backpressure: when the in-flight limit is reached new turns get
+      HTTP 429 with Retry-After instead of piling up
+    - Circuit breakers per backend shared by all sessions: a failing SQL
+      endpoint or search service is failed fast instead of timed out on
+      every call (see circuit_breaker.py)
+    - Every turn has a deadline and a tool-round cap (see turn_budget.py)
+
+Endpoints:
+    POST /sessions                              -> {"session_id": ...}
+    POST /chat  {"message": ..., "session_id"?} -> {"session_id", "answer", ...}
+    GET  /health                                -> limits, in-flight and counters
+
+Usage:
+    python agent_gateway.py                           # Serve on 127.0.0.1:8080
+    python agent_gateway.py --port 9000 --max-inflight 128
+    python agent_gateway.py --offline-sql             # SQL against local CSVs
+    python agent_gateway.py --emulator                # No Azure at all
+    python agent_gateway.py --hedge-search            # Second search request when the first is slow
+    python agent_gateway.py --turn-deadline 30 --max-tool-rounds 6  # Latency SLO per turn
+    python agent_gateway.py --inline-agent            # Send instructions + tools instead of an agent reference
+    python agent_gateway.py --benchmark --bench-clients 50 --bench-seconds 30
+
+--benchmark starts a local Responses emulator (see responses_emulator.py) and
+the gateway in-process, drives it with N keep-alive clients for a fixed time
+and reports sustained requests/s and latency percentiles.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import struct
+import asyncio
+import inspect
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from sql_utils import run_bounded_query, ConnectionPool, is_endpoint_failure
+from circuit_breaker import get_breaker, breaker_summary, CircuitOpen, Hedger
+from tool_formats import format_search_results
+from agent_eval import (new_turn_metrics, record_llm_call, record_tool_call,
+                        load_sample_questions, describe)
+from tracing import run_in_context
+from turn_budget import TurnBudget, time_left
+from agent_request import AgentRequest, reference_version
+from warm_start import agent_definition
+from agent_loop import (ToolRounds, ToolHandlers, LOCAL_TOOLS, has_tool, parse_arguments,
+                        function_call_output, metadata_answer, keep_result, workspace_scope,
+                        load_metric_layer, run_metric)
+
+parser = argparse.ArgumentParser(description="Async multi-session HTTP gateway for the Foundry agent")
+parser.add_argument("--agent-id", default=os.getenv("FOUNDRY_AGENT_ID"))
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8080)
+parser.add_argument("--foundry-only", action="store_true",
+                    help="Search-only mode (no Fabric/SQL)")
+parser.add_argument("--offline-sql", action="store_true",
+                    help="Run execute_sql against the local tables/ CSVs instead of Fabric")
+parser.add_argument("--emulator", nargs="?", const="local", default=None, metavar="URL",
+                    help="Use a local Responses API emulator instead of Foundry "
+                         "(starts one in-process unless a base URL is given)")
+parser.add_argument("--emulator-latency-ms", type=float, default=800.0,
+                    help="Median emulated LLM/search latency in ms (default: 800)")
+parser.add_argument("--emulator-metric-tool", action="store_true",
+                    help="Give the emulated agent the get_metric tool (like 07 --metric-tool)")
+parser.add_argument("--emulator-value-lookup", action="store_true",
+                    help="Give the emulated agent the lookup_values tool (like 07 --value-lookup)")
+parser.add_argument("--inline-agent", action="store_true",
+                    help="Send the agent's instructions and tools with every request instead of a "
+                         "reference to the stored agent")
+parser.add_argument("--turn-deadline", type=float, default=None,
+                    help="Seconds per turn; LLM and SQL calls get the time left as their "
+                         "timeout (default: $TURN_DEADLINE_SECONDS or 120; 0 = none)")
+parser.add_argument("--max-tool-rounds", type=int, default=8,
+                    help="Tool rounds per turn before the agent must answer (default: 8; 0 = no limit)")
+parser.add_argument("--max-inflight", type=int, default=64,
+                    help="Turns processed at once before new turns get 429 (default: 64)")
+parser.add_argument("--llm-concurrency", type=int, default=32,
+                    help="Concurrent responses.create calls (default: 32)")
+parser.add_argument("--sql-concurrency", type=int, default=8,
+                    help="Concurrent SQL queries = pooled connections (default: 8)")
+parser.add_argument("--search-concurrency", type=int, default=16,
+                    help="Concurrent search requests (default: 16)")
+parser.add_argument("--max-sessions", type=int, default=10000,
+                    help="Sessions remembered before the least recently used are dropped (default: 10000)")
+parser.add_argument("--sql-max-rows", type=int, default=50,
+                    help="Max rows returned to the agent per query (default: 50)")
+parser.add_argument("--no-sql-validation", action="store_true",
+                    help="Send agent SQL to the endpoint without the local schema check and auto-fixes")
+parser.add_argument("--no-metadata-fast-path", action="store_true",
+                    help="Send INFORMATION_SCHEMA and SELECT TOP n * probes to the endpoint instead "
+                         "of answering them from local schema metadata")
+parser.add_argument("--workspace-max-mb", type=float, default=256,
+                    help="Memory cap for SQL results kept for query_previous_result (default: 256)")
+parser.add_argument("--workspace-max-rows", type=int, default=2000,
+                    help="Rows fetched and kept per SQL result for query_previous_result (default: 2000)")
+parser.add_argument("--sql-max-bytes", type=int, default=16000,
+                    help="Max characters of result table per query (default: 16000)")
+parser.add_argument("--no-circuit-breaker", action="store_true",
+                    help="Keep calling SQL/search even when most recent calls failed")
+parser.add_argument("--breaker-failure-rate", type=float, default=0.5,
+                    help="Share of the last 20 calls failed or slow that opens a breaker (default: 0.5)")
+parser.add_argument("--breaker-cooldown", type=float, default=30.0,
+                    help="Seconds an open breaker fails fast before probing again (default: 30)")
+parser.add_argument("--hedge-search", action="store_true",
+                    help="Send a second search request when the first exceeds the observed p95")
+parser.add_argument("--hedge-after-ms", type=float, default=0,
+                    help="Fixed hedge delay instead of the observed p95 (default: 0 = p95)")
+parser.add_argument("--benchmark", action="store_true",
+                    help="Benchmark the gateway against a local emulator and exit")
+parser.add_argument("--bench-clients", type=int, default=50,
+                    help="Concurrent keep-alive clients in --benchmark (default: 50)")
+parser.add_argument("--bench-seconds", type=float, default=20.0,
+                    help="Duration of --benchmark in seconds (default: 20)")
+args = parser.parse_args()
+
+if args.benchmark:
+    # The benchmark measures the gateway itself, never Azure
+    args.emulator = args.emulator or "local"
+
+EMULATOR = args.emulator
+FOUNDRY_ONLY = args.foundry_only
+OFFLINE_SQL = (args.offline_sql or bool(EMULATOR)) and not FOUNDRY_ONLY
+USE_FABRIC_SQL = not FOUNDRY_ONLY and not OFFLINE_SQL
+SQL_MAX_ROWS = max(1, args.sql_max_rows)
+SQL_MAX_BYTES = max(1, args.sql_max_bytes)
+
+# Load environment from azd + project .env
+from load_env import load_all_env
+load_all_env()
+
+# TURN_DEADLINE_SECONDS may come from .env, so it is read only after loading it
+if args.turn_deadline is None:
+    args.turn_deadline = float(os.getenv("TURN_DEADLINE_SECONDS") or 120)
+BUDGET = TurnBudget(args.turn_deadline, args.max_tool_rounds)
+
+if USE_FABRIC_SQL:
+    import pyodbc
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+ENDPOINT = os.getenv("AZURE_AI_PROJECT_ENDPOINT")
+SEARCH_ENDPOINT = os.getenv("AZURE_AI_SEARCH_ENDPOINT")
+WORKSPACE_ID = os.getenv("FABRIC_WORKSPACE_ID")
+DATA_FOLDER = os.getenv("DATA_FOLDER")
+
+if not DATA_FOLDER:
+    print("ERROR: DATA_FOLDER not set in .env")
+    print("       Run 01_generate_sample_data.py first")
+    sys.exit(1)
+
+if not EMULATOR and not (ENDPOINT and SEARCH_ENDPOINT):
+    print("ERROR: AZURE_AI_PROJECT_ENDPOINT and AZURE_AI_SEARCH_ENDPOINT must be set")
+    print("       Run 'azd up' to deploy Azure resources, or use --emulator")
+    sys.exit(1)
+
+if USE_FABRIC_SQL and not WORKSPACE_ID:
+    print("ERROR: FABRIC_WORKSPACE_ID not set in .env")
+    print("       Use --foundry-only or --offline-sql to skip Fabric, or set FABRIC_WORKSPACE_ID")
+    sys.exit(1)
+
+data_dir = os.path.abspath(DATA_FOLDER)
+config_dir = os.path.join(data_dir, "config")
+if not os.path.exists(config_dir):
+    config_dir = data_dir
+
+AGENT_ID = args.agent_id
+AGENT_NAME = None  # What agent references name (the agent ID when 07 did not record it)
+agent_ids_path = os.path.join(config_dir, "agent_ids.json")
+if not AGENT_ID and os.path.exists(agent_ids_path):
+    with open(agent_ids_path) as f:
+        agent_ids = json.load(f)
+    AGENT_ID = agent_ids.get("agent_id")
+    AGENT_NAME = agent_ids.get("agent_name")
+
+if not AGENT_ID and not EMULATOR:
+    print("ERROR: No agent ID found.")
+    print("       Run 07_create_foundry_agent.py first or provide --agent-id")
+    sys.exit(1)
+
+LAKEHOUSE_NAME = None
+LAKEHOUSE_ID = None
+fabric_ids_path = os.path.join(config_dir, "fabric_ids.json")
+if os.path.exists(fabric_ids_path):
+    with open(fabric_ids_path) as f:
+        fabric_ids = json.load(f)
+    LAKEHOUSE_NAME = fabric_ids.get("lakehouse_name")
+    LAKEHOUSE_ID = fabric_ids.get("lakehouse_id")
+elif USE_FABRIC_SQL:
+    print("ERROR: fabric_ids.json not found. Run 02_create_fabric_items.py first or use --foundry-only")
+    sys.exit(1)
+
+search_ids_path = os.path.join(config_dir, "search_ids.json")
+if os.path.exists(search_ids_path):
+    with open(search_ids_path) as f:
+        INDEX_NAME = json.load(f).get("index_name")
+else:
+    solution_name = "demo"
+    if os.path.exists(fabric_ids_path):
+        with open(fabric_ids_path) as f:
+            solution_name = json.load(f).get("solution_name", "demo")
+    INDEX_NAME = f"{solution_name}-documents"
+
+# ============================================================================
+# Shared Backends
+# ============================================================================
+
+OFFLINE_DB = None
+SQL_ENDPOINT = None
+
+if OFFLINE_SQL:
+    from offline_sql import OfflineDatabase
+    OFFLINE_DB = OfflineDatabase(data_dir)
+    print(f"Loaded {len(OFFLINE_DB.row_counts)} offline tables in {OFFLINE_DB.load_seconds * 1000:.0f} ms")
+
+if USE_FABRIC_SQL:
+    from azure.identity import DefaultAzureCredential
+    import requests
+
+    fabric_token = DefaultAzureCredential().get_token("https://api.fabric.microsoft.com/.default")
+    resp = requests.get(
+        f"https://api.fabric.microsoft.com/v1/workspaces/{WORKSPACE_ID}/lakehouses/{LAKEHOUSE_ID}",
+        headers={"Authorization": f"Bearer {fabric_token.token}"},
+    )
+    if resp.status_code == 200:
+        SQL_ENDPOINT = resp.json().get("properties", {}).get("sqlEndpointProperties", {}).get("connectionString")
+    if not SQL_ENDPOINT:
+        print("WARNING: Could not get SQL endpoint. SQL queries may fail.")
+
+
+def connect_sql():
+    """Open a connection to the Fabric SQL endpoint (or the offline database)"""
+    if OFFLINE_DB:
+        return OFFLINE_DB.connect()
+
+    from azure.identity import DefaultAzureCredential
+    token = DefaultAzureCredential().get_token('https://database.windows.net//.default')
+    token_bytes = token.token.encode('UTF-16-LE')
+    token_struct = struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
+    conn_str = f'Driver={{ODBC Driver 18 for SQL Server}};Server={SQL_ENDPOINT};Database={LAKEHOUSE_NAME};Encrypt=yes;TrustServerCertificate=no'
+    SQL_COPT_SS_ACCESS_TOKEN = 1256
+    login_timeout = time_left()
+    options = {"timeout": math.ceil(login_timeout)} if login_timeout is not None else {}
+    return pyodbc.connect(conn_str, attrs_before={SQL_COPT_SS_ACCESS_TOKEN: token_struct}, **options)
+
+
+SQL_CONCURRENCY = max(1, args.sql_concurrency)
+sql_pool = ConnectionPool(connect_sql, max_size=SQL_CONCURRENCY)
+# pyodbc is blocking; one worker thread per pooled connection
+sql_executor = ThreadPoolExecutor(max_workers=SQL_CONCURRENCY, thread_name_prefix="sql")
+
+# Local schema check / auto-fix of agent SQL (see sql_validation.py)
+SQL_VALIDATOR = None
+if not FOUNDRY_ONLY and not args.no_sql_validation:
+    from sql_validation import SqlValidator, load_schema
+    from join_graph import JoinGraph
+    schema_tables = load_schema(config_dir)
+    SQL_VALIDATOR = SqlValidator(schema_tables, JoinGraph.load(data_dir) if schema_tables else None)
+    if not SQL_VALIDATOR.available:
+        SQL_VALIDATOR = None
+
+# Schema probes answered from local metadata (see schema_metadata.py)
+METADATA = None
+if not FOUNDRY_ONLY and not args.no_metadata_fast_path and os.path.exists(os.path.join(config_dir, "schema.json")):
+    from schema_metadata import SchemaMetadata
+    METADATA = SchemaMetadata(data_dir)
+
+# Set by build_gateway() when the agent has query_previous_result
+WORKSPACE = None
+
+
+# One breaker per backend for all sessions (see circuit_breaker.py)
+SQL_BREAKER = SEARCH_BREAKER = SEARCH_HEDGER = None
+if not args.no_circuit_breaker:
+    SQL_BREAKER = get_breaker("SQL endpoint", failure_rate=args.breaker_failure_rate,
+                              cooldown=args.breaker_cooldown, slow_seconds=30.0)
+    SEARCH_BREAKER = get_breaker("Document search", failure_rate=args.breaker_failure_rate,
+                                 cooldown=args.breaker_cooldown, slow_seconds=10.0)
+if args.hedge_search:
+    SEARCH_HEDGER = Hedger(SEARCH_BREAKER or get_breaker("Document search"),
+                           delay=args.hedge_after_ms / 1000 or None)
+
+
+def query_pool(sql_query):
+    on_result = None
+    if WORKSPACE:
+        on_result = lambda columns, rows, complete: keep_result(WORKSPACE, sql_query, columns, rows, complete)
+    with sql_pool.connection() as conn:
+        query_timeout = time_left()
+        if query_timeout is not None:
+            conn.timeout = math.ceil(query_timeout)  # pyodbc query timeout (seconds)
+        return run_bounded_query(conn, sql_query, SQL_MAX_ROWS, SQL_MAX_BYTES, on_result=on_result,
+                                 keep_rows=max(1, args.workspace_max_rows))
+
+
+def execute_sql(sql_query):
+    """Run one query on a pooled connection (called on the SQL executor)"""
+    if METADATA:
+        local = metadata_answer(METADATA, sql_query)
+        if local is not None:
+            return local
+    if not SQL_ENDPOINT and not OFFLINE_DB:
+        return "Error: SQL endpoint not available"
+    note = ""
+    if SQL_VALIDATOR:
+        check = SQL_VALIDATOR.check(sql_query)
+        if check.errors:
+            return check.message()
+        sql_query, note = check.sql, check.note()
+    try:
+        if SQL_BREAKER:
+            return SQL_BREAKER.call(query_pool, sql_query, is_failure=is_endpoint_failure) + note
+        return query_pool(sql_query) + note
+    except CircuitOpen as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"SQL Error: {str(e)}"
+
+
+def run_metric_query(sql_query):
+    if SQL_BREAKER:
+        return SQL_BREAKER.call(query_pool, sql_query, is_failure=is_endpoint_failure)
+    return query_pool(sql_query)
+
+
+METRICS = VALUES = None  # Set by build_gateway() for the tools the agent has
+
+
+def get_metric(tool_args):
+    """Run a metric request (called on the SQL executor, see agent_loop.run_metric)"""
+    if not SQL_ENDPOINT and not OFFLINE_DB:
+        return "Error: SQL endpoint not available"
+    return run_metric(METRICS, tool_args, run_metric_query)
+
+
+def load_local_tools(tools):
+    """Load the backends of the locally answered tools the agent has"""
+    global WORKSPACE, METRICS, VALUES
+    if FOUNDRY_ONLY:
+        return
+    if has_tool(tools, "query_previous_result"):
+        from result_workspace import ResultWorkspace
+        WORKSPACE = ResultWorkspace(max_bytes=int(args.workspace_max_mb * 1024 * 1024),
+                                    max_rows=max(1, args.workspace_max_rows), max_output_rows=SQL_MAX_ROWS)
+        print(f"Result workspace: on (cap {args.workspace_max_mb:g} MB)")
+    if has_tool(tools, "get_metric"):
+        try:
+            METRICS, metric_layer_info = load_metric_layer(data_dir, OFFLINE_DB)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: get_metric unavailable - {e}")
+        else:
+            print(f"Metric layer: {metric_layer_info}")
+    if has_tool(tools, "lookup_values"):
+        from value_index import ValueIndex
+        try:
+            VALUES = ValueIndex.load(data_dir)
+        except (OSError, ValueError) as e:
+            print(f"WARNING: lookup_values unavailable - {e}")
+        else:
+            print(f"Value index: {len(VALUES):,} values in {len(VALUES.columns)} columns")
+
+
+# ============================================================================
+# Gateway
+# ============================================================================
+
+class Overloaded(Exception):
+    """Raised when a turn cannot be admitted; answered with HTTP 429."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AgentGateway:
+    """Async agent loop shared by all sessions, with per-backend limits."""
+
+    def __init__(self, openai_client, agent, search=None):
+        self.openai_client = openai_client
+        self.agent = agent    # AgentRequest: reference to the stored agent or its frozen definition
+        self.search = search  # async callable (query, top) -> text
+        # Everything but search_documents, which is async (see run_tool)
+        self.handlers = ToolHandlers(execute_sql=execute_sql, get_metric=get_metric if METRICS else None,
+                                     metadata=METADATA, values=VALUES, workspace=WORKSPACE)
+        self.emulator = None  # in-process ResponsesEmulator, if one was started
+        self.max_inflight = max(1, args.max_inflight)
+        self.limits = {
+            "llm": max(1, args.llm_concurrency),
+            "sql": SQL_CONCURRENCY,
+            "search": max(1, args.search_concurrency),
+        }
+        self.semaphores = {name: asyncio.Semaphore(n) for name, n in self.limits.items()}
+        self.sessions = OrderedDict()  # session_id -> asyncio.Lock
+        self.inflight = 0
+        self.counters = {"turns": 0, "errors": 0, "rejected": 0, "session_busy": 0,
+                         "llm_calls": 0, "tool_calls": 0}
+
+    # ------------------------------------------------------------------
+    # Sessions
+    # ------------------------------------------------------------------
+
+    async def new_session(self):
+        async with self.semaphores["llm"]:
+            conversation = await self.openai_client.conversations.create()
+        self.remember(conversation.id)
+        return conversation.id
+
+    def remember(self, session_id):
+        """Track a session's lock; the least recently used sessions are dropped past --max-sessions"""
+        lock = self.sessions[session_id] = asyncio.Lock()
+        while len(self.sessions) > args.max_sessions:
+            self.sessions.popitem(last=False)
+        return lock
+
+    # ------------------------------------------------------------------
+    # Agent loop
+    # ------------------------------------------------------------------
+
+    async def create_response(self, request_input, conversation_id, metrics, final=False):
+        """responses.create for the agent; timeout from the turn deadline, no tools on the final call"""
+        start = time.perf_counter()
+        async with self.semaphores["llm"]:
+            request = dict(self.agent.kwargs(), input=request_input, conversation={'id': conversation_id})
+            timeout = time_left()  # Read once the call can start - queueing for a slot uses up the turn too
+            if timeout is not None:
+                request["timeout"] = timeout
+            if final:
+                request["tool_choice"] = "none"
+            response = await self.openai_client.responses.create(**request)
+        self.counters["llm_calls"] += 1
+        request_bytes, _ = self.agent.record(request, response)
+        record_llm_call(metrics, response, time.perf_counter() - start, request_bytes)
+        return response
+
+    async def run_tool(self, name, tool_args, metrics):
+        """Output of one function call, or an error output once the turn deadline passes"""
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self.call_tool(name, tool_args), time_left(floor=0.1))
+        except asyncio.TimeoutError:
+            # A query keeps running on the SQL executor, but the turn no longer waits for it
+            result = f"Error: {name} did not finish before the turn deadline"
+        self.counters["tool_calls"] += 1
+        record_tool_call(metrics, name, time.perf_counter() - start)
+        return result
+
+    async def call_tool(self, name, tool_args):
+        if name == "search_documents":
+            async with self.semaphores["search"]:
+                try:
+                    return await self.guarded_search(tool_args.get("query", ""), tool_args.get("top", 3))
+                except CircuitOpen as e:
+                    return f"Error: {e}"
+                except Exception as e:
+                    return f"Search Error: {str(e)}"
+        if name in LOCAL_TOOLS:
+            return self.handlers(name, tool_args)
+        if name in ("execute_sql", "get_metric"):
+            async with self.semaphores["sql"]:
+                loop = asyncio.get_running_loop()
+                # The turn's budget and conversation go with the call into the worker thread
+                return await loop.run_in_executor(sql_executor, run_in_context(self.handlers, name, tool_args))
+        return self.handlers(name, tool_args)
+
+    async def guarded_search(self, query, top):
+        """Search through the shared breaker, hedged when enabled (search is idempotent)"""
+        def attempt():
+            if SEARCH_HEDGER:
+                return SEARCH_HEDGER.call_async(lambda: self.search(query, top))
+            return self.search(query, top)
+        if SEARCH_BREAKER:
+            return await SEARCH_BREAKER.call_async(attempt)
+        return await attempt()
+
+    async def run_agent_loop(self, user_message, conversation_id, metrics, state=None):
+        """Async twin of agent_rounds() in 08: tool calls of a round run concurrently.
+
+        Once the turn's deadline or tool-round budget (`state`) is used up
+        the model gets one last request without tools; if that fails too,
+        the text so far is returned as a partial answer.
+        """
+        rounds = ToolRounds(BUDGET, state)
+        request_input = user_message
+
+        while True:
+            try:
+                response = await self.create_response(request_input, conversation_id, metrics, rounds.final)
+            except Exception:
+                if not rounds.recoverable():
+                    raise
+                return rounds.partial()
+
+            function_calls = rounds.read(response)
+            if not function_calls:
+                break
+
+            results = await asyncio.gather(*(self.run_tool(fc.name, parse_arguments(fc), metrics)
+                                             for fc in function_calls))
+            request_input = rounds.next_input([function_call_output(fc, result)
+                                               for fc, result in zip(function_calls, results)])
+
+        return rounds.answer()
+
+    async def chat(self, message, session_id=None):
+        """Admit one turn (or raise Overloaded) and run it in its session"""
+        if self.inflight >= self.max_inflight:
+            self.counters["rejected"] += 1
+            raise Overloaded(f"Gateway at capacity ({self.max_inflight} turns in flight)")
+
+        self.inflight += 1
+        try:
+            if session_id is None:
+                session_id = await self.new_session()
+            lock = self.sessions.get(session_id)
+            if lock is None:
+                # Unknown to this process (restart or evicted) - the
+                # conversation itself still lives in Foundry
+                lock = self.remember(session_id)
+            else:
+                self.sessions.move_to_end(session_id)
+            if lock.locked():
+                self.counters["session_busy"] += 1
+                raise Overloaded("A turn is already running in this session")
+
+            async with lock:
+                metrics = new_turn_metrics()
+                start = time.perf_counter()
+                with BUDGET.turn() as state, workspace_scope(WORKSPACE, session_id):
+                    try:
+                        answer = await self.run_agent_loop(message, session_id, metrics, state)
+                    except Exception:
+                        self.counters["errors"] += 1
+                        raise
+                self.counters["turns"] += 1
+            return {
+                "session_id": session_id,
+                "answer": answer,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "llm_calls": metrics["llm_calls"],
+                "tool_calls": len(metrics["tools"]),
+                "tool_rounds": state.rounds,
+                "budget_stop": "partial" if state.partial else state.stopped,
+                "total_tokens": metrics["total_tokens"],
+            }
+        finally:
+            self.inflight -= 1
+
+    def health(self):
+        return {
+            "status": "ok",
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "backend_limits": self.limits,
+            "sessions": len(self.sessions),
+            "sql_connections": {"opened": sql_pool.opened, "reused": sql_pool.reused},
+            "sql_validation": SQL_VALIDATOR.summary() if SQL_VALIDATOR else None,
+            "schema_metadata": METADATA.summary() if METADATA else None,
+            "metric_layer": METRICS.summary() if METRICS else None,
+            "value_index": VALUES.summary() if VALUES else None,
+            "result_workspace": WORKSPACE.summary() if WORKSPACE else None,
+            "turn_budget": BUDGET.summary(),
+            "agent_requests": self.agent.summary(),
+            "circuit_breakers": breaker_summary(),
+            "search_hedging": SEARCH_HEDGER.summary() if SEARCH_HEDGER else None,
+            "counters": self.counters,
+        }
+
+
+# ============================================================================
+# HTTP Server
+# ============================================================================
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+           500: "Internal Server Error"}
+
+
+async def read_http_message(reader):
+    """Read a request/response head and body; returns (first_line, headers, body) or None on EOF"""
+    first_line = await reader.readline()
+    if not first_line:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    body = await reader.readexactly(length) if length else b""
+    return first_line.decode("latin-1").strip(), headers, body
+
+
+def encode_response(status, payload, keep_alive=True, headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+             "Content-Type: application/json",
+             f"Content-Length: {len(body)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def route(gateway, method, path, body):
+    """Dispatch one request; returns (status, payload, extra_headers)"""
+    path = path.split("?")[0].rstrip("/") or "/"
+    try:
+        if method == "GET" and path == "/health":
+            return 200, gateway.health(), None
+        if method == "POST" and path == "/sessions":
+            return 200, {"session_id": await gateway.new_session()}, None
+        if method == "POST" and path == "/chat":
+            try:
+                request = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                return 400, {"error": "Body must be JSON"}, None
+            message = (request.get("message") or "").strip()
+            if not message:
+                return 400, {"error": "'message' is required"}, None
+            return 200, await gateway.chat(message, request.get("session_id")), None
+        return 404, {"error": f"Unknown endpoint {method} {path}"}, None
+    except Overloaded as e:
+        return 429, {"error": str(e)}, {"Retry-After": str(e.retry_after)}
+    except Exception as e:
+        return 500, {"error": f"{type(e).__name__}: {e}"}, None
+
+
+def make_connection_handler(gateway):
+    async def handle(reader, writer):
+        try:
+            while True:
+                message = await read_http_message(reader)
+                if message is None:
+                    break
+                request_line, headers, body = message
+                method, path = (request_line.split(" ") + ["", ""])[:2]
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload, extra = await route(gateway, method, path, body)
+                writer.write(encode_response(status, payload, keep_alive, extra))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+# ============================================================================
+# Client Setup
+# ============================================================================
+
+async def build_gateway():
+    """Create the async OpenAI client, agent definition and search backend"""
+    if EMULATOR:
+        from openai import AsyncOpenAI
+        from responses_emulator import ResponsesEmulator, EmulatedSearch, LatencyModel, emulator_tools
+
+        table_names = list(OFFLINE_DB.ontology.get("tables", {}).keys()) if OFFLINE_DB else []
+        emulated_metrics = None
+        if args.emulator_metric_tool and OFFLINE_DB:
+            from semantic_metrics import MetricLayer
+            emulated_metrics = MetricLayer(OFFLINE_DB.ontology) if OFFLINE_DB.ontology.get("metrics") else None
+        tools = emulator_tools(table_names, sql_tool=not FOUNDRY_ONLY, metric_layer=emulated_metrics,
+                               value_lookup=args.emulator_value_lookup and not FOUNDRY_ONLY)
+        emulator = None
+        base_url = EMULATOR
+        if EMULATOR == "local":
+            emulator = ResponsesEmulator(
+                latency_ms=args.emulator_latency_ms,
+                table=table_names[0] if table_names else "data",
+                sql_tool=not FOUNDRY_ONLY,
+                metric=next(iter(emulated_metrics.measures)) if emulated_metrics else None,
+                value_lookup=args.emulator_value_lookup,
+            ).start()
+            base_url = emulator.base_url
+        print(f"Using Responses API emulator at {base_url}")
+
+        canned = EmulatedSearch(LatencyModel(args.emulator_latency_ms / 4))
+
+        async def emulated_search(query, top=3):
+            await asyncio.sleep(canned.latency.sample())
+            return canned.format(query, top)
+
+        # Only the in-process emulator knows stored agents; a remote one gets the definition inline
+        agent = AgentRequest(AGENT_ID or "emulator", "emulator", "You are an emulated agent used for load testing.",
+                             tools, reference=not (args.inline_agent or EMULATOR != "local"))
+        if emulator:
+            emulator.register_agent(agent.name, agent.model, agent.instructions, agent.tools)
+        load_local_tools(tools)
+        print(f"Agent requests: {agent.describe()}")
+
+        openai_client = AsyncOpenAI(base_url=base_url, api_key="emulator")
+        gateway = AgentGateway(openai_client, agent, emulated_search)
+        gateway.emulator = emulator
+        return gateway
+
+    from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+    from azure.ai.projects.aio import AIProjectClient as AsyncAIProjectClient
+    from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+    credential = AsyncDefaultAzureCredential()
+    project_client = AsyncAIProjectClient(endpoint=ENDPOINT, credential=credential)
+    agent = await project_client.agents.get(AGENT_ID)
+    agent_def = agent_definition(agent)  # Plain dicts, also for the tools
+
+    openai_client = project_client.get_openai_client()
+    if inspect.isawaitable(openai_client):
+        openai_client = await openai_client
+
+    # One client for all sessions - it keeps its HTTP connections open
+    search_client = AsyncSearchClient(endpoint=SEARCH_ENDPOINT, index_name=INDEX_NAME, credential=credential)
+
+    async def search_documents(query, top=3):
+        results = await search_client.search(
+            search_text=query,
+            top=min(top, 10),
+            query_type="semantic",
+            semantic_configuration_name="default-semantic",
+            select=["content", "title", "source", "page_number"]
+        )
+        return format_search_results([result async for result in results])
+
+    # Name the stored agent in each request instead of resending its definition
+    agent = AgentRequest(getattr(agent, "name", None) or AGENT_NAME or AGENT_ID, agent_def['model'],
+                         agent_def['instructions'], agent_def['tools'], version=reference_version(agent),
+                         reference=not args.inline_agent)
+    load_local_tools(agent_def['tools'])
+    print(f"Agent requests: {agent.describe()}")
+
+    gateway = AgentGateway(openai_client, agent, search_documents)
+    gateway.emulator = None
+    return gateway
+
+
+# ============================================================================
+# Benchmark (--benchmark)
+# ============================================================================
+
+async def http_post(reader, writer, host, path, payload):
+    body = json.dumps(payload).encode("utf-8")
+    head = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+    status_line, _, response_body = await read_http_message(reader)
+    return int(status_line.split(" ")[1]), json.loads(response_body or b"{}")
+
+
+async def run_benchmark(host, port, questions, clients, seconds):
+    """N keep-alive clients, each with its own session, asking back to back"""
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    counts = {"ok": 0, "rejected": 0, "errors": 0}
+
+    async def client(index):
+        reader, writer = await asyncio.open_connection(host, port)
+        session_id = None
+        turn = 0
+        try:
+            while time.perf_counter() < deadline:
+                payload = {"message": questions[(index + turn) % len(questions)]}
+                if session_id:
+                    payload["session_id"] = session_id
+                start = time.perf_counter()
+                status, response = await http_post(reader, writer, host, "/chat", payload)
+                turn += 1
+                if status == 200:
+                    counts["ok"] += 1
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    session_id = response["session_id"]
+                elif status == 429:
+                    counts["rejected"] += 1
+                    await asyncio.sleep(0.05)
+                else:
+                    counts["errors"] += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    wall = time.perf_counter() - start
+    return {
+        "clients": clients,
+        "wall_clock_s": round(wall, 2),
+        "requests": counts,
+        "requests_per_s": round(counts["ok"] / wall, 2) if wall else None,
+        "latency_ms": describe(latencies),
+    }
+
+
+def print_benchmark(result, gateway):
+    print(f"\n{'='*60}")
+    print(f"Gateway Benchmark ({result['clients']} clients, {result['wall_clock_s']} s)")
+    print(f"{'='*60}")
+    print(f"  Sustained:   {result['requests_per_s']} requests/s")
+    print(f"  Requests:    {result['requests']}")
+    stats = result["latency_ms"]
+    if stats.get("count"):
+        print(f"  Latency ms:  p50={stats['p50']} p95={stats['p95']} p99={stats['p99']} max={stats['max']}")
+    print(f"  Gateway:     {gateway.health()['counters']}")
+    print(f"  SQL pool:    {sql_pool.opened} connections opened, {sql_pool.reused} reuses")
+    for name, stats in breaker_summary().items():
+        print(f"  Breaker:     {name}: {stats}")
+    if SEARCH_HEDGER:
+        print(f"  Hedging:     {SEARCH_HEDGER.summary()}")
+    print(f"  Turn budget: {BUDGET.summary()}")
+    print(f"  Requests:    {gateway.agent.summary()}")
+    if gateway.emulator:
+        print(f"  Emulator:    {gateway.emulator.stats.counts}")
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+async def main():
+    gateway = await build_gateway()
+    port = 0 if args.benchmark else args.port  # Benchmark on any free port
+    server = await asyncio.start_server(make_connection_handler(gateway), args.host, port)
+    host, port = server.sockets[0].getsockname()[:2]
+
+    if args.benchmark:
+        questions_path = os.path.join(config_dir, "sample_questions.txt")
+        questions = [q["question"] for q in load_sample_questions(questions_path)] \
+            if os.path.exists(questions_path) else ["How many records are there?"]
+        print(f"Benchmarking {host}:{port}: {args.bench_clients} clients for {args.bench_seconds:.0f} s "
+              f"(max in-flight {gateway.max_inflight}, limits {gateway.limits})...")
+        async with server:
+            result = await run_benchmark(host, port, questions, max(1, args.bench_clients), args.bench_seconds)
+        print_benchmark(result, gateway)
+        return
+
+    print(f"\n{'='*60}")
+    print(f"Agent gateway listening on http://{host}:{port}")
+    print(f"{'='*60}")
+    print(f"  Max in-flight turns: {gateway.max_inflight}")
+    print(f"  Backend limits:      {gateway.limits}")
+    print("  POST /chat {\"message\": ..., \"session_id\": ...}  (Ctrl+C to stop)")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nGateway stopped.")
+    finally:
+        sql_pool.close()
+        sql_executor.shutdown(wait=False)
@@ -0,0 +1,285 @@
+"""
+The agent loop shared by 08_test_foundry_agent.py and agent_gateway.py.
+
+Both run the same turn - responses.create -> function calls ->
+function_call_output -> ... - 08 on threads (chat() and the streaming
+chat_stream()), the gateway on asyncio for many sessions at once. What a
+turn does must not drift apart between them, so it lives here and the
+callers only decide how a request is sent and where a tool runs:
+
+    ToolRounds     reads the function calls and text out of each response
+                   and builds the next input: the tool outputs, or - once
+                   the TurnBudget's deadline or round cap is used up - the
+                   outputs plus a request to answer without more tools.
+                   A request failing after that ends in a partial answer.
+    ToolHandlers   tool name -> handler for every function tool 07 can give
+                   the agent; describe_tables, lookup_values,
+                   query_previous_result and get_metric are answered from
+                   the local backends the caller loaded
+    run_metric     get_metric on its aggregate table, falling back to the
+                   base tables when the aggregate is missing
+
+plus the execute_sql helpers both need: schema probes answered from local
+metadata and results kept for query_previous_result.
+
+Used by 08_test_foundry_agent.py and agent_gateway.py.
+"""
+
+import json
+from contextlib import contextmanager
+
+from tracing import span
+from sql_utils import format_result
+from circuit_breaker import CircuitOpen
+from turn_budget import final_answer_item, partial_answer
+
+# Tools answered in-process from memory - no endpoint round trip, so they
+# need neither a worker thread nor a backend concurrency slot
+LOCAL_TOOLS = ("describe_tables", "lookup_values", "query_previous_result")
+
+
+def tool_name(tool):
+    return tool.get("name") if isinstance(tool, dict) else getattr(tool, "name", None)
+
+
+def has_tool(tools, name):
+    return any(tool_name(t) == name for t in tools or [])
+
+
+# ============================================================================
+# Rounds
+# ============================================================================
+
+def parse_output(response):
+    """(function calls, message text) of one responses.create result"""
+    function_calls, text = [], ""
+    for item in response.output:
+        kind = getattr(item, "type", None)
+        if kind == "function_call":
+            function_calls.append(item)
+        elif kind == "message":
+            for content in item.content:
+                if hasattr(content, "text"):
+                    text += content.text + "\n"
+    return function_calls, text
+
+
+def parse_arguments(fc):
+    """Arguments of a function call (empty when the model sent invalid JSON)"""
+    try:
+        return json.loads(fc.arguments or "{}")
+    except json.JSONDecodeError:
+        return {}
+
+
+def function_call_output(fc, output):
+    return {"type": "function_call_output", "call_id": fc.call_id, "output": output}
+
+
+class ToolRounds:
+    """Text, tool rounds and budget stop of one turn.
+
+    `state` is the TurnState of the running turn (see turn_budget.py), or
+    None to run without a budget.
+    """
+
+    def __init__(self, budget, state=None):
+        self.budget = budget
+        self.state = state
+        self.text = ""
+        self.final = False  # The next request is the last one, sent without tools
+
+    def read(self, response):
+        """Keep a response's text; returns its function calls still to run"""
+        function_calls, text = parse_output(response)
+        self.text += text
+        return [] if self.final else function_calls
+
+    def next_input(self, tool_outputs):
+        """Input of the request after a tool round (plus the final-answer note once the budget is used up)"""
+        if self.state is None:
+            return tool_outputs
+        self.state.rounds += 1
+        self.state.stopped = self.budget.stop_reason(self.state)
+        if not self.state.stopped:
+            return tool_outputs
+        self.final = True
+        return tool_outputs + [final_answer_item()]
+
+    def recoverable(self):
+        """Whether a failed request ends the turn with a partial answer instead of the error"""
+        return self.state is not None and (self.final or self.state.expired())
+
+    def partial(self):
+        self.state.partial = True
+        return partial_answer(self.text)
+
+    def answer(self):
+        return self.text.strip()
+
+
+# ============================================================================
+# Tool Dispatch
+# ============================================================================
+
+class ToolHandlers:
+    """Function tool name -> output text, for every tool 07 can register.
+
+    `execute_sql(sql_query)`, `search(query, top)` and `get_metric(args)`
+    are the caller's (None when it has no such backend); `metadata`
+    (SchemaMetadata), `values` (ValueIndex) and `workspace`
+    (ResultWorkspace) answer their tools locally.
+    """
+
+    def __init__(self, execute_sql=None, search=None, get_metric=None,
+                 metadata=None, values=None, workspace=None):
+        self.execute_sql = execute_sql
+        self.search = search
+        self.get_metric = get_metric
+        self.metadata = metadata
+        self.values = values
+        self.workspace = workspace
+        self.handlers = {
+            "execute_sql": self._execute_sql,
+            "search_documents": self._search_documents,
+            "describe_tables": self._describe_tables,
+            "get_metric": self._get_metric,
+            "lookup_values": self._lookup_values,
+            "query_previous_result": self._query_previous_result,
+        }
+
+    def __call__(self, name, args):
+        handler = self.handlers.get(name)
+        if handler is None:
+            return f"Unknown function: {name}"
+        return handler(args)
+
+    def _execute_sql(self, args):
+        if not self.execute_sql:
+            return "Error: SQL endpoint not available"
+        return self.execute_sql(args.get("sql_query", ""))
+
+    def _search_documents(self, args):
+        if not self.search:
+            return "Error: document search not available"
+        return self.search(args.get("query", ""), args.get("top", 3))
+
+    def _describe_tables(self, args):
+        if not self.metadata:
+            return "Error: schema metadata not available"
+        return self.metadata.describe(args.get("tables"))
+
+    def _get_metric(self, args):
+        if not self.get_metric:
+            return "Error: metric layer not available"
+        return self.get_metric(args)
+
+    def _lookup_values(self, args):
+        if not self.values:
+            return "Error: value index not available"
+        return self.values.lookup(args.get("terms"))
+
+    def _query_previous_result(self, args):
+        if not self.workspace:
+            return "Error: result workspace not available"
+        from result_workspace import active_conversation
+        return self.workspace.query(active_conversation.get(), args)
+
+
+# ============================================================================
+# execute_sql Helpers
+# ============================================================================
+
+def metadata_answer(metadata, sql_query, fmt="markdown", token_budget=None):
+    """Result text for a schema probe answerable from local metadata, else None"""
+    with span("sql.metadata") as metadata_span:
+        local = metadata.intercept(sql_query)
+        metadata_span.set_attribute("served", local is not None)
+    if local is None:
+        return None
+    columns, rows = local
+    result = format_result(columns, rows, len(rows), False, fmt, token_budget)
+    return result + "\n(Served from local schema metadata)"
+
+
+def keep_result(workspace, sql_query, columns, rows, complete):
+    """Save an execute_sql result for the running conversation; returns the note for the agent"""
+    from result_workspace import active_conversation
+    with span("workspace.store", rows=len(rows)):
+        result_id = workspace.add(active_conversation.get(), sql_query, columns, rows, complete)
+    if result_id is None:
+        return None
+    return f"(Saved as {result_id} - use query_previous_result for follow-ups on these rows)"
+
+
+@contextmanager
+def workspace_scope(workspace, session_id):
+    """Make `session_id` the conversation whose results tools save and query"""
+    if not workspace:
+        yield
+        return
+    from result_workspace import active_conversation
+    token = active_conversation.set(session_id)
+    try:
+        yield
+    finally:
+        active_conversation.reset(token)
+
+
+# ============================================================================
+# Metric Layer
+# ============================================================================
+
+def load_metric_layer(data_dir, offline_db=None):
+    """MetricLayer for get_metric and a one-line description of where it runs.
+
+    Aggregate tables are built into `offline_db` when given, otherwise the
+    ones 03 loaded are used. Raises OSError / ValueError without a usable
+    ontology.
+    """
+    from semantic_metrics import MetricLayer
+    layer = MetricLayer.from_data_dir(data_dir)
+    if offline_db:
+        manifest = layer.load_into(offline_db)
+        return layer, (f"{len(layer.measures)} metrics, "
+                       f"{len(manifest['tables'])} aggregate tables (built locally)")
+    if layer.use_loaded_aggregates():
+        return layer, f"{len(layer.measures)} metrics, {len(layer.aggregates)} aggregate tables (loaded by 03)"
+    return layer, f"{len(layer.measures)} metrics on the base tables (re-run 03 to load the aggregate tables)"
+
+
+def run_metric(layer, tool_args, run_query, log=None, use_aggregates=True):
+    """Compile a metric request and run it, on its aggregate table when one covers it.
+
+    `run_query(sql)` returns the formatted result or raises. An aggregate
+    table missing on the endpoint is dropped from the layer and the base
+    tables answer instead.
+    """
+    from semantic_metrics import MetricError, BASE_TABLES
+    metric = tool_args.get("metric")
+    try:
+        sql_query, source = layer.compile(metric, tool_args.get("group_by"), tool_args.get("filters"),
+                                          use_aggregates=use_aggregates)
+    except MetricError as e:
+        layer.count("errors")
+        return f"Error: {e}"
+
+    if use_aggregates:
+        layer.count("calls")
+    with span("sql.metric", metric=metric, source=source):
+        try:
+            result = run_query(sql_query)
+        except CircuitOpen as e:
+            return f"Error: {e}"
+        except Exception as e:
+            if source == BASE_TABLES:
+                layer.count("errors")
+                return f"SQL Error: {str(e)}"
+            # Aggregate table missing on the endpoint - stop using it, the base tables still answer
+            layer.drop_aggregate(source)
+            layer.count("fallbacks")
+            return run_metric(layer, tool_args, run_query, log, use_aggregates=False)
+    layer.count("base" if source == BASE_TABLES else "aggregate")
+    if log:
+        log(f"  [Metric] {metric} from {source}")
+    return f"{result}\n(Metric {metric}, computed from {source})"
@@ -0,0 +1,155 @@
+"""
+How 08_test_foundry_agent.py and agent_gateway.py address the agent on each
+responses.create.
+
+Sending the agent's instructions and tool schemas with every call costs
+request bytes and input tokens on every round of every turn. Two modes:
+
+    reference  the request names the stored agent (and the version 07
+               recorded) - {"agent": {"type": "agent_reference", ...}} -
+               and the service applies its instructions and tools
+    inline     the definition is sent with the request (--inline-agent,
+               and always when recording or replaying cassettes)
+
+Prompt caching only hits when the prefix of a request - tools, then
+instructions, then the conversation - is byte-identical to an earlier one.
+Inline definitions are therefore frozen once at startup into a canonical
+JSON form, so a definition read from the startup cache and one fetched from
+the service serialize to the same bytes, and nothing per turn is ever
+spliced into the instructions.
+
+Calls routed to a different deployment (--planner-model / --answer-model)
+are sent inline: a reference always runs on the agent's own model.
+
+Each call's request size and cached input tokens are recorded per turn and
+summarized, so the effect of either mode shows up in the eval output.
+
+Check that an agent read through the Azure SDK is sent inline intact:
+    python agent_request.py [--agent-json agent.json]
+"""
+
+import json
+import hashlib
+import threading
+
+from cassette import _to_jsonable
+
+
+def freeze(value):
+    """Canonical JSON-compatible copy of a definition part (stable key order)."""
+    return json.loads(json.dumps(_to_jsonable(value), sort_keys=True, default=str))
+
+
+def reference_version(agent):
+    """The "version" of an agent's latest version, the only value a reference accepts (or None)."""
+    latest = (getattr(agent, "versions", None) or {}).get("latest") or {}
+    version = latest.get("version") if hasattr(latest, "get") else getattr(latest, "version", None)
+    return str(version) if version else None
+
+
+def cached_tokens(response):
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "input_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+class AgentRequest:
+    """Agent part of each responses.create request, plus size / cache statistics."""
+
+    def __init__(self, name, model, instructions, tools, version=None, reference=True):
+        self.name = name
+        self.model = model
+        self.version = version
+        self.reference = bool(reference and name)
+        self.instructions = instructions or ""
+        self.tools = freeze(tools or [])
+        self.prefix_bytes = len(self._dumps({"tools": self.tools, "instructions": self.instructions}))
+        self.prefix_hash = hashlib.sha256(
+            self._dumps([self.tools, self.instructions]).encode("utf-8")).hexdigest()[:12]
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "reference_calls": 0, "request_bytes": 0,
+                      "input_tokens": 0, "cached_tokens": 0}
+
+    @staticmethod
+    def _dumps(value):
+        return json.dumps(value, default=str)
+
+    def describe(self):
+        if self.reference:
+            pinned = f" version {self.version}" if self.version else ""
+            return f"agent reference ({self.name}{pinned})"
+        return f"inline definition ({self.prefix_bytes:,} bytes, prefix {self.prefix_hash})"
+
+    def kwargs(self, model=None):
+        """responses.create arguments that select the agent for `model` (None = the agent's own)."""
+        if self.reference and (model is None or model == self.model):
+            agent = {"type": "agent_reference", "name": self.name}
+            if self.version:
+                agent["version"] = self.version
+            return {"extra_body": {"agent": agent}}
+        return {"model": model or self.model, "instructions": self.instructions, "tools": self.tools}
+
+    def request_bytes(self, request):
+        """Size of the JSON body the client sends for `request` (responses.create kwargs)."""
+        body = {key: value for key, value in request.items() if key not in ("timeout", "extra_body")}
+        body.update(request.get("extra_body") or {})
+        return len(self._dumps(_to_jsonable(body)).encode("utf-8"))
+
+    def record(self, request, response):
+        """Count one call; returns (request_bytes, cached_tokens) for the turn metrics."""
+        size = self.request_bytes(request)
+        cached = cached_tokens(response)
+        usage = getattr(response, "usage", None)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["reference_calls"] += "extra_body" in request
+            self.stats["request_bytes"] += size
+            self.stats["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+            self.stats["cached_tokens"] += cached
+        return size, cached
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+        calls = stats["calls"]
+        stats["mode"] = "reference" if self.reference else "inline"
+        stats["definition_bytes"] = self.prefix_bytes
+        stats["mean_request_bytes"] = round(stats["request_bytes"] / calls) if calls else None
+        stats["cached_share"] = (round(stats["cached_tokens"] / stats["input_tokens"], 3)
+                                 if stats["input_tokens"] else None)
+        return stats
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    p = argparse.ArgumentParser(description="Check inline agent requests built from an SDK AgentObject")
+    p.add_argument("--agent-json", help="Agent as returned by GET /agents/{name} (default: a sample agent)")
+    args = p.parse_args()
+
+    try:
+        from azure.ai.projects.models import AgentObject
+    except ImportError:
+        print("ERROR: azure-ai-projects not installed (pip install -r scripts/requirements.txt)")
+        sys.exit(1)
+
+    if args.agent_json:
+        with open(args.agent_json, encoding="utf-8") as f:
+            raw = json.load(f)
+    else:
+        raw = {"id": "sample", "name": "sample", "object": "agent", "versions": {"latest": {
+            "object": "agent.version", "version": "1", "definition": {
+                "kind": "prompt", "model": "gpt-4o", "instructions": "Answer from the data.",
+                "tools": [{"type": "function", "name": "execute_sql", "description": "Run T-SQL",
+                           "parameters": {"type": "object", "properties": {"sql_query": {"type": "string"}}}}]}}}}
+    agent = AgentObject(raw)
+    definition = agent.versions["latest"]["definition"]
+    request = AgentRequest(agent.name, definition["model"], definition["instructions"], definition["tools"],
+                           version=reference_version(agent), reference=False)
+    expected = raw["versions"]["latest"]["definition"]["tools"]
+    sent = request.kwargs()["tools"]
+    if sent != freeze(expected):
+        print(f"[FAIL] inline tools {json.dumps(sent)[:200]} do not match the definition")
+        sys.exit(1)
+    print(f"[OK] {len(sent)} tool(s) sent inline ({request.describe()})")
@@ -0,0 +1,161 @@
+"""
+Final-answer cache for repeated questions.
+
+Workshop users ask the same sample questions over and over; each repeat costs
+several LLM round trips plus SQL and search. This cache stores final answers
+keyed on the normalized question and a fingerprint of everything the answer
+depends on:
+    - the agent definition (id, model, instructions, tools)
+    - the data folder
+    - the search index name and version (search_ids.json)
+    - the data version stamp bumped by 03/06 when data is reloaded
+
+Entries expire after a TTL and the least recently used entries are evicted
+beyond a maximum size. The cache file lives at data/<folder>/cache/.
+
+Opt-in per deployment via .env:
+    ANSWER_CACHE_TTL=3600          # seconds; unset or 0 = disabled
+    ANSWER_CACHE_MAX_ENTRIES=500
+
+Invalidation (called by 03_load_fabric_data.py and 06_upload_to_search.py):
+    from answer_cache import invalidate
+    invalidate(data_dir, "tables")
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_DIRNAME = "cache"
+CACHE_FILENAME = "answer_cache.json"
+VERSION_FILENAME = "data_version.json"
+
+
+def cache_dir(data_dir):
+    return os.path.join(str(data_dir), CACHE_DIRNAME)
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    text = re.sub(r"\s+", " ", question.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def read_data_version(data_dir):
+    """{"tables": <stamp>, "search": <stamp>} written by invalidate()."""
+    path = os.path.join(cache_dir(data_dir), VERSION_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def invalidate(data_dir, source):
+    """Bump the data version for `source` and drop all cached answers.
+
+    Bumping the version also changes the fingerprint, so answers cached by a
+    process that is still running are never served again either.
+    """
+    directory = cache_dir(data_dir)
+    os.makedirs(directory, exist_ok=True)
+    version = read_data_version(data_dir)
+    version[source] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(os.path.join(directory, VERSION_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(version, f, indent=2)
+    cache_path = os.path.join(directory, CACHE_FILENAME)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    return version
+
+
+def answer_fingerprint(agent_id, model, instructions, tools, data_dir, index_name, index_info=None):
+    """Hash of everything a cached answer depends on."""
+    parts = {
+        "agent_id": agent_id,
+        "model": model,
+        "instructions": instructions,
+        "tools": tools,
+        "data_dir": os.path.abspath(str(data_dir)),
+        "data_version": read_data_version(data_dir),
+        "index_name": index_name,
+        "index_info": index_info or {},
+    }
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    """TTL + LRU cache of final answers, persisted to a JSON file."""
+
+    def __init__(self, data_dir, fingerprint, ttl_seconds=3600, max_entries=500):
+        self.path = os.path.join(cache_dir(data_dir), CACHE_FILENAME)
+        self.fingerprint = fingerprint
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {"question", "answer", "stored_at"}
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0}
+        self._load()
+
+    def _key(self, question):
+        text = f"{self.fingerprint}:{normalize_question(question)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f).get("entries", [])
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for entry in entries:
+            if now - entry["stored_at"] <= self.ttl_seconds:
+                self._entries[entry["key"]] = entry
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": list(self._entries.values())}, f)
+        os.replace(temp_path, self.path)
+
+    def get(self, question):
+        """Cached answer for a question, or None."""
+        key = self._key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry["stored_at"] > self.ttl_seconds:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry["answer"]
+
+    def put(self, question, answer):
+        key = self._key(question)
+        with self._lock:
+            self._entries[key] = {"key": key, "question": question, "answer": answer,
+                                  "stored_at": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+            self.stats["stores"] += 1
+            self._save()
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        return stats
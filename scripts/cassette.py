@@ -0,0 +1,241 @@
+"""
+Record/replay cassettes for the agent loop.
+
+Recording wraps the OpenAI client and the tool dispatcher, capturing every
+responses.create request/response, conversations.create result and tool
+input/output (with its latency) into a JSON cassette. Replay serves them back
+deterministically and offline - no model, Fabric SQL or AI Search calls - with
+optional latency injection, so changes to the agent loop can be benchmarked
+reproducibly and for free.
+
+Usage (from 08_test_foundry_agent.py):
+    python 08_test_foundry_agent.py --record cassettes/session.json
+    python 08_test_foundry_agent.py --replay cassettes/session.json
+    python 08_test_foundry_agent.py --replay cassettes/session.json --replay-latency recorded
+    python 08_test_foundry_agent.py --eval --replay cassettes/eval.json --replay-latency 250
+
+Latency modes:
+    none      Return immediately (default)
+    recorded  Sleep for the latency observed while recording
+    <ms>      Sleep a fixed number of milliseconds per call
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from types import SimpleNamespace
+from collections import defaultdict, deque
+from collections.abc import Mapping
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMiss(Exception):
+    """Raised in replay when no recorded interaction is left for a request."""
+
+
+def _fingerprint(kind, payload):
+    """Stable key for a request - conversation ids are left out on purpose."""
+    text = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(f"{kind}:{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _to_jsonable(obj):
+    """Serialize SDK objects to plain dicts.
+
+    OpenAI responses are pydantic models; Azure SDK models (AgentObject,
+    agent definitions and their tools) are Mappings that keep their fields
+    in `_data`, so they must be read as mappings, not through vars().
+    """
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "as_dict") and callable(obj.as_dict):
+        return _to_jsonable(obj.as_dict())
+    if isinstance(obj, (list, tuple)):
+        return [_to_jsonable(v) for v in obj]
+    if isinstance(obj, Mapping):
+        return {k: _to_jsonable(v) for k, v in obj.items()}
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return {k: _to_jsonable(v) for k, v in vars(obj).items() if not k.startswith("_")}
+    return obj
+
+
+def to_namespace(value):
+    """Turn recorded dicts back into attribute-access objects like the SDK's."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: to_namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [to_namespace(v) for v in value]
+    return value
+
+
+def parse_latency(value):
+    """'none' -> None, 'recorded' -> 'recorded', '<ms>' -> float seconds."""
+    if value in (None, "", "none"):
+        return None
+    if value == "recorded":
+        return "recorded"
+    return float(value) / 1000
+
+
+class Cassette:
+    """A set of recorded interactions, in record or replay mode."""
+
+    def __init__(self, path, mode, latency=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = parse_latency(latency)
+        self._lock = threading.Lock()
+        self.agent = {}
+        self.interactions = []
+        self._queues = defaultdict(deque)
+        self._by_kind = defaultdict(list)
+        self._used = set()
+        self.hits = 0
+        self.misses = 0
+
+        if mode == "replay":
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.agent = data.get("agent", {})
+            self.interactions = data.get("interactions", [])
+            for index, item in enumerate(self.interactions):
+                self._queues[item["key"]].append(index)
+                self._by_kind[item["kind"]].append(index)
+
+    # ------------------------------------------------------------------
+    # Core record/replay
+    # ------------------------------------------------------------------
+
+    def _record(self, kind, key, request, response, elapsed):
+        with self._lock:
+            self.interactions.append({
+                "kind": kind,
+                "key": key,
+                "request": request,
+                "response": response,
+                "elapsed_ms": round(elapsed * 1000, 1),
+            })
+
+    def _replay(self, kind, key):
+        """Serve the recorded response for `key`.
+        
+        An exact match is used first. If the request changed (say a tool's
+        output format did), the next unused interaction of the same kind in
+        recorded order is served instead and counted as a miss. The last
+        match for a key is reused, so repeated runs still replay.
+        """
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                index = queue.popleft() if len(queue) > 1 else queue[0]
+                self.hits += 1
+            else:
+                index = next((i for i in self._by_kind[kind] if i not in self._used), None)
+                if index is None:
+                    raise CassetteMiss(f"No recorded {kind} interaction left for key {key}")
+                self.misses += 1
+            self._used.add(index)
+            item = self.interactions[index]
+        self._sleep(item.get("elapsed_ms", 0) / 1000)
+        return item["response"]
+
+    def _sleep(self, recorded_seconds):
+        if self.latency == "recorded":
+            time.sleep(recorded_seconds)
+        elif self.latency:
+            time.sleep(self.latency)
+
+    def call(self, kind, payload, fn):
+        """Record fn() under (kind, payload), or replay what was recorded."""
+        key = _fingerprint(kind, payload)
+        if self.mode == "replay":
+            return self._replay(kind, key)
+        start = time.perf_counter()
+        result = fn()
+        self._record(kind, key, payload, _to_jsonable(result), time.perf_counter() - start)
+        return result
+
+    def tool(self, name, args, fn):
+        """Record or replay one tool call; tool outputs are plain strings."""
+        return self.call("tool", {"name": name, "args": args}, fn)
+
+    def set_agent(self, agent_id, model, instructions, tools):
+        """Store the agent definition so replay needs no Foundry access."""
+        self.agent = {
+            "agent_id": agent_id,
+            "model": model,
+            "instructions": instructions,
+            "tools": _to_jsonable(tools),
+        }
+
+    def save(self):
+        """Write the cassette (record mode only)."""
+        if self.mode != "record":
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock:
+            data = {
+                "version": CASSETTE_VERSION,
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "agent": self.agent,
+                "interactions": list(self.interactions),
+            }
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+
+    def stats(self):
+        return {"mode": self.mode, "interactions": len(self.interactions),
+                "hits": self.hits, "misses": self.misses}
+
+    # ------------------------------------------------------------------
+    # Client wrappers
+    # ------------------------------------------------------------------
+
+    def wrap_client(self, openai_client=None):
+        """OpenAI-client look-alike that records (or replays) the calls 08 makes."""
+        return _CassetteClient(self, openai_client)
+
+
+def _llm_payload(kwargs):
+    """Part of a responses.create request that identifies it for replay."""
+    return {"model": kwargs.get("model"), "input": _to_jsonable(kwargs.get("input"))}
+
+
+class _Responses:
+    def __init__(self, cassette, inner):
+        self._cassette = cassette
+        self._inner = inner
+
+    def create(self, **kwargs):
+        if kwargs.get("stream"):
+            raise CassetteMiss("Streaming responses cannot be recorded or replayed")
+        result = self._cassette.call(
+            "llm", _llm_payload(kwargs),
+            lambda: self._inner.responses.create(**kwargs),
+        )
+        return to_namespace(result) if self._cassette.mode == "replay" else result
+
+
+class _Conversations:
+    def __init__(self, cassette, inner):
+        self._cassette = cassette
+        self._inner = inner
+
+    def create(self, **kwargs):
+        # Conversations are replayed in creation order, not by content
+        result = self._cassette.call(
+            "conversation", {},
+            lambda: self._inner.conversations.create(**kwargs),
+        )
+        return to_namespace(result) if self._cassette.mode == "replay" else result
+
+
+class _CassetteClient:
+    def __init__(self, cassette, inner):
+        self.responses = _Responses(cassette, inner)
+        self.conversations = _Conversations(cassette, inner)
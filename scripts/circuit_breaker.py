@@ -0,0 +1,267 @@
+"""
+Circuit breakers and hedged requests for the agent's tool backends.
+
+When the SQL endpoint or AI Search degrades, every turn otherwise pays the
+full timeout on every call, and the model keeps retrying. A CircuitBreaker
+per backend tracks the outcome and latency of recent calls:
+
+    closed     calls go through; failures and slow calls are counted over a
+               sliding window
+    open       too many of the recent calls failed or were slow - calls fail
+               fast with a tool error telling the model to adapt, for a
+               cooldown period
+    half-open  after the cooldown one probe call goes through; success
+               closes the breaker, failure opens it again
+
+Breakers come from a process-wide registry (get_breaker), so every session
+and worker thread in one process - the load test, the eval, the gateway -
+shares the state of a backend instead of each discovering the outage on
+its own.
+
+A Hedger fires a second copy of an idempotent call (search) when the first
+has not answered after the backend's observed p95 latency, and returns
+whichever finishes first. It cuts the latency tail at the price of a few
+percent extra requests.
+
+Used by 08_test_foundry_agent.py and agent_gateway.py:
+    python 08_test_foundry_agent.py --hedge-search
+    python 08_test_foundry_agent.py --breaker-failure-rate 0.3 --breaker-cooldown 60
+    python agent_gateway.py --no-circuit-breaker
+"""
+
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+LATENCY_SAMPLES = 200  # Successful call latencies kept for the p95
+MIN_HEDGE_SAMPLES = 20  # No hedging until the p95 means something
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a backend whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Failure/latency tracking and fail-fast for one backend."""
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5, slow_seconds=None, cooldown=30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # True = failed or slow
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._probing = False
+        self.state = CLOSED
+        self.opened_at = None
+        self.stats = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        """Admit a call, or raise CircuitOpen."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True  # This call is the probe
+                return
+            self.stats["rejected"] += 1
+            retry_in = max(1, self.cooldown - (time.monotonic() - self.opened_at)) if self.state == OPEN else 1
+            failed = sum(self._outcomes)
+            total = len(self._outcomes)
+        raise CircuitOpen(
+            f"{self.name} is temporarily unavailable ({failed} of its last {total} calls failed or "
+            f"timed out; retrying in about {retry_in:.0f} s). Do not call this tool again for this "
+            f"question - answer from the other tools or tell the user this data is unavailable right now."
+        )
+
+    def record(self, elapsed, failed=False):
+        """Record the outcome of an admitted call."""
+        slow = not failed and self.slow_seconds is not None and elapsed > self.slow_seconds
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += failed
+            self.stats["slow"] += slow
+            if not failed:
+                self._latencies.append(elapsed)
+            bad = failed or slow
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                if bad:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(bad)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.stats["opened"] += 1
+
+    def call(self, fn, *args, is_failure=None, **kwargs):
+        """Run fn through the breaker; its exceptions count as failures unless is_failure says no."""
+        self.before_call()
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(time.perf_counter() - start, failed=is_failure(e) if is_failure else True)
+            raise
+        self.record(time.perf_counter() - start)
+        return result
+
+    async def call_async(self, factory, is_failure=None):
+        """Async call(): factory() returns the awaitable to run."""
+        self.before_call()
+        start = time.perf_counter()
+        try:
+            result = await factory()
+        except Exception as e:
+            self.record(time.perf_counter() - start, failed=is_failure(e) if is_failure else True)
+            raise
+        self.record(time.perf_counter() - start)
+        return result
+
+    def p95(self):
+        """p95 latency of recent successful calls in seconds, or None with too few samples."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats, state=self.state)
+        p95 = self.p95()
+        stats["p95_ms"] = round(p95 * 1000, 1) if p95 is not None else None
+        return stats
+
+
+# ============================================================================
+# Process-wide Registry
+# ============================================================================
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name, **config):
+    """The shared breaker for a backend; config applies when it is first created."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **config)
+        return _breakers[name]
+
+
+def breaker_summary():
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.summary() for b in breakers}
+
+
+# ============================================================================
+# Hedged Requests
+# ============================================================================
+
+class Hedger:
+    """Second request for slow idempotent calls; the first answer wins.
+
+    The hedge fires after `delay` seconds, or after the breaker's observed
+    p95 when no delay is given (no hedging until enough samples exist).
+    """
+
+    def __init__(self, breaker=None, delay=None, max_workers=8):
+        self.breaker = breaker
+        self.delay = delay
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0}
+
+    def hedge_after(self):
+        if self.delay:
+            return self.delay
+        return self.breaker.p95() if self.breaker else None
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="hedge")
+        # Each copy runs in its own copy of the caller's context (trace spans, turn deadline)
+        return self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn, hedged; blocks until the first successful copy (or the last failure)."""
+        self._count("calls")
+        delay = self.hedge_after()
+        if delay is None:
+            return fn(*args, **kwargs)
+        first = self._submit(fn, *args, **kwargs)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        self._count("hedged")
+        second = self._submit(fn, *args, **kwargs)
+        pending = {first, second}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = self._winner(done, pending, second)
+            if winner is not None:
+                return winner.result()
+            # One copy failed; wait for the other
+
+    async def call_async(self, factory):
+        """Async call(): factory() returns a new awaitable for each copy."""
+        self._count("calls")
+        delay = self.hedge_after()
+        if delay is None:
+            return await factory()
+        first = asyncio.ensure_future(factory())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        self._count("hedged")
+        second = asyncio.ensure_future(factory())
+        pending = {first, second}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = self._winner(done, pending, second)
+                if winner is not None:
+                    return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _winner(self, done, pending, hedge):
+        """First successful copy, the failed one once nothing is left, else None."""
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    self._count("hedge_wins")
+                return future
+        return None if pending else next(iter(done))
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+        after = self.hedge_after()
+        stats["hedge_after_ms"] = round(after * 1000, 1) if after is not None else None
+        return stats
@@ -0,0 +1,180 @@
+"""
+Conversation context compaction for long agent sessions.
+
+Every turn appends to the same server-side conversation, and tool outputs
+(result tables, search passages) stay in context for good, so input tokens -
+and latency - grow with every turn. The compactor keeps a local transcript of
+each conversation and, once the context passes a token threshold, moves the
+session to a fresh conversation seeded with:
+
+    - older turns: the question and final answer, with their tool outputs
+      replaced by one-line references (query + row count, search sources)
+    - the most recent turns: verbatim, including function calls and outputs
+
+Context size per turn (input tokens of the turn's first responses.create)
+is tracked so growth and the effect of each compaction are visible.
+
+Used by 08_test_foundry_agent.py:
+    python 08_test_foundry_agent.py --compact-threshold 12000 --compact-keep-turns 2
+"""
+
+import re
+import json
+import threading
+
+# Conversations API limit on items per create call
+ITEMS_PER_REQUEST = 20
+
+_ROWS_RE = re.compile(r"\((?:first )?(\d+) rows returned\)")
+_SOURCE_RE = re.compile(r"Source: (.+?) \(Page ([^)]*)\)|^\[\d+\] (\S+) p\.(\S+)", re.MULTILINE)
+
+
+def summarize_tool_output(name, arguments, output):
+    """One-line reference standing in for a tool output in compacted context."""
+    try:
+        args = json.loads(arguments or "{}")
+    except json.JSONDecodeError:
+        args = {}
+    if name == "execute_sql":
+        query = " ".join(args.get("sql_query", "").split())
+        rows = _ROWS_RE.findall(output)
+        size = f"{rows[-1]} rows" if rows else output.strip().splitlines()[0][:80] if output.strip() else "no output"
+        return f"execute_sql `{query[:300]}` -> {size}"
+    if name == "search_documents":
+        sources = []
+        for match in _SOURCE_RE.finditer(output):
+            source, page = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+            sources.append(f"{source} p.{page}")
+        found = ", ".join(dict.fromkeys(sources)) or "no documents"
+        return f"search_documents '{args.get('query', '')[:120]}' -> {found}"
+    return f"{name} -> {len(output)} chars"
+
+
+class Turn:
+    """One user turn: question, function calls with outputs, final answer."""
+
+    def __init__(self, question):
+        self.question = question
+        self.calls = []  # (name, call_id, arguments, output)
+        self.answer = ""
+
+    def add_calls(self, function_calls, tool_outputs):
+        outputs = {o["call_id"]: o["output"] for o in tool_outputs}
+        for fc in function_calls:
+            self.calls.append((fc.name, fc.call_id, fc.arguments, outputs.get(fc.call_id, "")))
+
+    def verbatim_items(self):
+        items = [{"type": "message", "role": "user", "content": self.question}]
+        for name, call_id, arguments, output in self.calls:
+            items.append({"type": "function_call", "call_id": call_id, "name": name, "arguments": arguments})
+            items.append({"type": "function_call_output", "call_id": call_id, "output": output})
+        if self.answer:
+            items.append({"type": "message", "role": "assistant", "content": self.answer})
+        return items
+
+    def compact_items(self):
+        items = [{"type": "message", "role": "user", "content": self.question}]
+        if self.calls:
+            references = "\n".join(f"- {summarize_tool_output(name, arguments, output)}"
+                                   for name, _, arguments, output in self.calls)
+            items.append({"type": "message", "role": "developer",
+                          "content": f"Tool results for this question (compacted):\n{references}"})
+        if self.answer:
+            items.append({"type": "message", "role": "assistant", "content": self.answer})
+        return items
+
+
+class ContextCompactor:
+    """Tracks context size per conversation and compacts past a threshold.
+
+    Sessions keep using the id they started with; resolve() maps it to the
+    current (possibly compacted) conversation id.
+    """
+
+    def __init__(self, openai_client, threshold_tokens, keep_recent_turns=2):
+        self.client = openai_client
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent_turns = max(0, keep_recent_turns)
+        self._lock = threading.Lock()
+        self._aliases = {}      # session conversation id -> current conversation id
+        self._turns = {}        # current conversation id -> [Turn]
+        self._last_input = {}   # current conversation id -> input tokens of last call
+        self.context_tokens = {}  # session id -> [first-call input tokens per turn]
+        self.stats = {"compactions": 0, "tokens_before": 0, "turns_compacted": 0, "failures": 0}
+
+    def resolve(self, conversation_id):
+        with self._lock:
+            return self._aliases.get(conversation_id, conversation_id)
+
+    def start_turn(self, conversation_id, question):
+        turn = Turn(question)
+        with self._lock:
+            self._turns.setdefault(conversation_id, []).append(turn)
+        return turn
+
+    def observe(self, conversation_id, response):
+        """Record the input tokens of a responses.create in a conversation."""
+        usage = getattr(response, "usage", None)
+        tokens = (getattr(usage, "input_tokens", 0) or 0) if usage is not None else 0
+        with self._lock:
+            self._last_input[conversation_id] = tokens
+
+    def record_turn(self, session_id, context_tokens):
+        """Record a turn's context size (input tokens of its first call)."""
+        with self._lock:
+            self.context_tokens.setdefault(session_id, []).append(context_tokens)
+
+    def growth(self, session_id):
+        """(context tokens this turn, change since the previous turn)"""
+        with self._lock:
+            history = self.context_tokens.get(session_id, [])
+        if not history:
+            return None, None
+        return history[-1], history[-1] - history[-2] if len(history) > 1 else None
+
+    def maybe_compact(self, session_id):
+        """Compact the session's conversation if its context is over the threshold.
+
+        Returns the new conversation id, or None if nothing was done.
+        """
+        current = self.resolve(session_id)
+        with self._lock:
+            tokens = self._last_input.get(current, 0)
+            turns = list(self._turns.get(current, []))
+        if tokens < self.threshold_tokens or len(turns) <= self.keep_recent_turns:
+            return None
+
+        split = len(turns) - self.keep_recent_turns
+        items = []
+        for turn in turns[:split]:
+            items.extend(turn.compact_items())
+        for turn in turns[split:]:
+            items.extend(turn.verbatim_items())
+
+        try:
+            new_conversation = self.client.conversations.create(items=items[:ITEMS_PER_REQUEST])
+            for start in range(ITEMS_PER_REQUEST, len(items), ITEMS_PER_REQUEST):
+                self.client.conversations.items.create(
+                    new_conversation.id, items=items[start:start + ITEMS_PER_REQUEST])
+        except Exception:
+            with self._lock:
+                self.stats["failures"] += 1
+            return None
+
+        with self._lock:
+            self._aliases[session_id] = new_conversation.id
+            self._turns[new_conversation.id] = turns
+            self._turns.pop(current, None)
+            self._last_input.pop(current, None)
+            self.stats["compactions"] += 1
+            self.stats["tokens_before"] += tokens
+            self.stats["turns_compacted"] += split
+        return new_conversation.id
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+            histories = [h for h in self.context_tokens.values() if h]
+        stats["sessions"] = len(histories)
+        stats["max_context_tokens"] = max((max(h) for h in histories), default=0)
+        return stats
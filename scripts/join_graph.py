@@ -0,0 +1,251 @@
+"""
+Relationship graph of the lakehouse tables with precomputed join paths.
+
+The ontology lists relationships one edge at a time, so a question spanning
+tables that are not directly related leaves the model to work out the chain
+of joins itself - and a wrong guess (joining on the wrong key, skipping the
+table in the middle) costs a failed or silently wrong query plus a retry.
+The relationships are turned into an undirected graph once and the shortest
+join path between every pair of tables is precomputed (breadth-first search
+from each table, fewest joins wins). Each edge carries a cardinality hint:
+
+    N:1   many rows on the left per row on the right (the usual foreign key)
+    1:1   both keys unique
+    N:M   neither side unique - joining multiplies rows
+
+taken from the column statistics of the table CSVs when available (the same
+cached statistics as schema_metadata), otherwise from the declared keys.
+
+The graph is rendered compactly into the schema prompt (JOINS plus one
+JOIN PATHS line per multi-hop pair) and used by sql_validation to reject
+JOIN ... ON conditions that pair key columns no relationship connects.
+
+Used by 04_generate_agent_prompt.py, 07_create_foundry_agent.py and
+sql_validation.py (08_test_foundry_agent.py).
+Print the graph on its own:
+    python join_graph.py --data-folder data/default
+"""
+
+import os
+import json
+from collections import deque
+
+from offline_sql import _data_paths
+
+MAX_PROMPT_PATHS = 40  # Multi-hop pairs listed in the prompt; the rest are left to the validator
+
+
+class JoinGraph:
+    """Tables as nodes, relationships as edges, shortest join paths between all pairs."""
+
+    def __init__(self, tables, relationships, stats=None):
+        # tables: {name: {"columns": [name or {"name", "type"}], "key": ...}}
+        self.tables = {}   # table_lower -> (table, key, {column_lower: column})
+        for name, info in tables.items():
+            columns = [c["name"] if isinstance(c, dict) else c for c in info.get("columns", [])]
+            self.tables[name.lower()] = (name, info.get("key"), {c.lower(): c for c in columns})
+        self.stats = stats or {}
+        self.edges = []      # (from, from_col, to, to_col, cardinality, fan_out), canonical names
+        self._adjacent = {t: [] for t in self.tables}  # table_lower -> [(other_lower, edge index)]
+        for rel in relationships:
+            edge = self._edge(rel)
+            if edge:
+                index = len(self.edges)
+                self.edges.append(edge)
+                self._adjacent[edge[0].lower()].append((edge[2].lower(), index))
+                self._adjacent[edge[2].lower()].append((edge[0].lower(), index))
+        self.join_columns = {t: set() for t in self.tables}  # Keys and relationship columns per table
+        for table, (_, key, _) in self.tables.items():
+            if key:
+                self.join_columns[table].add(key.lower())
+        for from_table, from_col, to_table, to_col, _, _ in self.edges:
+            self.join_columns[from_table.lower()].add(from_col.lower())
+            self.join_columns[to_table.lower()].add(to_col.lower())
+        self.paths = self._shortest_paths()  # (table_lower, table_lower) -> [edge index, ...]
+
+    @classmethod
+    def load(cls, data_dir, with_stats=True):
+        """Graph from config/schema.json (or the ontology), with data cardinality when the CSVs exist."""
+        config_dir, tables_dir = _data_paths(data_dir)
+        schema_path = os.path.join(config_dir, "schema.json")
+        if not os.path.exists(schema_path):
+            schema_path = os.path.join(config_dir, "ontology_config.json")
+        with open(schema_path, encoding="utf-8") as f:
+            schema = json.load(f)
+        tables = schema.get("tables", {})
+        stats = None
+        if with_stats and os.path.exists(tables_dir):
+            stats = column_stats(data_dir, tables)
+        return cls(tables, schema.get("relationships", []), stats)
+
+    def _edge(self, rel):
+        """Canonical (from, from_col, to, to_col, cardinality, fan_out), or None if unusable."""
+        source = self.tables.get((rel.get("from") or "").lower())
+        target = self.tables.get((rel.get("to") or "").lower())
+        if source is None or target is None:
+            return None
+        # Relationships read from the Fabric ontology carry no keys: assume the
+        # target's key, referenced by a same-named column in the source
+        to_col = target[2].get((rel.get("toKey") or target[1] or "").lower())
+        from_col = source[2].get((rel.get("fromKey") or to_col or "").lower())
+        if not from_col or not to_col:
+            return None
+        many_from = not self._unique(source, from_col)
+        many_to = not self._unique(target, to_col)
+        cardinality = f"{'N' if many_from else '1'}:{'M' if many_from and many_to else 'N' if many_to else '1'}"
+        return source[0], from_col, target[0], to_col, cardinality, self._fan_out(source[0], from_col, target[0], to_col)
+
+    def _unique(self, table, column):
+        stats = self.stats.get(table[0])
+        if stats and column in stats.get("columns", {}):
+            col = stats["columns"][column]
+            return col["distinct"] >= stats["rows"] - col["nulls"]
+        return column == table[1]
+
+    def _fan_out(self, from_table, from_col, to_table, to_col):
+        """Mean rows of `from_table` per distinct `to_col` value (None without statistics)."""
+        source, target = self.stats.get(from_table), self.stats.get(to_table)
+        if not source or not target or to_col not in target.get("columns", {}):
+            return None
+        distinct = target["columns"][to_col]["distinct"]
+        matched = source["rows"] - source["columns"].get(from_col, {}).get("nulls", 0)
+        return round(matched / distinct, 1) if distinct else None
+
+    def _shortest_paths(self):
+        paths = {}
+        for start in self.tables:
+            previous = {start: None}  # table -> (parent, edge index)
+            queue = deque([start])
+            while queue:
+                table = queue.popleft()
+                for other, index in self._adjacent[table]:
+                    if other not in previous:
+                        previous[other] = (table, index)
+                        queue.append(other)
+            for end in previous:
+                if end == start:
+                    continue
+                chain, node = [], end
+                while previous[node] is not None:
+                    node, index = previous[node]
+                    chain.append(index)
+                paths[(start, end)] = chain[::-1]
+        return paths
+
+    # ------------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------------
+
+    def path(self, start, end):
+        """Join conditions from `start` to `end` in walking order, [] if unrelated."""
+        conditions, table = [], start.lower()
+        for index in self.paths.get((table, end.lower()), []):
+            from_table, from_col, to_table, to_col, _, _ = self.edges[index]
+            if from_table.lower() == table:
+                conditions.append((from_table, from_col, to_table, to_col))
+                table = to_table.lower()
+            else:
+                conditions.append((to_table, to_col, from_table, from_col))
+                table = from_table.lower()
+        return conditions
+
+    def path_sql(self, start, end):
+        return " AND ".join(f"{a}.{ac} = {b}.{bc}" for a, ac, b, bc in self.path(start, end))
+
+    def check_join(self, left_table, left_col, right_table, right_col):
+        """Problem with the join condition left = right, or None if it is fine or not ours to judge.
+
+        Only conditions that compare key / relationship columns of two
+        different tables are judged: other equalities (dates, codes) may be
+        deliberate.
+        """
+        left, right = left_table.lower(), right_table.lower()
+        if left == right or left not in self.tables or right not in self.tables:
+            return None
+        pair = {(left, left_col.lower()), (right, right_col.lower())}
+        for from_table, from_col, to_table, to_col, _, _ in self.edges:
+            if pair == {(from_table.lower(), from_col.lower()), (to_table.lower(), to_col.lower())}:
+                return None
+        if left_col.lower() not in self.join_columns[left] or right_col.lower() not in self.join_columns[right]:
+            return None
+        steps = self.path(left, right)
+        if not steps:
+            return None
+        condition = f"{self.tables[left][0]}.{left_col} = {self.tables[right][0]}.{right_col}"
+        if len(steps) == 1:
+            return (f"Join condition {condition} does not follow a relationship; "
+                    f"join on {self.path_sql(left, right)}.")
+        via = ", ".join(step[2] for step in steps[:-1])
+        return (f"Join condition {condition} does not follow a relationship: "
+                f"{self.tables[left][0]} and {self.tables[right][0]} are only related through {via} "
+                f"- join on {self.path_sql(left, right)}.")
+
+    # ------------------------------------------------------------------------
+    # Rendering
+    # ------------------------------------------------------------------------
+
+    def _edge_line(self, edge):
+        from_table, from_col, to_table, to_col, cardinality, fan_out = edge
+        line = f"{from_table}.{from_col} -> {to_table}.{to_col} {cardinality}"
+        if fan_out is not None and cardinality != "1:1":
+            line += f" (~{fan_out:g} {from_table} rows per {to_table})"
+        return line
+
+    def multi_hop(self):
+        """(start, end) table pairs whose shortest path needs more than one join, each pair once."""
+        names = [name for name, _, _ in self.tables.values()]
+        return [(a, b) for i, a in enumerate(names) for b in names[i + 1:]
+                if len(self.paths.get((a.lower(), b.lower()), [])) > 1]
+
+    def prompt_lines(self):
+        """JOINS / JOIN PATHS section of the schema prompt (empty without relationships)."""
+        if not self.edges:
+            return []
+        lines = ["JOINS (N:1 = many left rows per right row):"]
+        lines += [f"  {self._edge_line(edge)}" for edge in self.edges]
+        pairs = self.multi_hop()
+        if pairs:
+            lines.append("JOIN PATHS (shortest, for tables not joined directly):")
+            for start, end in pairs[:MAX_PROMPT_PATHS]:
+                lines.append(f"  {start}~{end}: {self.path_sql(start, end)}")
+            if len(pairs) > MAX_PROMPT_PATHS:
+                lines.append(f"  ({len(pairs) - MAX_PROMPT_PATHS} more pairs: follow the JOINS above)")
+        return lines
+
+    def join_hint(self):
+        """One-line join guidance for the agent instructions."""
+        hints = [f"{a}.{ac} = {b}.{bc} ({cardinality})" for a, ac, b, bc, cardinality, _ in self.edges]
+        if self.multi_hop():
+            hints.append("tables not joined directly: use the JOIN PATHS in the schema")
+        return "; ".join(hints)
+
+    def summary(self):
+        return {"tables": len(self.tables), "relationships": len(self.edges),
+                "multi_hop_pairs": len(self.multi_hop()),
+                "unreachable_pairs": len(self.tables) * (len(self.tables) - 1) // 2
+                - len(self.paths) // 2}
+
+
+def column_stats(data_dir, tables):
+    """Cached per-column statistics (see schema_metadata) for schema.json-style tables."""
+    from schema_metadata import load_column_stats
+    return load_column_stats(data_dir, {
+        name: {"columns": [c if isinstance(c, dict) else {"name": c, "type": info.get("types", {}).get(c, "String")}
+                           for c in info.get("columns", [])]}
+        for name, info in tables.items()})
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Print the relationship graph and join paths")
+    p.add_argument("--data-folder", default=os.getenv("DATA_FOLDER", "data/default"))
+    p.add_argument("--path", nargs=2, metavar=("FROM", "TO"), help="Print the join path between two tables")
+    args = p.parse_args()
+
+    graph = JoinGraph.load(os.path.abspath(args.data_folder))
+    if args.path:
+        print(graph.path_sql(*args.path) or f"No join path between {args.path[0]} and {args.path[1]}")
+    else:
+        print("\n".join(graph.prompt_lines()) or "No relationships")
+        print(f"\n{graph.summary()}")
@@ -0,0 +1,83 @@
+"""
+Two-tier model routing for the agent loop.
+
+Every responses.create of a turn normally goes to the agent's one model,
+including the cheap "which tool, which arguments" steps. With routing the
+calls are split by what they are for:
+
+    plan      the first call of a turn (the user's message) - the model
+              decides which tools to call
+    answer    calls that submit tool outputs - usually the model now writes
+              the answer from the results (it may still call more tools)
+
+Each route can go to its own deployment, e.g. a small fast model plans and
+a larger one writes the answer, or the reverse. Every decision is logged:
+per call in the trace span and the turn metrics (written to the eval JSONL),
+and as per-route counts, latency and tokens in summary().
+
+Used by 08_test_foundry_agent.py:
+    python 08_test_foundry_agent.py --planner-model gpt-4o-mini
+    python 08_test_foundry_agent.py --planner-model gpt-4o-mini --answer-model gpt-4o --eval
+    python 08_test_foundry_agent.py --eval --eval-baseline data/default/eval/eval_single.jsonl
+"""
+
+import threading
+
+ROUTES = ("plan", "answer")
+
+
+class ModelRouter:
+    """Picks the deployment for each responses.create of a turn."""
+
+    def __init__(self, default_model, planner_model=None, answer_model=None):
+        self.default_model = default_model
+        self.models = {"plan": planner_model or default_model, "answer": answer_model or default_model}
+        self._lock = threading.Lock()
+        self.stats = {}  # (route, model) -> {"calls", "ms", "input_tokens", "output_tokens"}
+
+    @property
+    def enabled(self):
+        return any(model != self.default_model for model in self.models.values())
+
+    def describe(self):
+        """Short routing description, also used to key answer caches."""
+        if not self.enabled:
+            return self.default_model
+        return f"plan={self.models['plan']},answer={self.models['answer']}"
+
+    def route(self, request_input, final=False):
+        """(route, model) for a request: a user message is planned, tool outputs are answered."""
+        route = "plan" if isinstance(request_input, str) and not final else "answer"
+        return route, self.models[route]
+
+    def record(self, route, model, elapsed, response=None):
+        """Log one routed call; returns the entry added to the turn metrics."""
+        usage = getattr(response, "usage", None)
+        entry = {
+            "route": route,
+            "model": model,
+            "ms": round(elapsed * 1000, 1),
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+            "tool_calls": sum(1 for item in getattr(response, "output", None) or []
+                              if getattr(item, "type", None) == "function_call"),
+        }
+        with self._lock:
+            stats = self.stats.setdefault((route, model), {"calls": 0, "ms": 0.0, "input_tokens": 0,
+                                                           "output_tokens": 0, "tool_calls": 0})
+            stats["calls"] += 1
+            stats["ms"] += entry["ms"]
+            stats["input_tokens"] += entry["input_tokens"]
+            stats["output_tokens"] += entry["output_tokens"]
+            stats["tool_calls"] += entry["tool_calls"]
+        return entry
+
+    def summary(self):
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self.stats.items()]
+        result = {}
+        for (route, model), stats in sorted(items):
+            stats["mean_ms"] = round(stats["ms"] / stats["calls"], 1) if stats["calls"] else None
+            stats["ms"] = round(stats["ms"], 1)
+            result[f"{route}:{model}"] = stats
+        return result
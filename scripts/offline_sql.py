@@ -0,0 +1,458 @@
+"""
+Offline SQL backend - a local stand-in for the Fabric SQL analytics endpoint.
+
+Loads data/<folder>/tables/*.csv into an in-memory SQLite database, using the
+column types from config/ontology_config.json, and translates the T-SQL the
+agent writes (TOP, OFFSET/FETCH, [brackets], dbo., GETDATE, DATEADD, DATEDIFF,
+ISNULL, LEN, ...) into SQLite. Connections and cursors mimic the small pyodbc
+surface execute_sql() uses, so the agent can be developed, tested and
+benchmarked without Fabric capacity.
+
+Usage:
+    python offline_sql.py "SELECT TOP 5 * FROM network_outages"
+    python offline_sql.py --data-folder data/default "SELECT COUNT(*) FROM trouble_tickets"
+
+From 08_test_foundry_agent.py:
+    python 08_test_foundry_agent.py --offline-sql
+"""
+
+import os
+import re
+import csv
+import json
+import time
+import sqlite3
+import itertools
+
+from sql_utils import TOP_CLAUSE
+
+# Ontology types -> SQLite column affinity
+SQLITE_TYPES = {
+    "String": "TEXT",
+    "BigInt": "INTEGER",
+    "Int": "INTEGER",
+    "Integer": "INTEGER",
+    "Long": "INTEGER",
+    "Double": "REAL",
+    "Float": "REAL",
+    "Decimal": "REAL",
+    "Boolean": "INTEGER",
+    "DateTime": "TEXT",
+    "Date": "TEXT",
+}
+
+# T-SQL date part names -> (SQLite modifier unit, seconds per unit)
+DATE_PARTS = {
+    "year": ("years", None), "yy": ("years", None), "yyyy": ("years", None),
+    "quarter": ("months", None), "qq": ("months", None), "q": ("months", None),
+    "month": ("months", None), "mm": ("months", None), "m": ("months", None),
+    "week": ("days", 7 * 86400), "wk": ("days", 7 * 86400), "ww": ("days", 7 * 86400),
+    "day": ("days", 86400), "dd": ("days", 86400), "d": ("days", 86400),
+    "dayofyear": ("days", 86400), "dy": ("days", 86400), "y": ("days", 86400),
+    "hour": ("hours", 3600), "hh": ("hours", 3600),
+    "minute": ("minutes", 60), "mi": ("minutes", 60), "n": ("minutes", 60),
+    "second": ("seconds", 1), "ss": ("seconds", 1), "s": ("seconds", 1),
+}
+
+_db_counter = itertools.count(1)
+
+
+# ============================================================================
+# Loading
+# ============================================================================
+
+def _convert(value, col_type):
+    """Convert a CSV cell to the Python value stored for the ontology type."""
+    if value is None or value == "":
+        return None
+    if SQLITE_TYPES.get(col_type) == "INTEGER":
+        if col_type == "Boolean":
+            return 1 if value.strip().lower() in ("true", "1", "yes") else 0
+        try:
+            return int(value)
+        except ValueError:
+            return int(float(value))
+    if SQLITE_TYPES.get(col_type) == "REAL":
+        return float(value)
+    return value
+
+
+def _data_paths(data_dir):
+    """Resolve (config_dir, tables_dir), falling back to the old flat layout."""
+    config_dir = os.path.join(data_dir, "config")
+    tables_dir = os.path.join(data_dir, "tables")
+    if not os.path.exists(config_dir):
+        config_dir = data_dir
+    if not os.path.exists(tables_dir):
+        tables_dir = data_dir
+    return config_dir, tables_dir
+
+
+class OfflineDatabase:
+    """In-memory SQLite copy of the lakehouse tables.
+
+    The database lives in a shared-cache memory URI; each connect() opens a
+    cheap new connection to it so tool calls can run on separate threads.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = os.path.abspath(data_dir)
+        config_dir, tables_dir = _data_paths(self.data_dir)
+
+        config_path = os.path.join(config_dir, "ontology_config.json")
+        with open(config_path) as f:
+            self.ontology = json.load(f)
+
+        self.uri = f"file:offline_sql_{os.getpid()}_{next(_db_counter)}?mode=memory&cache=shared"
+        # Keeps the shared in-memory database alive for the lifetime of this object
+        self._keepalive = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+
+        start = time.perf_counter()
+        self.row_counts = {}
+        for table_name, table_def in self.ontology.get("tables", {}).items():
+            csv_path = os.path.join(tables_dir, f"{table_def.get('source_table', table_name)}.csv")
+            if os.path.exists(csv_path):
+                self.row_counts[table_name] = self._load_table(table_name, table_def, csv_path)
+        self._create_join_indexes()
+        self._keepalive.commit()
+        self.load_seconds = time.perf_counter() - start
+
+    def _load_table(self, table_name, table_def, csv_path):
+        """Create one table from its ontology definition and bulk-load the CSV."""
+        types = table_def.get("types", {})
+        columns = table_def.get("columns", [])
+        col_sql = ", ".join(f'"{col}" {SQLITE_TYPES.get(types.get(col, "String"), "TEXT")}' for col in columns)
+        self._keepalive.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        self._keepalive.execute(f'CREATE TABLE "{table_name}" ({col_sql})')
+
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            rows = [
+                tuple(_convert(record.get(col), types.get(col, "String")) for col in columns)
+                for record in reader
+            ]
+        placeholders = ", ".join("?" for _ in columns)
+        self._keepalive.executemany(f'INSERT INTO "{table_name}" VALUES ({placeholders})', rows)
+
+        key = table_def.get("key")
+        if key in columns:
+            self._keepalive.execute(f'CREATE INDEX "ix_{table_name}_{key}" ON "{table_name}" ("{key}")')
+        return len(rows)
+
+    def add_table(self, table_name, table_def, csv_path):
+        """Load a table that is not in the ontology (e.g. a metric aggregate) from a CSV."""
+        self.row_counts[table_name] = self._load_table(table_name, table_def, csv_path)
+        self._keepalive.commit()
+        return self.row_counts[table_name]
+
+    def _create_join_indexes(self):
+        """Index relationship foreign keys so joins stay cheap."""
+        for rel in self.ontology.get("relationships", []):
+            table, key = rel.get("from"), rel.get("fromKey")
+            if table in self.row_counts and key:
+                self._keepalive.execute(
+                    f'CREATE INDEX IF NOT EXISTS "ix_{table}_{key}" ON "{table}" ("{key}")'
+                )
+
+    def connect(self):
+        """Open a pyodbc-like connection to the offline database."""
+        return OfflineConnection(sqlite3.connect(self.uri, uri=True, check_same_thread=False))
+
+    def close(self):
+        self._keepalive.close()
+
+
+class OfflineConnection:
+    """Minimal pyodbc.Connection look-alike over sqlite3."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return OfflineCursor(self._conn.cursor())
+
+    def close(self):
+        self._conn.close()
+
+
+class OfflineCursor:
+    """Cursor that translates T-SQL to SQLite before executing."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.last_sql = None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql_query, *params):
+        self.last_sql = translate_tsql(sql_query)
+        self._cursor.execute(self.last_sql, params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+# ============================================================================
+# T-SQL -> SQLite Translation
+# ============================================================================
+
+def _mask_literals(sql):
+    """Replace string literals with placeholders and [ident] with "ident".
+
+    Returns (masked_sql, literals) so rewrites never touch literal text.
+    """
+    out = []
+    literals = []
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch == "'" or (ch in "Nn" and sql.startswith("'", i + 1) and (i == 0 or not sql[i - 1].isalnum())):
+            start = i + 1 if ch == "'" else i + 2
+            j = start
+            while True:
+                j = sql.find("'", j)
+                if j < 0:
+                    j = n
+                    break
+                if j + 1 < n and sql[j + 1] == "'":
+                    j += 2
+                    continue
+                break
+            literals.append("'" + sql[start:j] + "'")
+            out.append(f"\x00{len(literals) - 1}\x00")
+            i = j + 1
+        elif ch == "[":
+            j = sql.find("]", i + 1)
+            j = n if j < 0 else j
+            out.append('"' + sql[i + 1:j] + '"')
+            i = j + 1
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out), literals
+
+
+def _unmask_literals(sql, literals):
+    return re.sub(r"\x00(\d+)\x00", lambda m: literals[int(m.group(1))], sql)
+
+
+def _matching_paren(sql, open_pos):
+    """Index of the ')' closing the '(' at open_pos (or len(sql))."""
+    depth = 0
+    for i in range(open_pos, len(sql)):
+        if sql[i] == "(":
+            depth += 1
+        elif sql[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(sql)
+
+
+def _split_args(text):
+    """Split a function argument list on top-level commas."""
+    args = []
+    depth = 0
+    current = []
+    for ch in text:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            args.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    args.append("".join(current).strip())
+    return args
+
+
+def _rewrite_calls(sql, name, rewrite):
+    """Rewrite every NAME(args) call via rewrite(args) -> str (innermost first)."""
+    pattern = re.compile(rf"\b{name}\s*\(", re.IGNORECASE)
+    limit = len(sql)
+    while True:
+        # Right to left, so nested calls are rewritten before their parents
+        # and rewritten output is never matched again
+        matches = [m for m in pattern.finditer(sql) if m.start() < limit]
+        if not matches:
+            return sql
+        match = matches[-1]
+        limit = match.start()
+        open_pos = match.end() - 1
+        close_pos = _matching_paren(sql, open_pos)
+        replacement = rewrite(_split_args(sql[open_pos + 1:close_pos]))
+        sql = sql[:match.start()] + replacement + sql[close_pos + 1:]
+
+
+def _date_part(arg):
+    return DATE_PARTS.get(arg.strip().strip('"').lower(), ("days", 86400))
+
+
+def _dateadd(args):
+    if len(args) != 3:
+        return f"DATEADD({', '.join(args)})"
+    part, number, expr = args
+    unit, _ = _date_part(part)
+    if part.strip().lower() in ("quarter", "qq", "q"):
+        number = f"(({number}) * 3)"
+    elif part.strip().lower() in ("week", "wk", "ww"):
+        number = f"(({number}) * 7)"
+    return f"datetime({expr}, printf('%+d {unit}', {number}))"
+
+
+def _datediff(args):
+    if len(args) != 3:
+        return f"DATEDIFF({', '.join(args)})"
+    part, start, end = args
+    name = part.strip().strip('"').lower()
+    if name in ("year", "yy", "yyyy"):
+        return f"(CAST(strftime('%Y', {end}) AS INTEGER) - CAST(strftime('%Y', {start}) AS INTEGER))"
+    if name in ("month", "mm", "m", "quarter", "qq", "q"):
+        months = (f"((CAST(strftime('%Y', {end}) AS INTEGER) * 12 + CAST(strftime('%m', {end}) AS INTEGER)) - "
+                  f"(CAST(strftime('%Y', {start}) AS INTEGER) * 12 + CAST(strftime('%m', {start}) AS INTEGER)))")
+        return f"({months} / 3)" if name in ("quarter", "qq", "q") else months
+    if name in ("day", "dd", "d", "dayofyear", "dy", "y"):
+        # T-SQL counts date boundaries crossed, not elapsed 24h periods
+        return f"CAST(julianday(date({end})) - julianday(date({start})) AS INTEGER)"
+    _, seconds = _date_part(part)
+    return f"CAST(ROUND((julianday({end}) - julianday({start})) * 86400.0 / {seconds}) AS INTEGER)"
+
+
+def _cast(args_text):
+    """CAST(x AS type) - date types need SQLite date functions, not affinity."""
+    match = re.match(r"(.*)\s+AS\s+([\w\s(),]+)$", args_text, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return f"CAST({args_text})"
+    expr, target = match.group(1).strip(), match.group(2).strip().lower()
+    if target == "date":
+        return f"date({expr})"
+    if target.startswith("datetime") or target == "smalldatetime":
+        return f"datetime({expr})"
+    if target.startswith(("float", "real", "decimal", "numeric", "money")):
+        return f"CAST({expr} AS REAL)"
+    if target.startswith(("int", "bigint", "smallint", "tinyint", "bit")):
+        return f"CAST({expr} AS INTEGER)"
+    length = re.match(r"n?(?:var)?char\s*\(\s*(\d+)\s*\)", target)
+    if length:
+        return f"substr(CAST({expr} AS TEXT), 1, {length.group(1)})"
+    if "char" in target or target.startswith("text"):
+        return f"CAST({expr} AS TEXT)"
+    return f"CAST({expr} AS {match.group(2).strip()})"
+
+
+def _rewrite_top(sql):
+    """Turn SELECT [DISTINCT] TOP (n) [PERCENT] ... into ... LIMIT n at every nesting level.
+
+    TOP n PERCENT becomes a LIMIT of the rounded-up share of the query's
+    row count, as on the endpoint.
+    """
+    pattern = re.compile(r"\bSELECT(\s+(?:ALL|DISTINCT))?\s+" + TOP_CLAUSE, re.IGNORECASE)
+    while True:
+        matches = list(pattern.finditer(sql))
+        if not matches:
+            return sql
+        match = matches[-1]
+        # End of this SELECT's scope: the unmatched ')' after it, or end of text
+        depth = 0
+        end = len(sql)
+        for i in range(match.end(), len(sql)):
+            if sql[i] == "(":
+                depth += 1
+            elif sql[i] == ")":
+                if depth == 0:
+                    end = i
+                    break
+                depth -= 1
+        body = sql[match.end():end].strip()
+        head = "SELECT" + (match.group(1) or "")
+        limit = match.group(2) or match.group(3)
+        if match.group(4):
+            limit = f"(SELECT (COUNT(*) * {limit} + 99) / 100 FROM ({head} {body}))"
+        sql = f"{sql[:match.start()]}{head} {body} LIMIT {limit}{sql[end:]}"
+
+
+def translate_tsql(sql_query):
+    """Translate the T-SQL subset agents write into SQLite SQL."""
+    sql, literals = _mask_literals(sql_query.strip().rstrip(";"))
+
+    sql = re.sub(r"\b(?:\"?dbo\"?)\.", "", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bWITH\s*\(\s*NOLOCK\s*\)", "", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\b(?:GETDATE|SYSDATETIME|GETUTCDATE|SYSUTCDATETIME)\s*\(\s*\)", "datetime('now')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bCURRENT_TIMESTAMP\b", "datetime('now')", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bISNULL\s*\(", "IFNULL(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bLEN\s*\(", "LENGTH(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bCOUNT_BIG\s*\(", "COUNT(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bCHARINDEX\s*\(", "INSTR(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bCEILING\s*\(", "CEIL(", sql, flags=re.IGNORECASE)
+    sql = re.sub(
+        r"\bOFFSET\s+(\d+)\s+ROWS?\s+FETCH\s+(?:NEXT|FIRST)\s+(\d+)\s+ROWS?\s+ONLY\b",
+        r"LIMIT \2 OFFSET \1", sql, flags=re.IGNORECASE,
+    )
+    sql = re.sub(r"\bOFFSET\s+(\d+)\s+ROWS?\b", r"LIMIT -1 OFFSET \1", sql, flags=re.IGNORECASE)
+
+    sql = _rewrite_calls(sql, "DATEADD", _dateadd)
+    sql = _rewrite_calls(sql, "DATEDIFF", _datediff)
+    sql = _rewrite_calls(sql, "YEAR", lambda a: f"CAST(strftime('%Y', {a[0]}) AS INTEGER)")
+    sql = _rewrite_calls(sql, "MONTH", lambda a: f"CAST(strftime('%m', {a[0]}) AS INTEGER)")
+    sql = _rewrite_calls(sql, "DAY", lambda a: f"CAST(strftime('%d', {a[0]}) AS INTEGER)")
+    sql = _rewrite_calls(sql, "CONVERT", lambda a: _cast(f"{', '.join(a[1:2])} AS {a[0]}") if len(a) >= 2 else f"CONVERT({a[0]})")
+    sql = _rewrite_calls(sql, "TRY_CAST", lambda a: _cast(", ".join(a)))
+    sql = _rewrite_calls(sql, "CAST", lambda a: _cast(", ".join(a)))
+    sql = _rewrite_top(sql)
+
+    return _unmask_literals(sql, literals)
+
+
+# ============================================================================
+# Command Line
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    from sql_utils import fetch_bounded, format_table
+
+    p = argparse.ArgumentParser(description="Run T-SQL against the local tables/ CSVs")
+    p.add_argument("sql_query", help="T-SQL query to execute")
+    p.add_argument("--data-folder", default=None, help="Path to data folder (default: from .env)")
+    args = p.parse_args()
+
+    data_folder = args.data_folder
+    if not data_folder:
+        from load_env import load_all_env
+        load_all_env()
+        data_folder = os.getenv("DATA_FOLDER")
+    if not data_folder:
+        print("ERROR: DATA_FOLDER not set. Pass --data-folder")
+        raise SystemExit(1)
+
+    db = OfflineDatabase(data_folder)
+    print(f"Loaded {len(db.row_counts)} tables ({sum(db.row_counts.values())} rows) "
+          f"in {db.load_seconds * 1000:.1f} ms")
+
+    conn = db.connect()
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    cursor.execute(args.sql_query)
+    rows, truncated = fetch_bounded(cursor, 50, 16000)
+    elapsed = time.perf_counter() - start
+
+    print(f"SQLite: {cursor.last_sql}\n")
+    print(format_table([col[0] for col in cursor.description], rows, truncated=truncated))
+    print(f"\nQuery time: {elapsed * 1000:.3f} ms")
+    conn.close()
@@ -0,0 +1,477 @@
+"""
+Local Responses API emulator for load testing the agent loop.
+
+A small HTTP server that stands in for the OpenAI Responses and Conversations
+endpoints used by 08_test_foundry_agent.py (POST /responses, POST
+/conversations). It plays a scripted agent: a user message is answered with
+function calls, function_call_output input is answered with a final message.
+Latency is drawn from a log-normal distribution and a share of requests can
+be rejected with 429 + Retry-After, so client-side retry, concurrency and
+streaming paths can be exercised under load without spending quota.
+
+Usage:
+    python responses_emulator.py --port 8765 --latency-ms 800 --rate-limit 0.05
+
+From 08_test_foundry_agent.py (starts an in-process emulator):
+    python 08_test_foundry_agent.py --emulator --load-test 20
+    python 08_test_foundry_agent.py --emulator http://localhost:8765/v1 --eval
+
+Conversation state: the emulator counts the tokens of every item added to a
+conversation (inputs, outputs, POST /conversations/{id}/items) and reports
+them as input tokens on later responses, so context growth is visible.
+
+Agent references: agents registered with register_agent() can be named in a
+request ({"agent": {"type": "agent_reference", "name": ...}}) instead of
+sending model, instructions and tools; the stored definition is applied.
+
+Prompt caching: a request whose prefix (model, tools, instructions, in the
+exact bytes sent) was seen before reports that prefix plus the conversation
+so far as cached input tokens, once it reaches PROMPT_CACHE_MIN_TOKENS
+(rounded down to PROMPT_CACHE_BLOCK like the service does).
+
+Scripted behaviour for a user message:
+    - document words (policy, procedure, guideline, ...) -> search_documents
+    - everything else -> execute_sql against the first ontology table
+      (get_metric for aggregate words when started with a metric)
+    - quoted values and codes (OUT009) -> lookup_values alongside, when
+      started with value_lookup
+    - both kinds of words -> both calls in one response (parallel tool calls)
+"""
+
+import re
+import json
+import math
+import hashlib
+import time
+import random
+import secrets
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DOCUMENT_WORDS = re.compile(
+    r"\b(polic(y|ies)|procedures?|guidelines?|documentation|sla|standards?|steps|escalat\w*|threshold|defined)\b",
+    re.IGNORECASE,
+)
+DATA_WORDS = re.compile(
+    r"\b(how many|count|average|avg|total|sum|percentage|which|list|most|exceeded|rated)\b",
+    re.IGNORECASE,
+)
+METRIC_WORDS = re.compile(r"\b(how many|count|average|avg|total|sum)\b", re.IGNORECASE)
+VALUE_TERMS = re.compile(r"'([^']+)'|\"([^\"]+)\"|\b([A-Z]{2,}-?\d+)\b")
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK = 128
+
+
+class LatencyModel:
+    """Log-normal latency with a given median and spread (sigma)."""
+
+    def __init__(self, median_ms=800.0, sigma=0.5, seed=None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """One latency in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            z = self._random.gauss(0, 1)
+        return self.median_ms * math.exp(self.sigma * z) / 1000
+
+
+class EmulatorScript:
+    """Decides what the emulated model answers to each request."""
+
+    def __init__(self, table="data", sql_tool=True, tokens_per_char=0.25, metric=None, value_lookup=False):
+        self.table = table
+        self.sql_tool = sql_tool
+        self.tokens_per_char = tokens_per_char
+        self.metric = metric  # get_metric is called with this metric for aggregate questions
+        self.value_lookup = value_lookup  # lookup_values is called for quoted values and codes
+
+    def plan_tool_calls(self, text):
+        """Function calls for a user message as (name, arguments) pairs."""
+        wants_docs = bool(DOCUMENT_WORDS.search(text))
+        wants_data = self.sql_tool and (bool(DATA_WORDS.search(text)) or not wants_docs)
+        calls = []
+        if wants_data and self.metric and METRIC_WORDS.search(text):
+            calls.append(("get_metric", {"metric": self.metric, "group_by": None, "filters": None}))
+        elif wants_data:
+            calls.append(("execute_sql", {"sql_query": f"SELECT TOP 10 * FROM {self.table}"}))
+        terms = [next(group for group in match if group) for match in VALUE_TERMS.findall(text)]
+        if wants_data and self.value_lookup and terms:
+            calls.append(("lookup_values", {"terms": terms}))
+        if wants_docs or not calls:
+            calls.append(("search_documents", {"query": text}))
+        return calls
+
+    def answer(self, tool_outputs):
+        """Final message after tool outputs were submitted."""
+        sizes = ", ".join(f"{len(o.get('output', ''))} chars" for o in tool_outputs)
+        return f"Based on {len(tool_outputs)} tool result(s) ({sizes}), here is the emulated answer."
+
+    def tokens(self, payload):
+        return max(1, int(len(json.dumps(payload, default=str)) * self.tokens_per_char))
+
+
+def _new_id(prefix):
+    return f"{prefix}_{secrets.token_hex(12)}"
+
+
+def build_response(request, script, context_tokens=0, prefix_cached=False):
+    """Build a Responses API response object (as a dict) for one request.
+
+    `context_tokens` is the size of the conversation so far, which the
+    Responses API bills as input on every call. With `prefix_cached` the
+    definition prefix and that context count as cached input tokens.
+    """
+    request_input = request.get("input")
+    output = []
+    outputs = [item for item in request_input if isinstance(item, dict)
+               and item.get("type") == "function_call_output"] if isinstance(request_input, list) else []
+    if outputs or request.get("tool_choice") == "none":
+        text = script.answer(outputs)
+        output.append({
+            "id": _new_id("msg"),
+            "type": "message",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        })
+    else:
+        text = request_input if isinstance(request_input, str) else json.dumps(request_input)
+        for name, arguments in script.plan_tool_calls(text):
+            output.append({
+                "id": _new_id("fc"),
+                "type": "function_call",
+                "status": "completed",
+                "call_id": _new_id("call"),
+                "name": name,
+                "arguments": json.dumps(arguments),
+            })
+
+    prefix_tokens = script.tokens([request.get("instructions"), request.get("tools")])
+    input_tokens = context_tokens + prefix_tokens + script.tokens(request_input)
+    cached_tokens = 0
+    if prefix_cached and prefix_tokens + context_tokens >= PROMPT_CACHE_MIN_TOKENS:
+        cached_tokens = (prefix_tokens + context_tokens) // PROMPT_CACHE_BLOCK * PROMPT_CACHE_BLOCK
+    output_tokens = script.tokens(output)
+    return {
+        "id": _new_id("resp"),
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": request.get("model", "emulator"),
+        "output": output,
+        "parallel_tool_calls": True,
+        "tool_choice": request.get("tool_choice") or "auto",
+        "tools": request.get("tools") or [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": cached_tokens},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+def stream_events(response):
+    """Server-sent events for a response, in the Responses streaming format."""
+    seq = 0
+
+    def event(payload):
+        nonlocal seq
+        payload["sequence_number"] = seq
+        seq += 1
+        return payload
+
+    in_progress = dict(response, status="in_progress", output=[])
+    yield event({"type": "response.created", "response": in_progress})
+    for index, item in enumerate(response["output"]):
+        yield event({"type": "response.output_item.added", "output_index": index,
+                     "item": dict(item, status="in_progress")})
+        if item["type"] == "message":
+            text = item["content"][0]["text"]
+            for chunk in re.findall(r"\S+\s*", text):
+                yield event({"type": "response.output_text.delta", "item_id": item["id"],
+                             "output_index": index, "content_index": 0, "delta": chunk,
+                             "logprobs": []})
+        else:
+            yield event({"type": "response.function_call_arguments.done", "item_id": item["id"],
+                         "output_index": index, "arguments": item["arguments"]})
+        yield event({"type": "response.output_item.done", "output_index": index, "item": item})
+    yield event({"type": "response.completed", "response": response})
+
+
+class EmulatorStats:
+    """Thread-safe request counters and per-conversation context sizes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"responses": 0, "conversations": 0, "rate_limited": 0, "streams": 0,
+                       "items": 0, "client_disconnects": 0, "agent_references": 0, "prefix_hits": 0}
+        self.context_tokens = {}
+        self.prefixes = set()  # Hashes of request prefixes seen (emulated prompt cache)
+
+    def add(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def grow(self, conversation_id, tokens):
+        """Add tokens to a conversation; returns its size before the addition."""
+        if not conversation_id:
+            return 0
+        with self._lock:
+            before = self.context_tokens.get(conversation_id, 0)
+            self.context_tokens[conversation_id] = before + tokens
+            return before
+
+    def seen_prefix(self, request):
+        """Whether this request's prefix bytes were sent before (and remember them)."""
+        prefix = json.dumps([request.get("model"), request.get("tools"), request.get("instructions")])
+        digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        with self._lock:
+            seen = digest in self.prefixes
+            self.prefixes.add(digest)
+            if seen:
+                self.counts["prefix_hits"] += 1
+            return seen
+
+
+def make_handler(script, latency, rate_limit, stats, agents, retry_after=1):
+    """Request handler class bound to one emulator configuration."""
+    rng = random.Random()
+    rng_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_POST(self):
+            try:
+                self._handle_post()
+            except (BrokenPipeError, ConnectionResetError):
+                # Client gave up first (e.g. its request timeout ran out)
+                stats.add("client_disconnects")
+                self.close_connection = True
+
+        def _handle_post(self):
+            path = self.path.split("?")[0].rstrip("/")
+            request = self._read_json()
+
+            if path.endswith("/conversations"):
+                stats.add("conversations")
+                conversation_id = _new_id("conv")
+                stats.grow(conversation_id, script.tokens(request.get("items") or []))
+                self._send_json(200, {"id": conversation_id, "object": "conversation",
+                                      "created_at": int(time.time()), "metadata": {}})
+                return
+
+            if path.endswith("/items") and "/conversations/" in path:
+                stats.add("items")
+                conversation_id = path.split("/conversations/")[1].split("/")[0]
+                items = request.get("items") or []
+                stats.grow(conversation_id, script.tokens(items))
+                self._send_json(200, {"object": "list", "data": items, "has_more": False,
+                                      "first_id": None, "last_id": None})
+                return
+
+            if not path.endswith("/responses"):
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            with rng_lock:
+                limited = rng.random() < rate_limit
+            if limited:
+                stats.add("rate_limited")
+                self._send_json(429, {"error": {"message": "Rate limit exceeded (emulated)",
+                                                "type": "rate_limit_exceeded"}},
+                                {"Retry-After": str(retry_after), "retry-after-ms": str(retry_after * 1000)})
+                return
+
+            agent = request.get("agent")
+            if isinstance(agent, dict) and agent.get("type") == "agent_reference":
+                definition = agents.get(agent.get("name"))
+                if definition is None:
+                    self._send_json(404, {"error": {"message": f"Agent {agent.get('name')} not found",
+                                                    "type": "not_found"}})
+                    return
+                stats.add("agent_references")
+                request = dict(definition, **{k: v for k, v in request.items() if k != "agent"})
+
+            stats.add("responses")
+            conversation = request.get("conversation")
+            conversation_id = conversation.get("id") if isinstance(conversation, dict) else conversation
+            context = stats.grow(conversation_id, 0)
+            response = build_response(request, script, context, stats.seen_prefix(request))
+            stats.grow(conversation_id, script.tokens(request.get("input")) + response["usage"]["output_tokens"])
+            delay = latency.sample()
+
+            if not request.get("stream"):
+                time.sleep(delay)
+                self._send_json(200, response)
+                return
+
+            # Streaming: spend most of the latency before the first event,
+            # the rest spread over the events (like token generation)
+            stats.add("streams")
+            events = list(stream_events(response))
+            time.sleep(delay * 0.6)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            step = delay * 0.4 / max(1, len(events))
+            for item in events:
+                self.wfile.write(f"event: {item['type']}\ndata: {json.dumps(item)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(step)
+            self.close_connection = True
+
+    return Handler
+
+
+class ResponsesEmulator:
+    """Runs the emulator HTTP server on a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=800.0, sigma=0.5,
+                 rate_limit=0.0, table="data", sql_tool=True, seed=None, metric=None, value_lookup=False):
+        self.stats = EmulatorStats()
+        self.latency = LatencyModel(latency_ms, sigma, seed)
+        self.script = EmulatorScript(table=table, sql_tool=sql_tool, metric=metric, value_lookup=value_lookup)
+        self.agents = {}  # name -> stored definition (model, instructions, tools)
+        handler = make_handler(self.script, self.latency, rate_limit, self.stats, self.agents)
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def register_agent(self, name, model, instructions, tools):
+        """Store an agent definition that requests can reference by name."""
+        self.agents[name] = {"model": model, "instructions": instructions, "tools": tools}
+        return self
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="responses-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def emulator_tools(tables, sql_tool=True, metric_layer=None, value_lookup=False):
+    """Function tool definitions matching the ones 07 registers on the agent."""
+    tools = [{
+        "type": "function",
+        "name": "search_documents",
+        "description": "Search PDF documents for policies, guidelines and procedures.",
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}},
+            "required": ["query"],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    }]
+    if sql_tool:
+        tools.insert(0, {
+            "type": "function",
+            "name": "execute_sql",
+            "description": f"Execute a T-SQL query. Available tables: {', '.join(tables)}.",
+            "parameters": {
+                "type": "object",
+                "properties": {"sql_query": {"type": "string"}},
+                "required": ["sql_query"],
+                "additionalProperties": False,
+            },
+            "strict": True,
+        })
+    if metric_layer is not None:
+        tools.append({
+            "type": "function",
+            "name": "get_metric",
+            "description": metric_layer.tool_description(),
+            "parameters": metric_layer.tool_parameters(),
+            "strict": True,
+        })
+    if value_lookup:
+        from value_index import LOOKUP_VALUES_PARAMETERS, LOOKUP_VALUES_DESCRIPTION
+        tools.append({
+            "type": "function",
+            "name": "lookup_values",
+            "description": LOOKUP_VALUES_DESCRIPTION,
+            "parameters": LOOKUP_VALUES_PARAMETERS,
+            "strict": True,
+        })
+    return tools
+
+
+class EmulatedSearch:
+    """Canned search_documents backend with the same latency model."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def __call__(self, query, top=3):
+        time.sleep(self.latency.sample())
+        return self.format(query, top)
+
+    def format(self, query, top=3):
+        """Result text without the latency (for async callers that sleep themselves)."""
+        lines = []
+        for i in range(1, min(top, 10) + 1):
+            lines.append(f"\n--- Result {i} ---")
+            lines.append(f"Source: emulated_policy.pdf (Page {i})")
+            lines.append("Title: Emulated Policy")
+            lines.append(f"Content: Emulated passage {i} for '{query[:80]}'. "
+                         "Outages must be resolved within 240 minutes...")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Local Responses/Conversations API emulator")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--latency-ms", type=float, default=800.0, help="Median response latency (default: 800)")
+    p.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread (default: 0.5)")
+    p.add_argument("--rate-limit", type=float, default=0.0, help="Share of requests answered with 429 (0-1)")
+    p.add_argument("--table", default="data", help="Table used in scripted SQL calls")
+    args = p.parse_args()
+
+    emulator = ResponsesEmulator(args.host, args.port, args.latency_ms, args.latency_sigma,
+                                 args.rate_limit, args.table)
+    print(f"Responses emulator listening on {emulator.base_url} (Ctrl+C to stop)")
+    try:
+        emulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"\nRequests: {emulator.stats.counts}")
+        emulator.server.server_close()
@@ -0,0 +1,108 @@
+"""
+Statistical profile of large SQL results.
+
+When a query returns more rows than the agent can usefully read, execute_sql
+can send a compact profile instead of just the first rows plus a count - so
+the model can answer "what's the average / range / most common value" without
+issuing follow-up aggregate queries. The profile is computed locally with
+vectorized pandas operations:
+
+    numeric columns   min, p25, median, p75, max, mean
+    date columns      min, max
+    text columns      distinct count and the top-k values with counts
+    every column      null count
+
+and is returned together with a small sample of rows.
+
+Used by sql_utils.run_bounded_query() when 08 runs with:
+    python 08_test_foundry_agent.py --sql-summarize-over 200
+"""
+
+import re
+
+import pandas as pd
+
+_DATE_LIKE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def _number(value):
+    """Short rendering of a numeric statistic."""
+    if pd.isna(value):
+        return "NULL"
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return f"{value:.4g}"
+
+
+def _is_text(series):
+    """Object or string dtype (pandas 3 infers a dedicated str dtype)."""
+    return series.dtype == object or pd.api.types.is_string_dtype(series)
+
+
+def _as_datetime(series):
+    """Series parsed as datetimes if it holds date-like strings, else None."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if not _is_text(series):
+        return None
+    sample = series.dropna().head(50).astype(str)
+    if sample.empty or not sample.str.match(_DATE_LIKE).all():
+        return None
+    parsed = pd.to_datetime(series, errors="coerce")
+    return parsed if parsed.notna().sum() >= series.notna().sum() * 0.9 else None
+
+
+def profile_frame(df, top_k=5):
+    """One profile line per column: name | type | nulls | distinct | summary."""
+    lines = ["column | type | nulls | distinct | summary", "---|---|---|---|---"]
+    nulls = df.isna().sum()
+    distinct = df.nunique(dropna=True)
+
+    for name in df.columns:
+        series = df[name]
+        dates = None if pd.api.types.is_numeric_dtype(series) else _as_datetime(series)
+
+        if pd.api.types.is_bool_dtype(series):
+            kind = "bool"
+            counts = series.value_counts()
+            summary = ", ".join(f"{k}: {v}" for k, v in counts.items())
+        elif pd.api.types.is_numeric_dtype(series) or _numeric_text(series):
+            kind = "number"
+            values = pd.to_numeric(series, errors="coerce")
+            q = values.quantile([0.25, 0.5, 0.75])
+            summary = (f"min {_number(values.min())}, p25 {_number(q[0.25])}, median {_number(q[0.5])}, "
+                       f"p75 {_number(q[0.75])}, max {_number(values.max())}, mean {_number(values.mean())}")
+        elif dates is not None:
+            kind = "date"
+            summary = f"min {dates.min()}, max {dates.max()}".replace(" 00:00:00", "")
+        else:
+            kind = "text"
+            counts = series.astype("string").value_counts().head(top_k)
+            summary = "top: " + ", ".join(f"{value} ({count})" for value, count in counts.items())
+            if distinct[name] > top_k:
+                summary += f", ... {distinct[name] - top_k} more"
+
+        lines.append(f"{name} | {kind} | {int(nulls[name])} | {int(distinct[name])} | {summary}")
+    return lines
+
+
+def _numeric_text(series):
+    """True for object columns that hold numbers (e.g. DECIMAL from ODBC)."""
+    if not _is_text(series):
+        return False
+    non_null = series.dropna()
+    if non_null.empty:
+        return False
+    return pd.to_numeric(non_null.head(50), errors="coerce").notna().all() \
+        and not non_null.head(50).astype(str).str.match(_DATE_LIKE).any()
+
+
+def profile_result(columns, rows, total_rows=None, top_k=5):
+    """Profile text for a result set; `rows` may be a prefix of `total_rows`."""
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    total = total_rows if total_rows is not None else len(df)
+    scope = f"all {len(df):,} rows" if total == len(df) else f"first {len(df):,} of {total:,} rows"
+    lines = [f"Result profile ({scope}, {len(columns)} columns):"]
+    lines.extend(profile_frame(df, top_k))
+    return "\n".join(lines)
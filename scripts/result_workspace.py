@@ -0,0 +1,257 @@
+"""
+Per-conversation workspace of previous SQL results.
+
+Follow-up questions ("now break that down by region", "only the High impact
+ones") usually refine a result the agent already fetched. Each execute_sql
+result is kept in memory as a columnar pandas DataFrame under an id (r1, r2,
+...) for its conversation, and the query_previous_result tool filters,
+groups, aggregates and sorts it locally - milliseconds instead of another
+SQL endpoint round trip.
+
+Memory is bounded: when the total size of stored results passes the cap, the
+least recently used results (across all conversations) are evicted.
+
+Enabled in 08_test_foundry_agent.py when the agent has the tool, i.e. it
+was created with:
+    python 07_create_foundry_agent.py --result-workspace
+"""
+
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+
+import pandas as pd
+
+from sql_utils import format_result
+
+# Conversation whose tools are running; set by the agent loop and carried
+# into tool threads by tracing.run_in_context()
+active_conversation = contextvars.ContextVar("active_conversation", default=None)
+
+FILTER_OPS = ["=", "!=", ">", ">=", "<", "<=", "in", "contains"]
+AGGREGATES = {"count": "count", "sum": "sum", "avg": "mean", "min": "min", "max": "max",
+              "count_distinct": "nunique"}
+
+# Tool definition (also registered by 07_create_foundry_agent.py)
+QUERY_PREVIOUS_RESULT_PARAMETERS = {
+    "type": "object",
+    "properties": {
+        "result_id": {
+            "type": ["string", "null"],
+            "description": "Id of a previous execute_sql result (e.g. 'r2'); null for the most recent one."
+        },
+        "filters": {
+            "type": ["array", "null"],
+            "description": "Row filters, all of which must match.",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string"},
+                    "op": {"type": "string", "enum": FILTER_OPS},
+                    "value": {"type": "string", "description": "Comparison value; comma-separated list for 'in'."}
+                },
+                "required": ["column", "op", "value"],
+                "additionalProperties": False
+            }
+        },
+        "group_by": {
+            "type": ["array", "null"],
+            "items": {"type": "string"},
+            "description": "Columns to group by."
+        },
+        "aggregates": {
+            "type": ["array", "null"],
+            "description": "Aggregates to compute (per group if group_by is set).",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string"},
+                    "func": {"type": "string", "enum": list(AGGREGATES)}
+                },
+                "required": ["column", "func"],
+                "additionalProperties": False
+            }
+        },
+        "order_by": {
+            "type": ["array", "null"],
+            "items": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string"},
+                    "descending": {"type": "boolean"}
+                },
+                "required": ["column", "descending"],
+                "additionalProperties": False
+            }
+        },
+        "limit": {"type": ["integer", "null"], "description": "Max rows to return."}
+    },
+    "required": ["result_id", "filters", "group_by", "aggregates", "order_by", "limit"],
+    "additionalProperties": False
+}
+
+QUERY_PREVIOUS_RESULT_DESCRIPTION = (
+    "Filter, group, aggregate and sort a previous execute_sql result locally, without querying "
+    "the database again. Use for follow-ups that refine a result you already have (every "
+    "execute_sql result is saved with an id such as r1). Only works on the rows that result returned."
+)
+
+
+class ResultWorkspace:
+    """Stored results per conversation with a global LRU memory cap."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_rows=2000, max_output_rows=50,
+                 fmt="markdown", token_budget=None):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.max_output_rows = max_output_rows
+        self.fmt = fmt
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # (conversation_id, result_id) -> entry, LRU order
+        self._counters = {}            # conversation_id -> last result number
+        self.used_bytes = 0
+        self.stats = {"stored": 0, "evicted": 0, "queries": 0, "query_ms": 0.0, "errors": 0}
+
+    def add(self, conversation_id, sql_query, columns, rows, complete=True):
+        """Store a result; returns its id, or None if there is no active conversation."""
+        if conversation_id is None or not columns:
+            return None
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            number = self._counters.get(conversation_id, 0) + 1
+            self._counters[conversation_id] = number
+            result_id = f"r{number}"
+            self._results[(conversation_id, result_id)] = {
+                "df": df, "sql": sql_query, "complete": complete, "bytes": size, "stored_at": time.time(),
+            }
+            self.used_bytes += size
+            self.stats["stored"] += 1
+            self._evict()
+        return result_id
+
+    def _evict(self):
+        while self.used_bytes > self.max_bytes and len(self._results) > 1:
+            _, entry = self._results.popitem(last=False)
+            self.used_bytes -= entry["bytes"]
+            self.stats["evicted"] += 1
+
+    def _get(self, conversation_id, result_id):
+        with self._lock:
+            if not result_id:
+                keys = [key for key in self._results if key[0] == conversation_id]
+                if not keys:
+                    return None, None
+                key = max(keys, key=lambda k: int(k[1][1:]))
+            else:
+                key = (conversation_id, result_id.strip().lower())
+            entry = self._results.get(key)
+            if entry is not None:
+                self._results.move_to_end(key)
+            return key[1], entry
+
+    def query(self, conversation_id, spec):
+        """Run a query_previous_result call and return the formatted result."""
+        start = time.perf_counter()
+        try:
+            result_id, entry = self._get(conversation_id, spec.get("result_id"))
+            if entry is None:
+                wanted = spec.get("result_id") or "yet"
+                return f"Error: no previous result {wanted} in this conversation - use execute_sql."
+            text = self._run(entry, spec, result_id)
+        except (KeyError, ValueError, TypeError) as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            return f"Error: {e.args[0] if e.args else e}"
+        finally:
+            with self._lock:
+                self.stats["queries"] += 1
+                self.stats["query_ms"] += (time.perf_counter() - start) * 1000
+        return text
+
+    def _run(self, entry, spec, result_id):
+        df = entry["df"]
+        missing = {c for c in _columns_in(spec) if c not in df.columns}
+        if missing:
+            raise ValueError(f"unknown column(s) {', '.join(sorted(missing))}; "
+                             f"{result_id} has: {', '.join(map(str, df.columns))}")
+
+        mask = pd.Series(True, index=df.index)
+        for f in spec.get("filters") or []:
+            mask &= _filter_mask(df[f["column"]], f["op"], f["value"])
+        view = df[mask]
+
+        group_by = spec.get("group_by") or []
+        aggregates = spec.get("aggregates") or []
+        if aggregates:
+            named = {f"{a['func']}_{a['column']}": (a["column"], AGGREGATES[a["func"]]) for a in aggregates}
+            if group_by:
+                view = view.groupby(group_by, dropna=False).agg(**named).reset_index()
+            else:
+                view = pd.DataFrame([{name: getattr(view[col], func)() for name, (col, func) in named.items()}])
+        elif group_by:
+            view = view.groupby(group_by, dropna=False).size().reset_index(name="count")
+
+        order_by = spec.get("order_by") or []
+        unknown = [o["column"] for o in order_by if o["column"] not in view.columns]
+        if unknown:
+            raise ValueError(f"cannot order by {', '.join(unknown)}; "
+                             f"columns are: {', '.join(map(str, view.columns))}")
+        if order_by:
+            view = view.sort_values([o["column"] for o in order_by],
+                                    ascending=[not o["descending"] for o in order_by])
+
+        limit = min(spec.get("limit") or self.max_output_rows, self.max_output_rows)
+        rows = list(view.head(limit).itertuples(index=False, name=None))
+        text = format_result([str(c) for c in view.columns], rows, len(view), False, self.fmt, self.token_budget)
+        if not entry["complete"]:
+            text += f"\n(Note: {result_id} held only the first {len(df)} rows of its query.)"
+        return text
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats, results=len(self._results), used_mb=round(self.used_bytes / 1e6, 2))
+        stats["query_ms"] = round(stats["query_ms"], 1)
+        return stats
+
+
+def _columns_in(spec):
+    columns = [f["column"] for f in spec.get("filters") or []]
+    columns += spec.get("group_by") or []
+    columns += [a["column"] for a in spec.get("aggregates") or []]
+    # order_by may also name aggregate outputs (e.g. sum_Amount), so it is
+    # checked after aggregation
+    return columns
+
+
+def _coerce(series, value):
+    """Cast a string filter value to the column's type."""
+    if pd.api.types.is_numeric_dtype(series):
+        return float(value)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.Timestamp(value)
+    return value
+
+
+def _filter_mask(series, op, value):
+    if op == "in":
+        values = [_coerce(series, v.strip()) for v in value.split(",")]
+        return series.isin(values)
+    if op == "contains":
+        return series.astype("string").str.contains(value, case=False, regex=False).fillna(False)
+    target = _coerce(series, value)
+    if op == "=":
+        return series == target
+    if op == "!=":
+        return series != target
+    if op == ">":
+        return series > target
+    if op == ">=":
+        return series >= target
+    if op == "<":
+        return series < target
+    if op == "<=":
+        return series <= target
+    raise ValueError(f"unsupported filter op '{op}' (use one of {', '.join(FILTER_OPS)})")
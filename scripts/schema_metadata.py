@@ -0,0 +1,290 @@
+"""
+Local schema metadata - introspection without a SQL endpoint round trip.
+
+When unsure about names or types the agent probes the lakehouse with
+INFORMATION_SCHEMA queries or SELECT TOP 1 * - each a full ODBC round trip
+for an answer that never changes between data loads. This module answers
+them locally from config/schema.json plus column statistics computed once
+from the table CSVs and cached in data/<folder>/cache/column_stats.json:
+
+    - INFORMATION_SCHEMA.TABLES / .COLUMNS queries run against an in-memory
+      copy of those views (any other query falls through to the endpoint)
+    - SELECT TOP n * FROM <table> probes (n <= 3) are served from cached
+      sample rows
+    - describe_tables() renders tables, columns, types, keys, joins and
+      statistics (row count, nulls, distinct, range or top values) for the
+      describe_tables tool
+
+The statistics cache is rebuilt when the CSVs change or 03 bumps the data
+version (see answer_cache.invalidate).
+
+Used by 08_test_foundry_agent.py (on by default; --no-metadata-fast-path to
+skip). The describe_tables tool is added to the agent with:
+    python 07_create_foundry_agent.py --describe-tables
+Print the description on its own:
+    python schema_metadata.py --data-folder data/default
+"""
+
+import os
+import re
+import csv
+import json
+import time
+import sqlite3
+import threading
+
+from offline_sql import _convert, _data_paths, translate_tsql
+from answer_cache import cache_dir, read_data_version
+
+STATS_FILENAME = "column_stats.json"
+SAMPLE_ROWS = 3  # Largest SELECT TOP n * treated as a probe (bigger ones want real rows)
+TOP_VALUES_MAX = 12  # Columns with at most this many distinct values list them all
+
+# Ontology types -> SQL Server type names reported by INFORMATION_SCHEMA
+SQL_TYPES = {
+    "String": "varchar",
+    "BigInt": "bigint",
+    "Int": "int",
+    "Integer": "int",
+    "Long": "bigint",
+    "Double": "float",
+    "Float": "float",
+    "Decimal": "decimal",
+    "Boolean": "bit",
+    "DateTime": "datetime2",
+    "Date": "date",
+}
+
+_INFO_SCHEMA_RE = re.compile(r"\[?INFORMATION_SCHEMA\]?\s*\.\s*\[?(TABLES|COLUMNS)\]?\b", re.IGNORECASE)
+_TOP_PROBE_RE = re.compile(
+    r"^\s*SELECT\s+TOP\s*\(?\s*(\d+)\s*\)?\s+\*\s+FROM\s+(?:\[?dbo\]?\s*\.\s*)?\[?(\w+)\]?\s*;?\s*$",
+    re.IGNORECASE)
+
+DESCRIBE_TABLES_PARAMETERS = {
+    "type": "object",
+    "properties": {
+        "tables": {
+            "type": ["array", "null"],
+            "items": {"type": "string"},
+            "description": "Tables to describe; null for all tables."
+        }
+    },
+    "required": ["tables"],
+    "additionalProperties": False
+}
+
+DESCRIBE_TABLES_DESCRIPTION = (
+    "Describe tables: columns, types, keys, joins, row counts and column statistics "
+    "(value ranges, distinct counts, common values). Instant and free - use it instead "
+    "of INFORMATION_SCHEMA or SELECT TOP 1 * probe queries."
+)
+
+
+# ============================================================================
+# Column Statistics
+# ============================================================================
+
+def _csv_signature(tables, tables_dir):
+    signature = {}
+    for table in tables:
+        path = os.path.join(tables_dir, f"{table}.csv")
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature[table] = [stat.st_size, int(stat.st_mtime)]
+    return signature
+
+
+def _column_stats(values, col_type):
+    non_null = [v for v in values if v is not None]
+    distinct = set(non_null)
+    stats = {"nulls": len(values) - len(non_null), "distinct": len(distinct)}
+    if non_null:
+        stats["min"], stats["max"] = min(non_null), max(non_null)
+    if col_type == "String" and 0 < len(distinct) <= TOP_VALUES_MAX:
+        counts = {}
+        for value in non_null:
+            counts[value] = counts.get(value, 0) + 1
+        stats["values"] = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+    return stats
+
+
+def compute_column_stats(tables, tables_dir):
+    """Row count, per-column statistics and sample rows for each table CSV."""
+    result = {}
+    for table, info in tables.items():
+        path = os.path.join(tables_dir, f"{table}.csv")
+        if not os.path.exists(path):
+            continue
+        types = {c["name"]: c["type"] for c in info["columns"]}
+        names = list(types)
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [tuple(_convert(record.get(c), types[c]) for c in names) for record in csv.DictReader(f)]
+        result[table] = {
+            "rows": len(rows),
+            "columns": {name: _column_stats([row[i] for row in rows], types[name])
+                        for i, name in enumerate(names)},
+            "sample": rows[:SAMPLE_ROWS],
+        }
+    return result
+
+
+def load_column_stats(data_dir, tables):
+    """Cached column statistics, recomputed when the CSVs or data version change."""
+    _, tables_dir = _data_paths(data_dir)
+    signature = {"csv": _csv_signature(tables, tables_dir), "data_version": read_data_version(data_dir)}
+    path = os.path.join(cache_dir(data_dir), STATS_FILENAME)
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("signature") == signature:
+                return cached["tables"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    stats = compute_column_stats(tables, tables_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"signature": signature, "tables": stats}, f, default=str)
+    # Round-trip through JSON so fresh and cached stats look the same
+    return json.loads(json.dumps(stats, default=str))
+
+
+# ============================================================================
+# Metadata
+# ============================================================================
+
+class SchemaMetadata:
+    """Schema plus statistics, answering introspection without the endpoint."""
+
+    def __init__(self, data_dir):
+        config_dir, _ = _data_paths(data_dir)
+        with open(os.path.join(config_dir, "schema.json"), encoding="utf-8") as f:
+            schema = json.load(f)
+        self.tables = schema.get("tables", {})
+        self.relationships = schema.get("relationships", [])
+        start = time.perf_counter()
+        self.stats = load_column_stats(data_dir, self.tables)
+        self.load_seconds = time.perf_counter() - start
+        self._views = self._build_views()
+        self._lock = threading.Lock()
+        self.counters = {"information_schema": 0, "top_probes": 0, "describe": 0, "served_ms": 0.0}
+
+    def _build_views(self):
+        """In-memory INFORMATION_SCHEMA.TABLES and .COLUMNS."""
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        text = "TEXT COLLATE NOCASE"
+        conn.execute(f"CREATE TABLE INFORMATION_SCHEMA_TABLES (TABLE_CATALOG {text}, TABLE_SCHEMA {text}, "
+                     f"TABLE_NAME {text}, TABLE_TYPE {text})")
+        conn.execute(f"CREATE TABLE INFORMATION_SCHEMA_COLUMNS (TABLE_CATALOG {text}, TABLE_SCHEMA {text}, "
+                     f"TABLE_NAME {text}, COLUMN_NAME {text}, ORDINAL_POSITION INTEGER, "
+                     f"IS_NULLABLE {text}, DATA_TYPE {text})")
+        for table, info in self.tables.items():
+            conn.execute("INSERT INTO INFORMATION_SCHEMA_TABLES VALUES (NULL, 'dbo', ?, 'BASE TABLE')", (table,))
+            for position, column in enumerate(info.get("columns", []), 1):
+                conn.execute("INSERT INTO INFORMATION_SCHEMA_COLUMNS VALUES (NULL, 'dbo', ?, ?, ?, 'YES', ?)",
+                             (table, column["name"], position, SQL_TYPES.get(column["type"], "varchar")))
+        conn.commit()
+        return conn
+
+    def _count(self, key, started):
+        with self._lock:
+            self.counters[key] += 1
+            self.counters["served_ms"] += (time.perf_counter() - started) * 1000
+
+    def intercept(self, sql_query):
+        """(columns, rows) for an introspection query answerable locally, else None."""
+        started = time.perf_counter()
+        if _INFO_SCHEMA_RE.search(sql_query):
+            local_sql = _INFO_SCHEMA_RE.sub(lambda m: f"INFORMATION_SCHEMA_{m.group(1).upper()}", sql_query)
+            with self._lock:
+                try:
+                    cursor = self._views.execute(translate_tsql(local_sql))
+                    columns = [c[0] for c in cursor.description]
+                    rows = cursor.fetchall()
+                except sqlite3.Error:
+                    return None  # Other views or syntax we don't model - ask the endpoint
+            self._count("information_schema", started)
+            return columns, rows
+
+        probe = _TOP_PROBE_RE.match(sql_query)
+        if probe:
+            count, table = int(probe.group(1)), probe.group(2)
+            stats = self.stats.get(table)
+            if stats is None or count > SAMPLE_ROWS:
+                return None
+            columns = [c["name"] for c in self.tables[table]["columns"]]
+            rows = [tuple(row) for row in stats["sample"][:count]]
+            self._count("top_probes", started)
+            return columns, rows
+        return None
+
+    def describe(self, table_names=None):
+        """Text description of tables for the describe_tables tool."""
+        started = time.perf_counter()
+        wanted = {t.lower() for t in table_names} if table_names else None
+        sections = []
+        for table, info in self.tables.items():
+            if wanted and table.lower() not in wanted:
+                continue
+            stats = self.stats.get(table, {})
+            header = f"{table}"
+            if "rows" in stats:
+                header += f" ({stats['rows']:,} rows)"
+            if info.get("key"):
+                header += f", key: {info['key']}"
+            lines = [header]
+            for column in info.get("columns", []):
+                name = column["name"]
+                line = f"  {name}: {SQL_TYPES.get(column['type'], 'varchar')}"
+                summary = _describe_column(stats.get("columns", {}).get(name))
+                if summary:
+                    line += f" - {summary}"
+                lines.append(line)
+            sections.append("\n".join(lines))
+
+        if wanted:
+            unknown = wanted - {t.lower() for t in self.tables}
+            if unknown:
+                sections.append(f"Unknown table(s): {', '.join(sorted(unknown))}. "
+                                f"Available: {', '.join(self.tables)}")
+        joins = [f"  {r['from']}.{r['fromKey']} -> {r['to']}.{r['toKey']}" for r in self.relationships
+                 if not wanted or r["from"].lower() in wanted or r["to"].lower() in wanted]
+        if joins:
+            sections.append("Joins:\n" + "\n".join(joins))
+        self._count("describe", started)
+        return "\n\n".join(sections)
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["served_ms"] = round(stats["served_ms"], 2)
+        return stats
+
+
+def _describe_column(stats):
+    if not stats:
+        return ""
+    parts = []
+    if "values" in stats:
+        parts.append(", ".join(f"{value} ({count})" for value, count in stats["values"]))
+    else:
+        if "min" in stats:
+            parts.append(f"{stats['min']} .. {stats['max']}")
+        parts.append(f"{stats['distinct']:,} distinct")
+    if stats["nulls"]:
+        parts.append(f"{stats['nulls']:,} nulls")
+    return ", ".join(parts)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Print the local schema metadata")
+    p.add_argument("--data-folder", default=os.getenv("DATA_FOLDER", "data/default"))
+    p.add_argument("tables", nargs="*")
+    args = p.parse_args()
+
+    metadata = SchemaMetadata(os.path.abspath(args.data_folder))
+    print(metadata.describe(args.tables or None))
+    print(f"\n(statistics loaded in {metadata.load_seconds * 1000:.1f} ms)")
@@ -0,0 +1,140 @@
+"""
+Speculative search prefetch for the agent loop.
+
+Most turns start with a search_documents call whose query is close to the
+user's own words. When a turn starts, the prefetcher launches a search for
+the raw question on the tool pool, concurrently with the first
+responses.create. If the model then asks for a sufficiently similar search,
+the prefetched result is served instead of a new request.
+
+Stats record how often the speculation paid off:
+    hits      model's search matched the prefetch (served from it)
+    misses    model searched, but for something else
+    unused    model did not search at all this turn
+    saved_ms  search time hidden behind the LLM call on hits
+    wasted_ms search time spent on prefetches that were not used
+
+Used by 08_test_foundry_agent.py:
+    python 08_test_foundry_agent.py --prefetch-search
+    python 08_test_foundry_agent.py --prefetch-search --prefetch-threshold 0.5
+"""
+
+import re
+import time
+import threading
+from concurrent.futures import Future
+
+# Words that carry no search intent; dropped before comparing queries
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "me", "of", "on", "or", "our", "show",
+    "tell", "that", "the", "there", "to", "us", "was", "we", "what", "when",
+    "where", "which", "who", "why", "with", "you", "your",
+}
+
+
+def query_terms(text):
+    """Lowercased content words of a query."""
+    return {w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS}
+
+
+def query_similarity(a, b):
+    """Jaccard similarity of the content words of two queries (0-1)."""
+    terms_a, terms_b = query_terms(a), query_terms(b)
+    if not terms_a or not terms_b:
+        return 1.0 if a.strip().lower() == b.strip().lower() else 0.0
+    return len(terms_a & terms_b) / len(terms_a | terms_b)
+
+
+class Prefetch:
+    """One in-flight speculative search for a user turn."""
+
+    def __init__(self, query, top, future):
+        self.query = query
+        self.top = top
+        self.future = future  # resolves to (result_text, elapsed_seconds)
+        self.claimed = False
+        self.searched = False
+
+
+class SearchPrefetcher:
+    """Starts speculative searches and decides when they can be served.
+
+    `submit(query, top)` must start the search in the background and return
+    a Future resolving to (result_text, elapsed_seconds).
+    """
+
+    def __init__(self, submit, threshold=0.6, top=3):
+        self._submit = submit
+        self.threshold = threshold
+        self.top = top
+        self._lock = threading.Lock()
+        self.stats = {"launched": 0, "hits": 0, "misses": 0, "unused": 0,
+                      "saved_ms": 0.0, "wasted_ms": 0.0}
+
+    def start(self, question):
+        """Launch the speculative search for a user turn."""
+        with self._lock:
+            self.stats["launched"] += 1
+        return Prefetch(question, self.top, self._submit(question, self.top))
+
+    def claim(self, prefetch, args):
+        """Future of (result, wait_seconds) if the prefetch can serve this search.
+
+        Returns None when the model's query is not similar enough (or the
+        prefetch was already used); the caller then runs the search itself.
+        The elapsed time reported for a hit is only the time spent waiting
+        for the prefetch to finish, which is what the turn actually paid.
+        """
+        if prefetch is None:
+            return None
+        prefetch.searched = True
+        query = args.get("query", "")
+        top = args.get("top", 3)
+        if prefetch.claimed or top != prefetch.top or query_similarity(query, prefetch.query) < self.threshold:
+            return None
+        prefetch.claimed = True
+
+        claimed_at = time.perf_counter()
+        served = Future()
+
+        def on_done(future):
+            wait = time.perf_counter() - claimed_at
+            try:
+                result, elapsed = future.result()
+            except Exception as e:
+                served.set_exception(e)
+                return
+            with self._lock:
+                self.stats["hits"] += 1
+                self.stats["saved_ms"] += max(0.0, elapsed - wait) * 1000
+            served.set_result((result, wait))
+
+        prefetch.future.add_done_callback(on_done)
+        return served
+
+    def finish(self, prefetch):
+        """Account for a prefetch at the end of its turn."""
+        if prefetch is None or prefetch.claimed:
+            return
+        with self._lock:
+            self.stats["misses" if prefetch.searched else "unused"] += 1
+        if not prefetch.future.cancel():
+            prefetch.future.add_done_callback(self._count_waste)
+
+    def _count_waste(self, future):
+        try:
+            _, elapsed = future.result()
+        except Exception:
+            return
+        with self._lock:
+            self.stats["wasted_ms"] += elapsed * 1000
+
+    def summary(self):
+        """Stats plus hit rate, rounded for printing."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["launched"], 3) if stats["launched"] else None
+        stats["saved_ms"] = round(stats["saved_ms"], 1)
+        stats["wasted_ms"] = round(stats["wasted_ms"], 1)
+        return stats
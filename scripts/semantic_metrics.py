@@ -0,0 +1,498 @@
+"""
+Semantic metric layer - named measures and dimensions over the ontology tables.
+
+Most SQL questions are simple aggregates ("average resolution time by impact
+level", "count by status"), yet each one makes the model write SQL from
+scratch against the base tables. The optional "metrics" section of
+ontology_config.json names them once:
+
+    "metrics": {
+        "measures": {
+            "avg_resolution_time": {"table": "trouble_tickets", "agg": "avg",
+                                    "column": "resolution_time",
+                                    "description": "Average ticket resolution time"}
+        },
+        "dimensions": {
+            "impact_level": {"table": "network_outages", "column": "impact_level"},
+            "ticket_month": {"table": "trouble_tickets", "column": "ticket_created",
+                             "grain": "month"}
+        }
+    }
+
+    agg         count, sum, avg, min, max or count_distinct
+    grain       year or month for date columns (values like 2024 / 202401)
+
+A dimension can break down a measure of its own table, or of a table that
+references it through a relationship (trouble_tickets -> network_outages),
+so tickets can be counted by the impact level of their outage.
+
+Each metric request (metric, group_by, filters) compiles to one T-SQL query.
+Additive measures (count, sum, avg, min, max) are served from pre-computed
+aggregate tables - one agg_<table> per measure table, grouped by its
+dimensions and holding row counts, sums, non-null counts, minima and
+maxima - which are a few rows instead of the whole table. A dimension whose
+values would make the aggregate nearly as large as the base table is left
+out of it; requests using it (and count_distinct) run against the base
+tables.
+
+The aggregates are built from tables/*.csv into tables/aggregates/ and
+loaded next to the base tables by 03_load_fabric_data.py; 08 builds them on
+the fly for --offline-sql.
+
+Used by:
+    python 07_create_foundry_agent.py --metric-tool   # adds the get_metric tool
+    python 03_load_fabric_data.py                       # loads the aggregate tables
+Print the catalog / build the aggregates on their own:
+    python semantic_metrics.py --data-folder data/default
+    python semantic_metrics.py --data-folder data/default --build
+    python semantic_metrics.py --data-folder data/default avg_resolution_time --group-by impact_level
+"""
+
+import os
+import csv
+import json
+import time
+import threading
+
+from offline_sql import _convert, _data_paths
+from schema_metadata import _csv_signature
+
+AGGREGATES_DIRNAME = "aggregates"
+MANIFEST_FILENAME = "aggregates.json"
+AGGREGATE_PREFIX = "agg_"
+BASE_TABLES = "base tables"  # compile() source of queries on the ontology tables
+MAX_AGGREGATE_SHARE = 0.5  # Largest aggregate worth keeping, as a share of its base table's rows
+ADDITIVE = ("count", "sum", "avg", "min", "max")
+AGGREGATIONS = ADDITIVE + ("count_distinct",)
+GRAINS = ("year", "month")
+NUMERIC_TYPES = ("BigInt", "Int", "Integer", "Long", "Double", "Float", "Decimal")
+
+
+class MetricError(ValueError):
+    """Invalid metric definition or request; the message is meant for the agent."""
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _grain_value(value, grain):
+    """year / month (yyyymm) number of a date or datetime value, None when unparseable."""
+    text = str(value or "")
+    try:
+        year = int(text[:4])
+        return year if grain == "year" else year * 100 + int(text[5:7])
+    except ValueError:
+        return None
+
+
+# ============================================================================
+# Metric Layer
+# ============================================================================
+
+class MetricLayer:
+    """Measures and dimensions from the ontology, compiled to SQL on request."""
+
+    def __init__(self, ontology, tables_dir=None):
+        section = ontology.get("metrics") or {}
+        self.tables = ontology.get("tables", {})
+        self.relationships = ontology.get("relationships", [])
+        self.tables_dir = tables_dir
+        self.measures = section.get("measures", {})
+        self.dimensions = section.get("dimensions", {})
+        self._validate()
+        self.aggregates = {}  # agg table name -> manifest entry (only those queries may use)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "aggregate": 0, "base": 0, "fallbacks": 0, "errors": 0}
+
+    @classmethod
+    def from_data_dir(cls, data_dir):
+        config_dir, tables_dir = _data_paths(os.path.abspath(data_dir))
+        with open(os.path.join(config_dir, "ontology_config.json"), encoding="utf-8") as f:
+            return cls(json.load(f), tables_dir)
+
+    @property
+    def enabled(self):
+        return bool(self.measures)
+
+    def _validate(self):
+        for name, measure in self.measures.items():
+            table = measure.get("table")
+            if table not in self.tables:
+                raise MetricError(f"Measure {name}: unknown table {table}")
+            if measure.get("agg") not in AGGREGATIONS:
+                raise MetricError(f"Measure {name}: agg must be one of {', '.join(AGGREGATIONS)}")
+            if measure["agg"] != "count" and measure.get("column") not in self.tables[table].get("columns", []):
+                raise MetricError(f"Measure {name}: unknown column {table}.{measure.get('column')}")
+        for name, dimension in self.dimensions.items():
+            table = dimension.get("table")
+            if dimension.get("column") not in self.tables.get(table, {}).get("columns", []):
+                raise MetricError(f"Dimension {name}: unknown column {table}.{dimension.get('column')}")
+            if dimension.get("grain") not in (None,) + GRAINS:
+                raise MetricError(f"Dimension {name}: grain must be one of {', '.join(GRAINS)}")
+
+    # ------------------------------------------------------------------
+    # Catalog
+    # ------------------------------------------------------------------
+
+    def _join(self, measure_table, dimension_table):
+        """Relationship joining a measure table to a dimension table (many-to-one), or None."""
+        for rel in self.relationships:
+            if rel.get("from") == measure_table and rel.get("to") == dimension_table:
+                return rel
+        return None
+
+    def dimensions_for(self, metric):
+        """Names of the dimensions a measure can be grouped or filtered by."""
+        return self._dimensions_of_table(self.measures[metric]["table"])
+
+    def _dimensions_of_table(self, table):
+        return [name for name, d in self.dimensions.items()
+                if d["table"] == table or self._join(table, d["table"])]
+
+    def _dimension_type(self, name):
+        dimension = self.dimensions[name]
+        if dimension.get("grain"):
+            return "BigInt"
+        return self.tables[dimension["table"]].get("types", {}).get(dimension["column"], "String")
+
+    def catalog(self):
+        """One line per metric: name, description and its dimensions."""
+        lines = []
+        for name, measure in self.measures.items():
+            about = measure.get("description") or f"{measure['agg']} of {measure['table']}.{measure.get('column', '*')}"
+            dims = ", ".join(self.dimensions_for(name)) or "none"
+            lines.append(f"- {name}: {about} (by: {dims})")
+        return "\n".join(lines)
+
+    def tool_description(self):
+        grains = [name for name, d in self.dimensions.items() if d.get("grain")]
+        note = f" Date dimensions ({', '.join(grains)}) use numbers like 2024 or 202401 (yyyymm)." if grains else ""
+        return ("Compute a named business metric, optionally broken down by and filtered on dimensions. "
+                "Runs on small pre-aggregated tables - use it instead of execute_sql whenever a metric "
+                f"answers the question (the metrics and their dimensions are listed in the instructions).{note}")
+
+    def tool_parameters(self):
+        """Strict JSON schema of the get_metric tool."""
+        dims = list(self.dimensions)
+        return {
+            "type": "object",
+            "properties": {
+                "metric": {"type": "string", "enum": list(self.measures),
+                           "description": "Metric to compute."},
+                "group_by": {
+                    "type": ["array", "null"],
+                    "items": {"type": "string", "enum": dims},
+                    "description": "Dimensions to break the metric down by; null for one overall value."
+                },
+                "filters": {
+                    "type": ["array", "null"],
+                    "description": "Keep only rows whose dimension has one of the values; null for no filter.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "dimension": {"type": "string", "enum": dims},
+                            "values": {"type": "array", "items": {"type": "string"}}
+                        },
+                        "required": ["dimension", "values"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["metric", "group_by", "filters"],
+            "additionalProperties": False
+        }
+
+    # ------------------------------------------------------------------
+    # SQL
+    # ------------------------------------------------------------------
+
+    def _base_expression(self, name):
+        dimension = self.dimensions[name]
+        column = f"{dimension['table']}.{dimension['column']}"
+        if dimension.get("grain") == "year":
+            return f"YEAR({column})"
+        if dimension.get("grain") == "month":
+            return f"YEAR({column}) * 100 + MONTH({column})"
+        return column
+
+    def _literals(self, name, values):
+        if not values:
+            raise MetricError(f"Filter on {name} has no values")
+        if self._dimension_type(name) in NUMERIC_TYPES:
+            try:
+                return [str(int(float(v))) for v in values]
+            except (TypeError, ValueError):
+                raise MetricError(f"{name} values are numbers, got {values}")
+        return [_quote(v) for v in values]
+
+    def _where(self, filters, expression):
+        clauses = []
+        for item in filters:
+            literals = self._literals(item["dimension"], item.get("values"))
+            target = expression(item["dimension"])
+            if len(literals) == 1:
+                clauses.append(f"{target} = {literals[0]}")
+            else:
+                clauses.append(f"{target} IN ({', '.join(literals)})")
+        return f"\nWHERE {' AND '.join(clauses)}" if clauses else ""
+
+    def _check(self, metric, group_by, filters):
+        if metric not in self.measures:
+            raise MetricError(f"Unknown metric {metric}. Available: {', '.join(self.measures)}")
+        allowed = self.dimensions_for(metric)
+        for name in list(group_by) + [f.get("dimension") for f in filters]:
+            if name not in allowed:
+                raise MetricError(f"{metric} cannot be broken down by {name}. "
+                                  f"Its dimensions: {', '.join(allowed) or 'none'}")
+
+    def base_sql(self, metric, group_by=(), filters=()):
+        """Query for a metric request against the base tables."""
+        measure = self.measures[metric]
+        table = measure["table"]
+        column = f"{table}.{measure.get('column')}"
+        aggregate = {
+            "count": "COUNT(*)",
+            "sum": f"SUM({column})",
+            "avg": f"AVG(CAST({column} AS FLOAT))",
+            "min": f"MIN({column})",
+            "max": f"MAX({column})",
+            "count_distinct": f"COUNT(DISTINCT {column})",
+        }[measure["agg"]]
+        select = [f"{self._base_expression(d)} AS {d}" for d in group_by] + [f"{aggregate} AS {metric}"]
+        joins = ""
+        for other in sorted({self.dimensions[d]["table"] for d in list(group_by) + [f["dimension"] for f in filters]}
+                            - {table}):
+            rel = self._join(table, other)
+            joins += f"\nLEFT JOIN {other} ON {table}.{rel['fromKey']} = {other}.{rel['toKey']}"
+        sql = f"SELECT {', '.join(select)}\nFROM {table}{joins}"
+        sql += self._where(filters, self._base_expression)
+        if group_by:
+            sql += f"\nGROUP BY {', '.join(self._base_expression(d) for d in group_by)}"
+            sql += f"\nORDER BY {metric} DESC"
+        return sql
+
+    def aggregate_sql(self, metric, group_by=(), filters=()):
+        """Query for a metric request against its aggregate table, or None if it cannot serve it."""
+        measure = self.measures[metric]
+        name = AGGREGATE_PREFIX + measure["table"]
+        entry = self.aggregates.get(name)
+        if entry is None or measure["agg"] not in ADDITIVE:
+            return None
+        if not set(group_by) | {f["dimension"] for f in filters} <= set(entry["dimensions"]):
+            return None
+        column = measure.get("column")
+        aggregate = {
+            "count": "SUM(row_count)",
+            "sum": f"SUM(sum_{column})",
+            "avg": f"CAST(SUM(sum_{column}) AS FLOAT) / NULLIF(SUM(count_{column}), 0)",
+            "min": f"MIN(min_{column})",
+            "max": f"MAX(max_{column})",
+        }[measure["agg"]]
+        select = list(group_by) + [f"{aggregate} AS {metric}"]
+        sql = f"SELECT {', '.join(select)}\nFROM {name}"
+        sql += self._where(filters, lambda d: d)
+        if group_by:
+            sql += f"\nGROUP BY {', '.join(group_by)}\nORDER BY {metric} DESC"
+        return sql
+
+    def compile(self, metric, group_by=None, filters=None, use_aggregates=True):
+        """(sql, source) for a metric request; source is the aggregate table or "base tables"."""
+        group_by = list(dict.fromkeys(group_by or []))
+        filters = list(filters or [])
+        self._check(metric, group_by, filters)
+        if use_aggregates:
+            sql = self.aggregate_sql(metric, group_by, filters)
+            if sql:
+                return sql, AGGREGATE_PREFIX + self.measures[metric]["table"]
+        return self.base_sql(metric, group_by, filters), BASE_TABLES
+
+    def drop_aggregate(self, name):
+        """Stop using an aggregate table (e.g. missing on the endpoint)."""
+        with self._lock:
+            self.aggregates.pop(name, None)
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["aggregate_tables"] = {name: entry["rows"] for name, entry in self.aggregates.items()}
+        return stats
+
+    # ------------------------------------------------------------------
+    # Pre-computed Aggregates
+    # ------------------------------------------------------------------
+
+    def _aggregates_dir(self):
+        return os.path.join(self.tables_dir, AGGREGATES_DIRNAME)
+
+    def _signature(self):
+        return {"csv": _csv_signature(self.tables, self.tables_dir),
+                "metrics": {"measures": self.measures, "dimensions": self.dimensions}}
+
+    def _read_table(self, table):
+        path = os.path.join(self.tables_dir, f"{table}.csv")
+        types = self.tables[table].get("types", {})
+        with open(path, newline="", encoding="utf-8") as f:
+            return [{c: _convert(v, types.get(c, "String")) for c, v in record.items()}
+                    for record in csv.DictReader(f)]
+
+    def _cube(self, table, rows, dims, lookups):
+        """Group rows by dims, accumulating the parts every additive measure needs."""
+        columns = sorted({m["column"] for m in self.measures.values()
+                          if m["table"] == table and m["agg"] in ADDITIVE and m["agg"] != "count"})
+        groups = {}
+        for row in rows:
+            key = []
+            for name in dims:
+                dimension = self.dimensions[name]
+                source = row
+                if dimension["table"] != table:
+                    rel = self._join(table, dimension["table"])
+                    source = lookups[dimension["table"]].get(row.get(rel["fromKey"]), {})
+                value = source.get(dimension["column"])
+                key.append(_grain_value(value, dimension["grain"]) if dimension.get("grain") and value else value)
+            group = groups.setdefault(tuple(key), {"row_count": 0})
+            group["row_count"] += 1
+            for column in columns:
+                value = row.get(column)
+                if value is None:
+                    continue
+                group[f"sum_{column}"] = group.get(f"sum_{column}", 0) + value
+                group[f"count_{column}"] = group.get(f"count_{column}", 0) + 1
+                group[f"min_{column}"] = min(group.get(f"min_{column}", value), value)
+                group[f"max_{column}"] = max(group.get(f"max_{column}", value), value)
+        parts = ["row_count"] + [f"{p}_{c}" for c in columns for p in ("sum", "count", "min", "max")]
+        return groups, parts
+
+    def build_aggregates(self):
+        """Compute agg_<table> CSVs and the manifest into tables/aggregates/; returns the manifest."""
+        start = time.perf_counter()
+        data = {table: self._read_table(table) for table in self.tables
+                if os.path.exists(os.path.join(self.tables_dir, f"{table}.csv"))}
+        lookups = {}
+        for rel in self.relationships:
+            if rel.get("to") in data:
+                lookups[rel["to"]] = {row.get(rel["toKey"]): row for row in data[rel["to"]]}
+
+        manifest = {"signature": self._signature(), "tables": {}, "loaded": False}
+        os.makedirs(self._aggregates_dir(), exist_ok=True)
+        for table in sorted({m["table"] for m in self.measures.values() if m["agg"] in ADDITIVE}):
+            if table not in data:
+                continue
+            rows = data[table]
+            dims = self._dimensions_of_table(table)
+            # Leave out the most selective dimensions until the aggregate is small
+            while True:
+                groups, parts = self._cube(table, rows, dims, lookups)
+                if not dims or len(groups) <= max(1, len(rows) * MAX_AGGREGATE_SHARE):
+                    break
+                dims.remove(max(dims, key=lambda d: len({k[dims.index(d)] for k in groups})))
+            name = AGGREGATE_PREFIX + table
+            types = {d: self._dimension_type(d) for d in dims}
+            types.update({p: self._part_type(table, p) for p in parts})
+            with open(os.path.join(self._aggregates_dir(), f"{name}.csv"), "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(dims + parts)
+                for key, group in sorted(groups.items(), key=lambda item: [str(v) for v in item[0]]):
+                    writer.writerow(list(key) + [group.get(p) for p in parts])
+            manifest["tables"][name] = {"source": table, "dimensions": dims, "columns": dims + parts,
+                                        "types": types, "rows": len(groups), "source_rows": len(rows)}
+        manifest["build_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        self._write_manifest(manifest)
+        return manifest
+
+    def _column_type(self, table, column):
+        return self.tables[table].get("types", {}).get(column, "String")
+
+    def _part_type(self, table, part):
+        if part == "row_count" or part.startswith("count_"):
+            return "BigInt"
+        kind, column = part.split("_", 1)
+        column_type = self._column_type(table, column)
+        if kind == "sum" and column_type not in ("BigInt", "Int", "Integer", "Long"):
+            return "Double"
+        return column_type
+
+    def _write_manifest(self, manifest):
+        with open(os.path.join(self._aggregates_dir(), MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def read_manifest(self):
+        path = os.path.join(self._aggregates_dir(), MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def aggregate_files(self, manifest):
+        """(table name, csv path) of each aggregate in a manifest."""
+        return [(name, os.path.join(self._aggregates_dir(), f"{name}.csv")) for name in manifest["tables"]]
+
+    def mark_loaded(self, manifest, names):
+        """Record which aggregate tables 03 loaded into the lakehouse."""
+        manifest["loaded"] = sorted(names)
+        self._write_manifest(manifest)
+
+    def use_loaded_aggregates(self):
+        """Serve from the aggregates 03 loaded (if they match the current CSVs and metrics)."""
+        manifest = self.read_manifest()
+        if not manifest or manifest.get("signature") != self._signature() or not manifest.get("loaded"):
+            return False
+        self.aggregates = {name: entry for name, entry in manifest["tables"].items()
+                           if name in manifest["loaded"]}
+        return bool(self.aggregates)
+
+    def load_into(self, offline_db):
+        """Build the aggregates if stale and add them to an offline_sql database."""
+        manifest = self.read_manifest()
+        if not manifest or manifest.get("signature") != self._signature():
+            manifest = self.build_aggregates()
+        for name, path in self.aggregate_files(manifest):
+            entry = manifest["tables"][name]
+            offline_db.add_table(name, {"columns": entry["columns"], "types": entry["types"]}, path)
+        self.aggregates = dict(manifest["tables"])
+        return manifest
+
+
+# ============================================================================
+# Command Line
+# ============================================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Print the metric catalog, build aggregates or compile a metric")
+    p.add_argument("--data-folder", default=os.getenv("DATA_FOLDER", "data/default"))
+    p.add_argument("--build", action="store_true", help="Build the aggregate tables into tables/aggregates/")
+    p.add_argument("metric", nargs="?", help="Metric to compile and run offline")
+    p.add_argument("--group-by", nargs="*", default=[])
+    args = p.parse_args()
+
+    layer = MetricLayer.from_data_dir(args.data_folder)
+    if not layer.enabled:
+        print("No metrics section in ontology_config.json")
+        raise SystemExit(1)
+    if not (args.build or args.metric):
+        print(layer.catalog())
+    if args.build:
+        manifest = layer.build_aggregates()
+        for name, entry in manifest["tables"].items():
+            print(f"[OK] {name}: {entry['rows']} rows (from {entry['source_rows']}), "
+                  f"dimensions: {', '.join(entry['dimensions']) or 'none'}")
+    if args.metric:
+        from offline_sql import OfflineDatabase
+        from sql_utils import format_table
+        db = OfflineDatabase(args.data_folder)
+        layer.load_into(db)
+        sql, source = layer.compile(args.metric, args.group_by)
+        print(f"\n-- {source}\n{sql}\n")
+        cursor = db.connect().cursor()
+        cursor.execute(sql)
+        print(format_table([c[0] for c in cursor.description], cursor.fetchall()))
@@ -0,0 +1,478 @@
+"""
+SQL helpers shared by the agent scripts.
+
+Bounded result fetching for agent-generated T-SQL:
+    - cap_query()      Rewrite a SELECT so the server returns at most N rows (TOP)
+    - count_query()    Build a row-count query for the uncapped result
+    - fetch_bounded()  Stream rows with fetchmany() under a row and byte budget
+    - format_table()   Render rows as the markdown table handed to the agent
+    - format_result()  Render rows as markdown, CSV or columnar JSON under a token budget
+    - run_bounded_query()  All of the above on an open connection; large
+                       results can be sent as a statistical profile + sample
+                       instead (see result_profile.py)
+
+Connection reuse:
+    - ConnectionPool   Small thread-safe pool of open DB-API connections
+
+The rewrites only touch statements they fully understand (a single plain
+SELECT). Anything else - CTEs, UNIONs, OFFSET/FETCH - runs unchanged and is
+bounded client-side by fetch_bounded() instead.
+"""
+
+import re
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+from tracing import span
+from tool_formats import encode_csv, encode_columnar, fit_to_budget
+
+# TOP n / TOP (n), optionally PERCENT; groups: n in parentheses, bare n, PERCENT
+TOP_CLAUSE = r"TOP\s*(?:\(\s*(\d+)\s*\)|(\d+))(\s*PERCENT\b)?"
+_TOP_RE = re.compile(r"^\s*" + TOP_CLAUSE, re.IGNORECASE)
+_SELECT_HEAD_RE = re.compile(r"^\s*SELECT(\s+(ALL|DISTINCT))?\b", re.IGNORECASE)
+
+
+def strip_sql(sql_query: str) -> str:
+    """Remove leading comments, surrounding whitespace and trailing semicolons."""
+    sql = sql_query.strip()
+    while True:
+        if sql.startswith("--"):
+            newline = sql.find("\n")
+            sql = sql[newline + 1:].lstrip() if newline >= 0 else ""
+        elif sql.startswith("/*"):
+            end = sql.find("*/")
+            sql = sql[end + 2:].lstrip() if end >= 0 else ""
+        else:
+            break
+    return sql.rstrip().rstrip(";").rstrip()
+
+
+def top_level_keywords(sql: str, keywords) -> list[tuple[str, int]]:
+    """Find keywords that appear outside parentheses, quotes and brackets.
+
+    Returns (KEYWORD, position) tuples in order of appearance. Multi-word
+    keywords such as "ORDER BY" are matched with any whitespace in between.
+    """
+    patterns = [(kw, re.compile(r"\s+".join(kw.split()) + r"\b", re.IGNORECASE)) for kw in keywords]
+    found = []
+    depth = 0
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"', "["):
+            close = "]" if ch == "[" else ch
+            j = sql.find(close, i + 1)
+            # Doubled quotes are escapes inside string literals
+            while j >= 0 and close != "]" and j + 1 < n and sql[j + 1] == close:
+                j = sql.find(close, j + 2)
+            i = n if j < 0 else j + 1
+            continue
+        if ch == "-" and sql.startswith("--", i):
+            j = sql.find("\n", i)
+            i = n if j < 0 else j + 1
+            continue
+        if ch == "/" and sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and (ch.isalpha() or ch == "_") and (i == 0 or not (sql[i - 1].isalnum() or sql[i - 1] in "_@#$")):
+            for kw, pattern in patterns:
+                if pattern.match(sql, i):
+                    found.append((kw, i))
+                    break
+        i += 1
+    return found
+
+
+def is_simple_select(sql: str) -> bool:
+    """True for a single SELECT statement without set operators or paging."""
+    if not _SELECT_HEAD_RE.match(sql):
+        return False
+    blockers = top_level_keywords(sql, ["UNION", "INTERSECT", "EXCEPT", "OFFSET", "INTO", "FOR"])
+    return not blockers and ";" not in sql
+
+
+def cap_query(sql_query: str, max_rows: int) -> tuple[str, bool]:
+    """Cap a SELECT at `max_rows` rows on the server with TOP.
+
+    An existing smaller TOP is kept, and so is TOP ... PERCENT (its row
+    count is unknown until the query runs - fetching bounds it instead).
+    Returns (sql, capped) where `capped` is False when the statement was
+    left unchanged.
+    """
+    sql = strip_sql(sql_query)
+    if not is_simple_select(sql):
+        return sql, False
+
+    head = _SELECT_HEAD_RE.match(sql)
+    rest = sql[head.end():]
+    top = _TOP_RE.match(rest)
+    if top:
+        if top.group(3) or int(top.group(1) or top.group(2)) <= max_rows:
+            return sql, False
+        rest = rest[top.end():]
+    return f"{sql[:head.end()]} TOP ({max_rows}) {rest.lstrip()}", True
+
+
+def count_query(sql_query: str) -> str | None:
+    """Build a COUNT_BIG(*) query over an uncapped simple SELECT.
+
+    A trailing ORDER BY is dropped since T-SQL rejects it in a derived table.
+    Returns None when the statement is not a simple SELECT or has its own TOP.
+    """
+    sql = strip_sql(sql_query)
+    if not is_simple_select(sql):
+        return None
+    head = _SELECT_HEAD_RE.match(sql)
+    if _TOP_RE.match(sql[head.end():]):
+        return None
+    order_by = top_level_keywords(sql, ["ORDER BY"])
+    if order_by:
+        sql = sql[:order_by[-1][1]].rstrip()
+    return f"SELECT COUNT_BIG(*) FROM ({sql}) AS _q"
+
+
+def format_value(value) -> str:
+    """Render one cell the way the agent sees it."""
+    return str(value) if value is not None else "NULL"
+
+
+def fetch_bounded(cursor, max_rows: int, max_bytes: int, batch_size: int = 50):
+    """Fetch at most `max_rows` rows and roughly `max_bytes` of rendered text.
+
+    Rows are streamed with fetchmany() so a huge result never lands in memory
+    at once. Returns (rows, truncated) where `truncated` is True if more rows
+    were available than the budget allowed.
+    """
+    rows = []
+    used = 0
+    while True:
+        batch = cursor.fetchmany(min(batch_size, max_rows + 1 - len(rows)))
+        if not batch:
+            return rows, False
+        for row in batch:
+            if len(rows) >= max_rows:
+                return rows, True
+            size = _row_size(row)
+            if rows and used + size > max_bytes:
+                return rows, True
+            rows.append(row)
+            used += size
+
+
+def bound_rows(rows, max_rows: int, max_bytes: int):
+    """Apply the fetch_bounded() row/byte budget to rows already in memory."""
+    used = 0
+    for index, row in enumerate(rows):
+        if index >= max_rows:
+            return rows[:index], True
+        used += _row_size(row)
+        if index and used > max_bytes:
+            return rows[:index], True
+    return rows, False
+
+
+def _row_size(row):
+    return sum(len(format_value(v)) + 3 for v in row) + 2
+
+
+def fetch_rows(cursor, limit: int, batch_size: int = 1000):
+    """Fetch up to `limit` rows in fetchmany() batches."""
+    rows = []
+    while len(rows) < limit:
+        batch = cursor.fetchmany(min(batch_size, limit - len(rows)))
+        if not batch:
+            break
+        rows.extend(batch)
+    return rows
+
+
+def format_table(columns, rows, total_rows=None, truncated=False) -> str:
+    """Format rows as a markdown table with a row-count footer."""
+    result_lines = []
+    result_lines.append("| " + " | ".join(columns) + " |")
+    result_lines.append("|" + "|".join(["---"] * len(columns)) + "|")
+
+    for row in rows:
+        result_lines.append("| " + " | ".join(format_value(v) for v in row) + " |")
+
+    result_lines.extend(row_footer(len(rows), total_rows, truncated))
+    return "\n".join(result_lines)
+
+
+def row_footer(shown, total_rows=None, truncated=False):
+    """Footer lines telling the agent how many rows it is (not) seeing."""
+    if total_rows is not None and total_rows > shown:
+        return [f"\n... and {total_rows - shown} more rows", f"\n({total_rows} rows returned)"]
+    if truncated:
+        return ["\n... more rows not shown", f"\n(first {shown} rows returned)"]
+    return [f"\n({shown} rows returned)"]
+
+
+def format_result(columns, rows, total_rows=None, truncated=False, fmt="markdown", token_budget=None):
+    """Render a result in `fmt` (markdown/csv/columnar), trimmed to a token budget.
+
+    When the budget is exceeded the largest row prefix that fits is kept and
+    the footer reports the rows left out.
+    """
+    # Rows trimmed for the budget are still known to exist
+    known_total = total_rows if total_rows is not None else (None if truncated else len(rows))
+
+    def render(count):
+        shown = rows[:count]
+        cut = truncated or count < len(rows)
+        if fmt == "markdown":
+            return format_table(columns, shown, known_total, cut)
+        body = encode_csv(columns, shown) if fmt == "csv" else encode_columnar(columns, shown)
+        return body + "".join(row_footer(count, known_total, cut))
+
+    text, _ = fit_to_budget(render, len(rows), token_budget)
+    return text
+
+
+def run_bounded_query(conn, sql_query, max_rows, max_bytes, fmt="markdown", token_budget=None,
+                      summarize_over=None, profile_max_rows=100000, sample_rows=10,
+                      on_result=None, keep_rows=2000):
+    """Run agent SQL on an open connection and return the formatted result.
+
+    The query is capped server-side with TOP where possible, rows are
+    fetched under the row/byte budget, and a count query reports the full
+    total only when the result was cut off. The result is rendered in `fmt`
+    within `token_budget` (see format_result).
+
+    With `summarize_over`, results larger than that many rows are fetched
+    (up to `profile_max_rows`) and sent as a statistical profile plus the
+    first `sample_rows` rows instead.
+
+    With `on_result(columns, rows, complete)`, up to `keep_rows` rows are
+    fetched and handed to the callback (e.g. the result workspace); any
+    text it returns is appended to the result. Every query then fetches up
+    to `keep_rows` rows, so keep it to a few thousand.
+    """
+    in_memory = bool(summarize_over) or on_result is not None
+    cursor = conn.cursor()
+    try:
+        # Cap rows on the server; anything the rewrite can't handle is
+        # still bounded client-side by fetch_bounded()
+        fetch_limit = max_rows
+        if summarize_over:
+            fetch_limit = max(fetch_limit, profile_max_rows)
+        if on_result is not None:
+            fetch_limit = max(fetch_limit, keep_rows)
+        capped_query, capped = cap_query(sql_query, fetch_limit + 1)
+        with span("sql.execute", capped=capped, query_chars=len(capped_query)):
+            cursor.execute(capped_query)
+
+        if in_memory:
+            columns = [col[0] for col in cursor.description]
+            with span("sql.fetch_all") as fetch_span:
+                rows = fetch_rows(cursor, fetch_limit + 1)
+                complete = len(rows) <= fetch_limit
+                rows = rows[:fetch_limit]
+                fetch_span.set_attributes(rows=len(rows), columns=len(columns), complete=complete)
+            note = on_result(columns, rows, complete) if on_result is not None else None
+
+            total_rows = len(rows) if complete else None
+            if not complete and capped:
+                # Release the unfinished result set before the count query
+                cursor.close()
+                cursor = None
+                total_rows = count_rows(conn, sql_query, columns)
+            if summarize_over and len(rows) > summarize_over:
+                result = summarize_large_result(columns, rows, total_rows, complete,
+                                                sample_rows, fmt, token_budget)
+            else:
+                # The result (or its kept prefix) is in memory, so its size is known
+                shown, truncated = bound_rows(rows, max_rows, max_bytes)
+                result = format_result(columns, shown, total_rows, truncated or not complete, fmt, token_budget)
+            return f"{result}\n{note}" if note else result
+
+        with span("sql.fetch") as fetch_span:
+            columns = [col[0] for col in cursor.description]
+            rows, truncated = fetch_bounded(cursor, max_rows, max_bytes)
+            fetch_span.set_attributes(rows=len(rows), columns=len(columns), truncated=truncated)
+
+        # Only pay for a count query when the result was actually cut off
+        total_rows = None
+        if truncated and capped:
+            cursor.close()
+            cursor = None
+            total_rows = count_rows(conn, sql_query, columns)
+
+        with span("sql.format", format=fmt) as format_span:
+            result = format_result(columns, rows, total_rows, truncated, fmt, token_budget)
+            format_span.set_attribute("bytes", len(result))
+        return result
+    finally:
+        if cursor is not None:
+            cursor.close()
+
+
+def count_rows(conn, sql_query, columns=None):
+    """Full row count of a query via count_query(), or None if it can't be counted.
+
+    T-SQL rejects a derived table with an unnamed (Msg 8155) or duplicate
+    (Msg 8156) column, so such results are not counted; SQLite accepts both,
+    which is why offline runs never show it. The count is only a nicety on
+    top of a query that already succeeded - if it fails anyway, the result
+    keeps its "more rows not shown" footer instead of turning into an error.
+    """
+    count_sql = count_query(sql_query)
+    if not count_sql or (columns is not None and not countable_columns(columns)):
+        return None
+    with span("sql.count") as count_span:
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(count_sql)
+            return cursor.fetchone()[0]
+        except Exception as e:
+            count_span.set_attribute("error", type(e).__name__)
+            return None
+        finally:
+            if cursor is not None:
+                _close_quietly(cursor)
+
+
+def countable_columns(columns) -> bool:
+    """True when every column has a name and no two names collide (case-insensitively)."""
+    names = [(name or "").lower() for name in columns]
+    return all(names) and len(set(names)) == len(names)
+
+
+def is_endpoint_failure(exc) -> bool:
+    """True when an error means the SQL endpoint is unhealthy rather than the query wrong.
+
+    pyodbc reports connection loss, login failures and timeouts as
+    OperationalError / InterfaceError and bad SQL as ProgrammingError and
+    friends; sqlite3 (the offline backend) errors are always the query's.
+    Anything else (token acquisition, driver crashes) counts as a failure.
+    """
+    module = type(exc).__module__
+    if module == "sqlite3":
+        return False
+    if module == "pyodbc":
+        return type(exc).__name__ in ("OperationalError", "InterfaceError")
+    return True
+
+
+def is_connection_error(exc) -> bool:
+    """True when an error means the connection itself is unusable.
+
+    pyodbc raises OperationalError / InterfaceError for lost links, login
+    failures and timeouts; other driver errors are checked for a
+    connection-class SQLSTATE (08xxx). Query errors (ProgrammingError,
+    DataError, ...), sqlite3 errors and non-driver exceptions leave the
+    connection intact.
+    """
+    if type(exc).__module__ != "pyodbc":
+        return False
+    if type(exc).__name__ in ("OperationalError", "InterfaceError"):
+        return True
+    state = exc.args[0] if exc.args else ""
+    return isinstance(state, str) and state.startswith("08")
+
+
+def summarize_large_result(columns, rows, total_rows, complete, sample_rows,
+                           fmt="markdown", token_budget=None):
+    """Profile + sample text for a result larger than the summarize threshold."""
+    from result_profile import profile_result
+
+    with span("sql.profile", rows=len(rows), columns=len(columns)) as profile_span:
+        profile = profile_result(columns, rows, total_rows)
+        sample = format_result(columns, rows[:sample_rows], total_rows, not complete, fmt, token_budget)
+        result = f"{profile}\n\nSample (first {min(sample_rows, len(rows))} rows):\n{sample}"
+        profile_span.set_attribute("bytes", len(result))
+    return result
+
+
+class ConnectionPool:
+    """Thread-safe pool of open connections created by `connect()`.
+
+    At most `max_size` connections exist at once; acquire() blocks until one
+    is free. Connections idle for longer than `max_idle_seconds` are closed
+    instead of reused (the endpoint drops idle sessions). A connection that
+    raised a connection-level error during use (see is_connection_error) is
+    discarded; after an ordinary query error (bad SQL) it is rolled back and
+    returned, so a model's SQL mistake does not cost a new token and login.
+    """
+
+    def __init__(self, connect, max_size=4, max_idle_seconds=300):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.opened = 0
+        self.reused = 0
+
+    def warm(self, count=1):
+        """Open up to `count` connections ahead of the first query."""
+        for _ in range(min(count, self.max_size)):
+            self._idle.put((self._open(), time.monotonic()))
+
+    def _open(self):
+        with span("sql.connect", pooled=True):
+            conn = self._connect()
+        self.opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block."""
+        self._slots.acquire()
+        conn = None
+        try:
+            while conn is None:
+                try:
+                    candidate, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._open()
+                    break
+                if time.monotonic() - idle_since > self.max_idle_seconds:
+                    _close_quietly(candidate)
+                    continue
+                conn = candidate
+                self.reused += 1
+            try:
+                yield conn
+            except Exception as e:
+                if is_connection_error(e) or not _rollback_quietly(conn):
+                    _close_quietly(conn)
+                    conn = None
+                raise
+        finally:
+            if conn is not None:
+                self._idle.put((conn, time.monotonic()))
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close_quietly(conn)
+
+
+def _rollback_quietly(conn):
+    """Roll back after a failed query; False if the connection can't even do that."""
+    try:
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
@@ -0,0 +1,293 @@
+"""
+Local pre-flight check of agent SQL before it reaches the SQL endpoint.
+
+Many failed agent queries are plain mistakes (LIMIT instead of TOP, dbo.
+prefixes, misspelled or wrongly cased names), and each one costs a round trip
+to Fabric and then another LLM turn. The query is parsed locally in the T-SQL
+dialect (sqlglot) and checked against the tables and columns in
+config/schema.json:
+
+    safe fixes    LIMIT n -> TOP n, dbo. prefixes dropped, table and column
+                  names recased to match the schema (the endpoint's default
+                  collation is case-sensitive)
+    errors        unknown tables or columns - returned to the agent at once
+                  with close matches, without contacting the endpoint;
+                  JOIN ... ON conditions pairing key columns that no
+                  relationship connects, with the right path (join_graph)
+
+Statements the parser cannot read are passed through unchanged, so the
+endpoint stays the final judge of valid T-SQL. Rejected and fixed queries are
+counted as avoided round trips.
+
+Used by 08_test_foundry_agent.py (on by default; --no-sql-validation to skip).
+Try it on its own:
+    python sql_validation.py --data-folder data/default "SELECT * FROM dbo.network_outages LIMIT 5"
+"""
+
+import os
+import sys
+import json
+import difflib
+import threading
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+    from sqlglot.tokens import TokenType
+    from sqlglot.optimizer.scope import traverse_scope
+except ImportError:
+    sqlglot = None
+
+
+def load_schema(config_dir):
+    """{table_lower: (table, {column_lower: column})} from schema.json or the ontology."""
+    tables = {}
+    schema_path = os.path.join(config_dir, "schema.json")
+    ontology_path = os.path.join(config_dir, "ontology_config.json")
+    if os.path.exists(schema_path):
+        with open(schema_path, encoding="utf-8") as f:
+            for name, table in json.load(f).get("tables", {}).items():
+                columns = [c["name"] if isinstance(c, dict) else c for c in table.get("columns", [])]
+                tables[name.lower()] = (name, {c.lower(): c for c in columns})
+    elif os.path.exists(ontology_path):
+        with open(ontology_path, encoding="utf-8") as f:
+            for name, table in json.load(f).get("tables", {}).items():
+                tables[name.lower()] = (name, {c.lower(): c for c in table.get("columns", [])})
+    return tables
+
+
+class Check:
+    """Outcome of validating one statement."""
+
+    def __init__(self, sql):
+        self.sql = sql      # Statement to run (fixed if fixes were applied)
+        self.fixes = []     # Human-readable descriptions of applied fixes
+        self.errors = []    # Problems that make the statement fail
+        self.parsed = False
+
+    def message(self):
+        """Error text for the agent when the statement is rejected."""
+        return "SQL Error (checked locally, query not sent): " + " ".join(self.errors)
+
+    def note(self):
+        """Line appended to the result so the agent sees what was changed."""
+        if not self.fixes:
+            return ""
+        return f"\n(Auto-fixed before running: {', '.join(self.fixes)})"
+
+
+class SqlValidator:
+    """Schema-aware T-SQL linter with safe auto-fixes."""
+
+    def __init__(self, schema, join_graph=None):
+        self.schema = schema
+        self.join_graph = join_graph
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "fixed": 0, "rejected": 0, "unparsed": 0}
+
+    @property
+    def available(self):
+        return sqlglot is not None and bool(self.schema)
+
+    def check(self, sql_query):
+        result = Check(sql_query)
+        if not self.available:
+            return result
+        try:
+            statements = sqlglot.parse(sql_query, read="tsql")
+        except SqlglotError:
+            statements = None
+        if not statements or len(statements) != 1 or statements[0] is None:
+            self._count("unparsed")
+            return result
+
+        tree = statements[0]
+        result.parsed = True
+        # TOP and LIMIT parse to the same node; the T-SQL generator writes TOP
+        if any(token.token_type == TokenType.LIMIT for token in sqlglot.tokenize(sql_query, read="tsql")):
+            result.fixes.append("LIMIT -> TOP")
+        try:
+            self._check_names(tree, result)
+        except SqlglotError:
+            # Scope analysis gave up on an unusual statement - let the endpoint decide
+            self._count("unparsed")
+            return Check(sql_query)
+
+        if result.errors:
+            self._count("rejected")
+        elif result.fixes:
+            result.sql = tree.sql(dialect="tsql")
+            self._count("fixed")
+        else:
+            self._count("checked")
+        return result
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _check_names(self, tree, result):
+        scopes = traverse_scope(tree)
+        for scope in scopes:
+            tables = {}   # source alias -> (table, columns) for base tables in this scope
+            derived = False  # Any source whose columns we don't know
+            for alias, source in scope.sources.items():
+                resolved = self._check_table(source, result) if isinstance(source, exp.Table) else None
+                if resolved:
+                    tables[alias.lower()] = resolved
+                else:
+                    derived = True  # Columns it provides are unknown
+            for column in scope.columns:
+                if column.find_ancestor(exp.Select) is not scope.expression:
+                    continue  # Belongs to a nested subquery with its own scope
+                self._check_column(column, scope, tables, derived, result)
+            if self.join_graph is not None:
+                self._check_joins(scope, tables, result)
+
+    def _check_table(self, table, result):
+        if table.catalog or table.db.lower() not in ("", "dbo"):
+            return None  # Cross-database or other schema - not ours to judge
+        if table.db:
+            table.set("db", None)
+            _add_fix(result, "removed dbo. prefix")
+        entry = self.schema.get(table.name.lower())
+        if entry is None:
+            result.errors.append(f"Unknown table '{table.name}'.{_suggest(table.name, [t for t, _ in self.schema.values()])}"
+                                 f" Available tables: {', '.join(t for t, _ in self.schema.values())}.")
+            return None
+        name, columns = entry
+        if table.name != name:
+            table.set("this", exp.to_identifier(name, quoted=table.this.quoted))
+            _add_fix(result, f"table name case ({name})")
+        return name, columns
+
+    def _check_column(self, column, scope, tables, derived, result):
+        if column.table:
+            qualifier = column.table.lower()
+            source = self._lookup(scope, qualifier, tables)
+            if source is None:
+                return  # Derived table, CTE or outer reference we cannot resolve
+            candidates = [source]
+        else:
+            if derived:
+                return  # Could come from a source we can't see into
+            # Unqualified: this scope's tables, then outer ones (correlated subqueries)
+            candidates = list(tables.values())
+            parent = scope.parent
+            while parent is not None:
+                candidates += self._scope_tables(parent)
+                parent = parent.parent
+            if not candidates or column.name.lower() in _select_aliases(scope):
+                return
+
+        wanted = column.name.lower()
+        for name, columns in candidates:
+            if wanted in columns:
+                if columns[wanted] != column.name:
+                    column.set("this", exp.to_identifier(columns[wanted], quoted=column.this.quoted))
+                    _add_fix(result, f"column name case ({columns[wanted]})")
+                return
+
+        all_columns = [c for _, columns in candidates for c in columns.values()]
+        where = " or ".join(name for name, _ in candidates)
+        result.errors.append(f"Unknown column '{column.name}' in {where}.{_suggest(column.name, all_columns)}"
+                             f" Columns: {', '.join(all_columns)}.")
+
+    def _check_joins(self, scope, tables, result):
+        """Equalities in JOIN ... ON between two base tables must follow a relationship."""
+        for join in scope.expression.args.get("joins") or []:
+            condition = join.args.get("on")
+            if condition is None:
+                continue
+            for equality in condition.find_all(exp.EQ):
+                left = _join_side(equality.this, tables)
+                right = _join_side(equality.expression, tables)
+                if left and right:
+                    problem = self.join_graph.check_join(*left, *right)
+                    if problem and problem not in result.errors:
+                        result.errors.append(problem)
+
+    def _lookup(self, scope, qualifier, tables):
+        if qualifier in tables:
+            return tables[qualifier]
+        if qualifier in {alias.lower() for alias in scope.sources}:
+            return None  # Derived source in this scope
+        parent = scope.parent
+        while parent is not None:
+            for alias, source in parent.sources.items():
+                if alias.lower() == qualifier:
+                    if isinstance(source, exp.Table) and source.name.lower() in self.schema:
+                        return self.schema[source.name.lower()]
+                    return None
+            parent = parent.parent
+        return None
+
+    def _scope_tables(self, scope):
+        return [self.schema[source.name.lower()] for source in scope.sources.values()
+                if isinstance(source, exp.Table) and source.name.lower() in self.schema]
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["avoided_round_trips"] = stats["fixed"] + stats["rejected"]
+        return stats
+
+
+def _add_fix(result, fix):
+    if fix not in result.fixes:
+        result.fixes.append(fix)
+
+
+def _join_side(node, tables):
+    """(table, column) for a column of one of this scope's base tables, else None."""
+    if not isinstance(node, exp.Column):
+        return None
+    wanted = node.name.lower()
+    if node.table:
+        candidates = [tables[node.table.lower()]] if node.table.lower() in tables else []
+    else:
+        candidates = [entry for entry in tables.values() if wanted in entry[1]]
+    if len(candidates) != 1 or wanted not in candidates[0][1]:
+        return None
+    name, columns = candidates[0]
+    return name, columns[wanted]
+
+
+def _select_aliases(scope):
+    selects = getattr(scope.expression, "selects", [])
+    return {select.alias.lower() for select in selects if select.alias}
+
+
+def _suggest(name, choices):
+    matches = difflib.get_close_matches(name.lower(), [c.lower() for c in choices], n=3, cutoff=0.6)
+    if not matches:
+        return ""
+    originals = {c.lower(): c for c in choices}
+    return " Did you mean " + " or ".join(f"'{originals[m]}'" for m in matches) + "?"
+
+
+if __name__ == "__main__":
+    import argparse
+    from join_graph import JoinGraph
+
+    p = argparse.ArgumentParser(description="Validate a T-SQL statement against the local schema")
+    p.add_argument("sql")
+    p.add_argument("--data-folder", default=os.getenv("DATA_FOLDER", "data/default"))
+    args = p.parse_args()
+
+    if sqlglot is None:
+        print("ERROR: sqlglot not installed (pip install -r scripts/requirements.txt)")
+        sys.exit(1)
+    config = os.path.join(args.data_folder, "config")
+    validator = SqlValidator(load_schema(config if os.path.isdir(config) else args.data_folder),
+                             JoinGraph.load(args.data_folder))
+    check = validator.check(args.sql)
+    if check.errors:
+        print(f"[FAIL] {check.message()}")
+        sys.exit(1)
+    print(f"[OK] {check.sql}")
+    if check.fixes:
+        print(f"     fixed: {', '.join(check.fixes)}")
+    elif not check.parsed:
+        print("     (not parsed - passed through unchanged)")
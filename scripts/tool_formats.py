@@ -0,0 +1,207 @@
+"""
+Token-efficient encodings for tool outputs.
+
+Every tool result is sent back to the model on the next responses.create, so
+its size is paid in prompt tokens (and latency) on every round. Encodings:
+
+SQL results (--sql-format):
+    markdown  Pipe table (default, what the agent always saw)
+    csv       Header + rows, compact numbers, empty cell for NULL
+    columnar  JSON keyed by column; a column with one repeated value is sent
+              once ("const"), low-cardinality columns are dictionary encoded
+              ("dict" + "codes")
+
+Search results (--search-format):
+    full      "--- Result i ---" blocks with 500 chars of content (default)
+    compact   One citation record per hit: [i] source p.N | title | snippet
+
+A token budget (--tool-token-budget) trims rows/results adaptively - the
+largest prefix that fits is kept and a footer says what was left out.
+
+Benchmark (token counts per encoding over queries on the local tables):
+    python tool_formats.py --data-folder data/default
+End-to-end latency per encoding:
+    python 08_test_foundry_agent.py --eval --offline-sql --sql-format csv
+"""
+
+import io
+import re
+import csv
+import json
+import math
+import datetime
+from decimal import Decimal
+
+SQL_FORMATS = ["markdown", "csv", "columnar"]
+SEARCH_FORMATS = ["full", "compact"]
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENCODING = None
+
+
+def estimate_tokens(text):
+    """Token count of text (tiktoken if installed, else ~4 chars/token)."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def compact_value(value):
+    """Shortest faithful rendering of one cell (None stays None)."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (float, Decimal)):
+        number = float(value)
+        if number.is_integer() and abs(number) < 1e15:
+            return int(number)
+        return float(f"{number:.6g}")
+    if isinstance(value, datetime.datetime):
+        if value.hour == value.minute == value.second == value.microsecond == 0:
+            return value.date().isoformat()
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(["" if v is None else v for v in (compact_value(x) for x in row)])
+    return buffer.getvalue().rstrip("\n")
+
+
+def encode_columnar(columns, rows):
+    """Columnar JSON with per-column dedup of repeated values."""
+    encoded = {}
+    for index, name in enumerate(columns):
+        values = [compact_value(row[index]) for row in rows]
+        distinct = list(dict.fromkeys(values))
+        if len(rows) > 1 and len(distinct) == 1:
+            encoded[name] = {"const": distinct[0]}
+        elif len(rows) >= 4 and len(distinct) <= len(rows) // 2:
+            codes = {value: code for code, value in enumerate(distinct)}
+            encoded[name] = {"dict": distinct, "codes": [codes[v] for v in values]}
+        else:
+            encoded[name] = values
+    return json.dumps({"rows": len(rows), "columns": encoded}, separators=(",", ":"), default=str)
+
+
+def fit_to_budget(render, count, token_budget):
+    """Largest k <= count whose render(k) fits the budget; returns (text, k).
+
+    At least one item is always kept so the model sees the shape of the data.
+    """
+    text = render(count)
+    if not token_budget or count <= 1 or estimate_tokens(text) <= token_budget:
+        return text, count
+    low, high = 1, count - 1
+    best = render(1), 1
+    while low <= high:
+        mid = (low + high) // 2
+        candidate = render(mid)
+        if estimate_tokens(candidate) <= token_budget:
+            best = candidate, mid
+            low = mid + 1
+        else:
+            high = mid - 1
+    return best
+
+
+# ============================================================================
+# Search Results
+# ============================================================================
+
+def _search_full(results):
+    result_lines = []
+    for i, result in enumerate(results, 1):
+        result_lines.append(f"\n--- Result {i} ---")
+        result_lines.append(f"Source: {result.get('source', 'Unknown')} (Page {result.get('page_number', '?')})")
+        result_lines.append(f"Title: {result.get('title', 'Unknown')}")
+        result_lines.append(f"Content: {result.get('content', '')[:500]}...")
+    return "\n".join(result_lines)
+
+
+def _search_compact(results, snippet_chars=300):
+    lines = []
+    for i, result in enumerate(results, 1):
+        content = re.sub(r"\s+", " ", result.get("content", "")).strip()
+        if len(content) > snippet_chars:
+            content = content[:snippet_chars].rsplit(" ", 1)[0] + "..."
+        lines.append(f"[{i}] {result.get('source', '?')} p.{result.get('page_number', '?')} | "
+                     f"{result.get('title', '')} | {content}")
+    return "\n".join(lines)
+
+
+def format_search_results(results, fmt="full", token_budget=None):
+    """Render search hits for the agent in the chosen format and budget."""
+    if not results:
+        return "No documents found matching the query."
+    render = _search_compact if fmt == "compact" else _search_full
+    text, shown = fit_to_budget(lambda k: render(results[:k]), len(results), token_budget)
+    if shown < len(results):
+        text += f"\n({len(results) - shown} more results omitted to fit the token budget)"
+    return text
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def benchmark_queries(ontology):
+    """A few representative queries per table from the ontology."""
+    queries = []
+    for table, info in ontology.get("tables", {}).items():
+        queries.append(f"SELECT * FROM {table}")
+        text_columns = [c for c in info.get("columns", []) if info.get("types", {}).get(c) == "String"
+                        and c != info.get("key")]
+        if text_columns:
+            column = text_columns[0]
+            queries.append(f"SELECT {column}, COUNT(*) AS n FROM {table} GROUP BY {column}")
+    return queries
+
+
+if __name__ == "__main__":
+    import os
+    import argparse
+    import statistics
+
+    from offline_sql import OfflineDatabase
+    from sql_utils import format_result
+
+    p = argparse.ArgumentParser(description="Compare tool output encodings by token count")
+    p.add_argument("--data-folder", default=os.getenv("DATA_FOLDER", "data/default"))
+    p.add_argument("--max-rows", type=int, default=50)
+    p.add_argument("--token-budget", type=int, default=0)
+    args = p.parse_args()
+
+    db = OfflineDatabase(os.path.abspath(args.data_folder))
+    conn = db.connect()
+    counter = "tiktoken o200k_base" if _ENCODING is not None else "~4 chars/token estimate"
+    print(f"Token counts ({counter}), max {args.max_rows} rows per query\n")
+    print(f"  {'query':<60}" + "".join(f"{fmt:>11}" for fmt in SQL_FORMATS))
+    totals = {fmt: [] for fmt in SQL_FORMATS}
+    for query in benchmark_queries(db.ontology):
+        cursor = conn.cursor()
+        cursor.execute(query)
+        columns = [c[0] for c in cursor.description]
+        rows = cursor.fetchmany(args.max_rows + 1)
+        truncated = len(rows) > args.max_rows
+        rows = rows[:args.max_rows]
+        counts = {}
+        for fmt in SQL_FORMATS:
+            text = format_result(columns, rows, None, truncated, fmt, args.token_budget or None)
+            counts[fmt] = estimate_tokens(text)
+            totals[fmt].append(counts[fmt])
+        print(f"  {query[:58]:<60}" + "".join(f"{counts[fmt]:>11}" for fmt in SQL_FORMATS))
+    print(f"\n  {'mean':<60}" + "".join(f"{statistics.mean(totals[fmt]):>11.0f}" for fmt in SQL_FORMATS))
+    base = sum(totals["markdown"]) or 1
+    print(f"  {'vs markdown':<60}" + "".join(f"{sum(totals[fmt]) / base:>10.0%} " for fmt in SQL_FORMATS))
+    conn.close()
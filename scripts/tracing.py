@@ -0,0 +1,217 @@
+"""
+Lightweight tracing for the agent loop.
+
+Nested spans (user turn -> responses.create / tool dispatch -> SQL connect,
+execute, fetch / search request, format) with attributes such as rows, bytes
+and tokens. Finished traces are appended to a file as OpenTelemetry OTLP/JSON
+(one ExportTraceServiceRequest per line, the format of the OTel file
+exporter), and print_trace_summary() shows where the time of a turn went.
+
+Tracing is off until enable_tracing() is called; span() is then a cheap no-op.
+
+Usage:
+    from tracing import enable_tracing, span
+
+    enable_tracing("traces.jsonl")
+    with span("chat.turn", question=text) as turn:
+        with span("sql.execute") as s:
+            ...
+            s.set_attribute("rows", len(rows))
+"""
+
+import os
+import json
+import time
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+
+SERVICE_NAME = "foundry-agent-chat"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation; children share the root's trace id."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attributes",
+                 "start_ns", "end_ns", "status", "children")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = None
+        self.children = []
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, amount=1):
+        """Increment a numeric attribute (e.g. tokens summed over calls)."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+
+class _NoopSpan:
+    """Returned by span() while tracing is disabled."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """Collects finished root spans and exports them as OTLP/JSON lines."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.finished = []
+
+    def finish_root(self, root):
+        with self._lock:
+            self.finished.append(root)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(to_otlp(root)) + "\n")
+
+
+_tracer = None
+
+
+def enable_tracing(path=None):
+    """Turn tracing on; finished turns are appended to `path` if given."""
+    global _tracer
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def current_span():
+    """The innermost open span in this context (None if none/disabled)."""
+    return _current_span.get() if _tracer else None
+
+
+@contextmanager
+def span(name, **attributes):
+    """Open a child of the current span (or a new trace root)."""
+    if _tracer is None:
+        yield _NOOP
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent, attributes)
+    if parent:
+        parent.children.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        if parent is None:
+            _tracer.finish_root(current)
+
+
+def run_in_context(fn, *args, **kwargs):
+    """Bind fn to the current span context, for use with thread pools.
+
+    ThreadPoolExecutor does not carry contextvars into worker threads, so
+    tools submitted from a turn would otherwise start new traces.
+    """
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(fn, *args, **kwargs)
+
+
+# ============================================================================
+# Export
+# ============================================================================
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _walk(root):
+    yield root
+    for child in root.children:
+        yield from _walk(child)
+
+
+def to_otlp(root):
+    """Convert a finished trace to an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in _walk(root):
+        item = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or s.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.status} if s.status else {"code": 1},
+        }
+        if s.parent:
+            item["parentSpanId"] = s.parent.span_id
+        spans.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+        }]
+    }
+
+
+def print_trace_summary(root, min_ms=0.0):
+    """Print a trace as an indented tree with durations and attributes."""
+    if root is None or isinstance(root, _NoopSpan):
+        return
+    total = root.duration_ms or 1.0
+
+    def show(s, depth):
+        if depth and s.duration_ms < min_ms:
+            return
+        attrs = " ".join(f"{k}={v}" for k, v in s.attributes.items() if not isinstance(v, str) or len(v) <= 40)
+        share = s.duration_ms / total * 100
+        label = f"{'  ' * depth}{s.name}"
+        print(f"  {label:<36}{s.duration_ms:>9.1f} ms {share:>5.1f}%  {attrs}".rstrip())
+        for child in sorted(s.children, key=lambda c: c.start_ns):
+            show(child, depth + 1)
+
+    print(f"\n  [Trace] {root.trace_id}")
+    show(root, 0)
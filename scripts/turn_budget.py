@@ -0,0 +1,138 @@
+"""
+Per-turn deadline and tool-round budget for the agent loop.
+
+Without limits a turn can run for minutes: a model stuck calling tools again
+and again, or a slow SQL endpoint, holds the user (and a worker) hostage.
+A TurnBudget gives every turn:
+
+    - a deadline (--turn-deadline seconds) that downstream calls read via
+      time_left(): the ODBC query timeout, the search request timeout, the
+      LLM request timeout and the wait for tool results
+    - a maximum number of tool rounds (--max-tool-rounds)
+
+When either runs out, the agent gets one last request without tools and a
+note to answer from what it already has (a reserve at the end of the
+deadline is kept for it). If even that fails, the text produced so far is
+returned with a note that the answer is partial. Deadline misses, early
+stops and partial answers are counted, so the latency SLO can be checked.
+
+Used by 08_test_foundry_agent.py and agent_gateway.py (through agent_loop.py):
+    python 08_test_foundry_agent.py --turn-deadline 30 --max-tool-rounds 6
+"""
+
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Turn state of the running chat turn; carried into tool threads by
+# tracing.run_in_context()
+_current = contextvars.ContextVar("turn_budget", default=None)
+
+FINAL_ANSWER_NOTE = (
+    "The time or tool budget for this question is used up. Do not call any more tools: "
+    "answer now from the results you already have, and say briefly what could not be checked."
+)
+PARTIAL_NOTE = "(Stopped at this question's time limit - the answer may be incomplete.)"
+
+
+class TurnState:
+    """Deadline and progress of one turn."""
+
+    def __init__(self, deadline_seconds, reserve_seconds):
+        self.started = time.monotonic()
+        self.end = self.started + deadline_seconds if deadline_seconds else None
+        # Tool rounds stop here so the final answer still fits before `end`
+        self.soft_end = self.end - reserve_seconds if self.end else None
+        self.rounds = 0
+        self.stopped = None   # "deadline" or "rounds" once the loop was cut short
+        self.partial = False
+
+    def remaining(self):
+        """Seconds until the deadline (None without one)."""
+        if self.end is None:
+            return None
+        return max(0.0, self.end - time.monotonic())
+
+    def expired(self):
+        return self.end is not None and time.monotonic() >= self.end
+
+
+def current_turn():
+    return _current.get()
+
+
+def time_left(floor=1.0):
+    """Timeout for a downstream call in the running turn, or None without a deadline.
+
+    Never below `floor` so a call made right at the deadline still gets a
+    chance to fail fast instead of with a zero timeout.
+    """
+    state = _current.get()
+    remaining = state.remaining() if state else None
+    return None if remaining is None else max(floor, remaining)
+
+
+def final_answer_item():
+    """Input item asking the model to answer without further tool calls."""
+    return {"type": "message", "role": "developer", "content": FINAL_ANSWER_NOTE}
+
+
+def partial_answer(text):
+    """The text produced so far, marked as incomplete."""
+    text = (text or "").strip()
+    if not text:
+        return f"I could not finish answering within the time limit. {PARTIAL_NOTE}"
+    return f"{text}\n\n{PARTIAL_NOTE}"
+
+
+class TurnBudget:
+    """Deadline and tool-round limits applied to every turn, with counters."""
+
+    def __init__(self, deadline_seconds=0, max_tool_rounds=0, reserve_fraction=0.2, max_reserve_seconds=10.0):
+        self.deadline_seconds = max(0.0, deadline_seconds or 0)
+        self.max_tool_rounds = max(0, max_tool_rounds or 0)
+        self.reserve_seconds = min(max_reserve_seconds, self.deadline_seconds * reserve_fraction)
+        self._lock = threading.Lock()
+        self.stats = {"turns": 0, "deadline_misses": 0, "stopped_deadline": 0, "stopped_rounds": 0,
+                      "partial_answers": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.deadline_seconds or self.max_tool_rounds)
+
+    @contextmanager
+    def turn(self):
+        """Scope of one user turn; yields its TurnState."""
+        state = TurnState(self.deadline_seconds, self.reserve_seconds)
+        token = _current.set(state)
+        try:
+            yield state
+        finally:
+            _current.reset(token)
+            with self._lock:
+                self.stats["turns"] += 1
+                if state.end is not None and time.monotonic() > state.end:
+                    self.stats["deadline_misses"] += 1
+                if state.stopped:
+                    self.stats[f"stopped_{state.stopped}"] += 1
+                if state.partial:
+                    self.stats["partial_answers"] += 1
+
+    def stop_reason(self, state):
+        """Why the loop must stop calling tools after the current round, or None."""
+        if state is None:
+            return None
+        if self.max_tool_rounds and state.rounds >= self.max_tool_rounds:
+            return "rounds"
+        if state.soft_end is not None and time.monotonic() >= state.soft_end:
+            return "deadline"
+        return None
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["deadline_s"] = self.deadline_seconds or None
+        stats["max_tool_rounds"] = self.max_tool_rounds or None
+        stats["miss_rate"] = round(stats["deadline_misses"] / stats["turns"], 3) if stats["turns"] else None
+        return stats
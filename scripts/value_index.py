@@ -0,0 +1,244 @@
+"""
+Categorical value index - entity linking without endpoint scans.
+
+Questions name values, not columns ("High impact outages", "ticket for
+OUT009"), and the agent maps them to columns with exploratory SELECT
+DISTINCT or LIKE '%...%' queries - each a full SQL endpoint round trip. The
+distinct values of every low-cardinality String column (at most
+MAX_DISTINCT_VALUES) are read once from tables/*.csv at load time and kept
+as one sorted array, so a lookup is a binary search:
+
+    exact     case-, whitespace- and punctuation-insensitive ("out-009")
+    prefix    "OUT00" -> OUT001 ... OUT009
+    fuzzy     close spellings (difflib, "out9" -> OUT009), then the words
+              of a longer phrase ("High impact" -> impact_level = 'High')
+
+The index is cached in data/<folder>/cache/value_index.json, rebuilt when the
+CSVs change or 03 bumps the data version (03 builds it after loading).
+
+Columns with a handful of values are also listed in the schema prompt
+(VALUES section, written by 04); the rest are reached through the
+lookup_values tool, answered locally by 08.
+
+Used by 03_load_fabric_data.py, 04_generate_agent_prompt.py and
+08_test_foundry_agent.py. The lookup_values tool is added to the agent with:
+    python 07_create_foundry_agent.py --value-lookup
+Look values up on their own:
+    python value_index.py --data-folder data/default "high" "out9" "OUT00"
+"""
+
+import os
+import re
+import csv
+import json
+import time
+import bisect
+import difflib
+import threading
+
+from offline_sql import _data_paths
+from answer_cache import cache_dir, read_data_version
+from schema_metadata import TOP_VALUES_MAX, _csv_signature
+
+INDEX_FILENAME = "value_index.json"
+MAX_DISTINCT_VALUES = 1000  # Columns with more distinct values are not categorical
+MAX_MATCHES = 5  # Matches returned per term
+FUZZY_CUTOFF = 0.75
+
+LOOKUP_VALUES_PARAMETERS = {
+    "type": "object",
+    "properties": {
+        "terms": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Values as the user wrote them, e.g. [\"high impact\", \"OUT009\"]."
+        }
+    },
+    "required": ["terms"],
+    "additionalProperties": False
+}
+
+LOOKUP_VALUES_DESCRIPTION = (
+    "Find which table column holds a value the user mentioned and its exact spelling "
+    "(case-insensitive, prefix and fuzzy matching over categorical columns). Instant and "
+    "free - use it instead of SELECT DISTINCT or LIKE queries to resolve names and codes."
+)
+
+
+def normalize(text):
+    """Case- and whitespace-insensitive form of a value."""
+    return " ".join(str(text).casefold().split())
+
+
+def compact(text):
+    """normalize() without punctuation or spaces ("OUT-009" == "out009")."""
+    return re.sub(r"[\W_]+", "", str(text).casefold())
+
+
+# ============================================================================
+# Index Build
+# ============================================================================
+
+def build_value_index(tables, tables_dir):
+    """{"table.column": [[value, rows], ...]} for the categorical String columns."""
+    columns = {}
+    for table, info in tables.items():
+        path = os.path.join(tables_dir, f"{table}.csv")
+        if not os.path.exists(path):
+            continue
+        names = [c["name"] for c in info["columns"] if c.get("type", "String") == "String"]
+        counts = {name: {} for name in names}
+        with open(path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                for name in names:
+                    value = record.get(name)
+                    if value not in (None, "") and len(counts[name]) <= MAX_DISTINCT_VALUES:
+                        counts[name][value] = counts[name].get(value, 0) + 1
+        for name in names:
+            if 0 < len(counts[name]) <= MAX_DISTINCT_VALUES:
+                columns[f"{table}.{name}"] = sorted(counts[name].items(), key=lambda item: (-item[1], item[0]))
+    return columns
+
+
+def load_value_index(data_dir, tables):
+    """Cached index, rebuilt when the CSVs or data version change."""
+    _, tables_dir = _data_paths(data_dir)
+    signature = {"csv": _csv_signature(tables, tables_dir), "data_version": read_data_version(data_dir)}
+    path = os.path.join(cache_dir(data_dir), INDEX_FILENAME)
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("signature") == signature:
+                return cached["columns"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    columns = build_value_index(tables, tables_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"signature": signature, "columns": columns}, f)
+    return json.loads(json.dumps(columns))
+
+
+# ============================================================================
+# Lookup
+# ============================================================================
+
+class ValueIndex:
+    """Sorted array of (normalized value, column, value, rows) with exact/prefix/fuzzy lookup."""
+
+    def __init__(self, columns):
+        self.columns = columns  # "table.column" -> [[value, rows], ...] (most common first)
+        entries = sorted((normalize(value), column, value, rows)
+                         for column, values in columns.items() for value, rows in values)
+        self._keys = [entry[0] for entry in entries]
+        self._entries = entries
+        compacted = sorted((compact(value), i) for i, (_, _, value, _) in enumerate(entries))
+        self._compact_keys = [key for key, _ in compacted]
+        self._compact_positions = [i for _, i in compacted]
+        self._distinct = sorted(set(self._compact_keys))  # difflib candidates
+        self._lock = threading.Lock()
+        self.counters = {"lookups": 0, "exact": 0, "prefix": 0, "fuzzy": 0, "misses": 0, "served_ms": 0.0}
+
+    @classmethod
+    def load(cls, data_dir):
+        """Index for the tables in config/schema.json."""
+        config_dir, _ = _data_paths(data_dir)
+        with open(os.path.join(config_dir, "schema.json"), encoding="utf-8") as f:
+            tables = json.load(f).get("tables", {})
+        return cls(load_value_index(data_dir, tables))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _equal(self, keys, key):
+        start = bisect.bisect_left(keys, key)
+        end = bisect.bisect_right(keys, key, start)
+        return range(start, end)
+
+    def match(self, term, limit=MAX_MATCHES):
+        """(kind, [(column, value, rows), ...]) for one term; kind is None when nothing matched."""
+        key = normalize(term)
+        if not key:
+            return None, []
+        hits = [self._entries[i] for i in self._equal(self._keys, key)]
+        if not hits and compact(key):
+            hits = [self._entries[self._compact_positions[i]]
+                    for i in self._equal(self._compact_keys, compact(key))]
+        if hits:
+            return "exact", self._rank(hits, limit)
+
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_left(self._keys, key + "\uffff", start)
+        if end > start:
+            return "prefix", self._rank(self._entries[start:end], limit)
+
+        close = difflib.get_close_matches(compact(key), self._distinct, n=limit, cutoff=FUZZY_CUTOFF)
+        if not close and " " in key:
+            # A phrase around a value ("high impact"): try its words
+            close = [compact(word) for word in key.split() if self._equal(self._compact_keys, compact(word))]
+        # Closest spelling first, then the most common column for it
+        hits = [hit for near in close for hit in self._rank(
+            [self._entries[self._compact_positions[i]] for i in self._equal(self._compact_keys, near)], limit)]
+        return ("fuzzy", hits[:limit]) if hits else (None, [])
+
+    @staticmethod
+    def _rank(entries, limit):
+        ranked = sorted(entries, key=lambda entry: (-entry[3], entry[1], entry[2]))
+        return [(column, value, rows) for _, column, value, rows in ranked[:limit]]
+
+    def lookup(self, terms):
+        """Text answer for the lookup_values tool."""
+        started = time.perf_counter()
+        lines, kinds = [], []
+        for term in terms or []:
+            kind, hits = self.match(term)
+            kinds.append(kind or "misses")
+            if not hits:
+                lines.append(f"'{term}': no categorical value matches - it may be free text, "
+                             "a number or a date (filter that column directly)")
+                continue
+            label = "" if kind == "exact" else f" ({kind} match)"
+            found = "; ".join(f"{column} = '{value}' ({rows:,} rows)" for column, value, rows in hits)
+            lines.append(f"'{term}'{label}: {found}")
+        with self._lock:
+            self.counters["lookups"] += len(kinds)
+            for kind in kinds:
+                self.counters[kind] += 1
+            self.counters["served_ms"] += (time.perf_counter() - started) * 1000
+        return "\n".join(lines) or "No terms given."
+
+    def prompt_lines(self, max_values=TOP_VALUES_MAX):
+        """VALUES section of the schema prompt: columns with at most `max_values` values."""
+        lines = [f"  {column}: {'|'.join(value for value, _ in values)}"
+                 for column, values in self.columns.items() if len(values) <= max_values]
+        if not lines:
+            return []
+        return ["VALUES (every value of these columns):"] + lines
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["served_ms"] = round(stats["served_ms"], 2)
+        stats["columns"] = len(self.columns)
+        stats["values"] = len(self._entries)
+        return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    p = argparse.ArgumentParser(description="Look values up in the categorical value index")
+    p.add_argument("--data-folder", default=os.getenv("DATA_FOLDER", "data/default"))
+    p.add_argument("terms", nargs="*")
+    args = p.parse_args()
+
+    start = time.perf_counter()
+    index = ValueIndex.load(os.path.abspath(args.data_folder))
+    print(f"{len(index):,} values in {len(index.columns)} columns "
+          f"(loaded in {(time.perf_counter() - start) * 1000:.1f} ms)")
+    if args.terms:
+        print(index.lookup(args.terms))
+    else:
+        print("\n".join(index.prompt_lines()))